@@ -1,20 +1,107 @@
-from collections import defaultdict
-import re
-import requests
+from collections import defaultdict, namedtuple
 from datetime import datetime
-from dateutil.parser import parse
+from types import MappingProxyType
+from eolData import EOLDataLoader
+from scanRecords import report_languages
+from scanTrace import get_tracer
+from versionNormalizer import find_full_version, normalize_version
+
+# eol is the endoflife.date value (bool or parsed datetime), expired is eol evaluated against the scan day
+EOLCycle = namedtuple("EOLCycle", ["eol", "latest", "expired"])
+
+
+def normalize_cycle(cycle):
+    return str(cycle).strip().lower()
+
+
+def parse_eol_date(eol):
+    try:
+        return datetime.strptime(eol, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(eol)
+    except (TypeError, ValueError):
+        # dateutil is only loaded for the rare free-form dates
+        from dateutil.parser import parse
+        return parse(eol)
+
+
+def overall_upgrade(upgrades):
+    """
+    Upgrade Required ? of an image from the verdicts of its languages: an unevaluated language is not an all clear
+    """
+    if "Yes" in upgrades:
+        return "Yes"
+    if "Unknown" in upgrades:
+        return "Unknown"
+    return "No"
+
+
+class EOLIndex():
+    """
+    Immutable per-product lookup of the endoflife.date cycles, compiled once from the raw api data
+    """
+    def __init__(self, api_data, today):
+        products = {}
+        latest = {}
+        unknown = set()
+        for product, cycles in api_data.items():
+            if cycles is None:
+                unknown.add(product)
+                continue
+            compiled = {}
+            for cycle, details in cycles.items():
+                eol = details['eol']
+                if eol is not True and eol is not False:
+                    eol = parse_eol_date(eol)
+                    expired = eol < today
+                else:
+                    expired = eol
+                compiled[normalize_cycle(cycle)] = EOLCycle(eol, details.get('latest'), expired)
+            products[product] = MappingProxyType(compiled)
+            if len(cycles) > 0:
+                # endoflife.date lists the newest cycle first
+                first_cycle = next(iter(cycles))
+                latest[product] = cycles[first_cycle].get('latest') or first_cycle
+        self.products = MappingProxyType(products)
+        self.latest_versions = MappingProxyType(latest)
+        # products without data, their versions cannot be evaluated
+        self.unknown = frozenset(unknown)
+        self.empty = MappingProxyType({})
+
+    def cycles(self, product):
+        return self.products.get(product, self.empty)
+
+    def latest(self, product):
+        return self.latest_versions.get(product)
+
+    def lookup(self, product, cycle):
+        return self.products.get(product, self.empty).get(normalize_cycle(cycle))
 
 
 class EOLArtifacts():
-    def __init__(self, logger):
+    def __init__(self, logger, cache_dir=None, snapshot=None, ttl=24 * 3600):
         self.logger = logger
+        self.loader = EOLDataLoader(logger, cache_dir=cache_dir, snapshot=snapshot, ttl=ttl)
+        self.rawData = {}
         self.imagenames, self.baseoss, \
             self.python_langs, self.go_langs, self.php_langs, self.node_langs, self.ruby_langs, \
             self.java_langs, self.angular_langs, self.react_langs = [
             ], [], [], [], [], [], [], [], [], []
         self.eol_scan_results = {}
-        self.apiData = {}
         self.today = datetime.today()
+        self.apiData = {}
+
+    @property
+    def apiData(self):
+        return self._apiData
+
+    @apiData.setter
+    def apiData(self, api_data):
+        # Every assignment recompiles the lookup index used by parse_version
+        self._apiData = api_data
+        self.eolIndex = EOLIndex(api_data, self.today)
 
 
     # Function to get the eol data for all released versions of the below mentioned programming languages
@@ -22,12 +109,12 @@ class EOLArtifacts():
     def get_eol_data(self):
         self.logger.info("Getting EOL data from endoflife.date")
         apiData = defaultdict(dict)
-        url = "https://endoflife.date/api/"
-        products = ["go", "python", "node", "ruby", "react", "php",
-                    "kotlin", "java", "laravel", "jquery", "django", "angular"]
-        for i in products:
-            re = requests.get(url + i + ".json")
-            json_data = re.json()
+        with get_tracer().span(None, "eol-data"):
+            self.rawData = self.loader.load()
+        for i, json_data in self.rawData.items():
+            if json_data is None:
+                apiData[i] = None
+                continue
             apiData[i] = defaultdict(dict)
             for j in json_data:
                 apiData[i][j['cycle']] = {
@@ -36,100 +123,35 @@ class EOLArtifacts():
 
     # Function to parse the version and getting the eol status of that version
     def parse_version(self, version, lang):
-        try:
-            latest_version = self.apiData[lang][list(
-                self.apiData[lang].keys())[0]]['latest']
-        except:
-            latest_version = list(self.apiData[lang].keys())[0]
+        return self.evaluate_items([i.split('version: ')[1] for i in version.split(',')], lang)
+
+    # Function to get the eol status of "<version>(<source>)" items of one language
+    def evaluate_items(self, items, lang):
+        if lang in self.eolIndex.unknown:
+            return "Unknown", "EOL status not evaluated: the endoflife.date data of " + lang + " could not be loaded"
+        latest_version = self.eolIndex.latest(lang)
         affected_versions = []
         eol_ = False
         text = ""
-        version = version.split(',')
-        for i in version:
-            i = i.split('version: ')[1]
-            if lang == 'go':
-                v = re.findall("[0-9]+[.]+[0-9]*[0-9]", i)
-                if v == []:
-                    continue
-                v = v[0]
-                temp = v.split('.')[-1]
-                if int(temp) < 10:
-                    affected_versions.append(i)
-                    eol_ = True
-                    continue
-            if lang == 'python':
-                v = re.findall("[2-3]+[.]+[0-9]*[0-9]", i)
-                if v == []:
-                    continue
-                v = v[0]
-            if lang == "node":
-                v = re.findall("[0-9]*[0-9]+[.]+[0-9]*[0-9]", i)
-                if v == []:
-                    continue
-                v = v[0]
-                v = v.split(".")[0]
-            if lang == "php":
-                v = re.findall("[0-9]*[0-9]+[.]+[0-9]*[0-9]", i)
-                if v == []:
-                    continue
-                v = v[0]
-            if lang == "angular":
-                v = re.findall(
-                    "[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]", i)
-                if v == []:
-                    continue
-                v = v[0].split(".")
-                v = v[0]
-                if int(v) < int('9'):
-                    affected_versions.append(i)
-                    eol_ = True
-                    continue
-            if lang == "react":
-                v = re.findall(
-                    "[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]", i)
-                if v == []:
-                    continue
-                v = v[0].split(".")
-                v = v[0]
-                if int(v) < int('17'):
-                    affected_versions.append(i)
-                    eol_ = True
-                    continue
-            if lang == "ruby":
-                v = re.findall(
-                    "[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]", i)
-                if v == []:
-                    continue
-                v = v[0]
-                v = v.split(".")
-                v = v[0]+"."+v[1]
-            if lang == "java":
-                v = re.findall(
-                    "[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]", i)
-                if v == []:
-                    continue
-                v = v[0]
-                v = v.split(".")
-                if v[0] == "1":
-                    v = v[1]
-                    if int(v) < int('6'):
-                        affected_versions.append(i)
-                        eol_ = True
-                        continue
-                else:
-                    v = v[0]
-                
-
-            if v in self.apiData[lang].keys():
-                eol = self.apiData[lang][v]['eol']
-                if eol != True and eol != False:
-                    date = parse(eol)
-                    eol = date < self.today
-                eol_ = eol_ or eol
-                if eol:
-                    affected_versions.append(i)
-            else:
+        for i in items:
+            normalized = normalize_version(lang, i)
+            if normalized is None:
+                continue
+            # Versions older than the oldest cycle listed by endoflife.date are eol without a lookup
+            if (lang == 'go' and normalized.minor < 10) or \
+                    (lang == 'angular' and normalized.major < 9) or \
+                    (lang == 'react' and normalized.major < 17) or \
+                    (lang == 'java' and normalized.major == 1 and normalized.minor < 6):
+                affected_versions.append(i)
+                eol_ = True
+                continue
+
+            cycle = self.eolIndex.lookup(lang, normalized.cycle)
+            if cycle is None:
                 continue
+            eol_ = eol_ or cycle.expired
+            if cycle.expired:
+                affected_versions.append(i)
         text = "Affected Versions: " + \
             "; ".join(affected_versions) + " \n" + \
             "Latest Version: " + str(latest_version)
@@ -142,18 +164,21 @@ class EOLArtifacts():
         versions = version.split(",")
         formatted_versions = []
         for i in versions:
-            i = i.split('version: ')
-            v = re.findall("[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]", i[1])
-            if v == []:
+            item = self.reformat_java_item(i.split('version: ')[1])
+            if item is None:
                 continue
-            v = v[0].split(".")
-            if v[0] == "1":
-                version_ = "version: " + ".".join(v[1:]) + f"({i[1]})" 
-            else:
-                version_ = "version: " + i[1]
-            formatted_versions.append(version_)
+            formatted_versions.append("version: " + item)
         return ",".join(formatted_versions)
 
+    def reformat_java_item(self, item):
+        v = find_full_version(item)
+        if v is None:
+            return None
+        v = v.split(".")
+        if v[0] == "1":
+            return ".".join(v[1:]) + f"({item})"
+        return item
+
     def add_eol_columns(self, data):
         self.logger.info("Verifying the version eol status and updating the data")
         languages = ["Python", "Go", "Php", "Node", "Ruby",
@@ -177,14 +202,8 @@ class EOLArtifacts():
             eol_upgrade_details[i + " - Eol Details"] = eol_details
             eol_upgrade_details[i + " - Upgrade Required?"] = upgrade_req
 
-        bool_dict = {"No": False, "Yes": True, "": False}
-
         for i in range(len(data["Python"])):
-            temp = False
-            for j in languages:
-                temp = temp or bool_dict[eol_upgrade_details[j +
-                                                             " - Upgrade Required?"][i]]
-            upgrade_overall.append("Yes" if temp == True else "No")
+            upgrade_overall.append(overall_upgrade([eol_upgrade_details[j + " - Upgrade Required?"][i] for j in languages]))
 
         final_data = {
             'Image name': data['Image name'], 'Base OS': data['Base OS'],
@@ -200,3 +219,34 @@ class EOLArtifacts():
             "Upgrade Required ?": upgrade_overall
         }
         return final_data
+
+    def add_eol_status(self, image_records):
+        """
+        Evaluate the typed image records and return one report row per image
+        """
+        self.logger.info("Verifying the version eol status of " + str(len(image_records)) + " images")
+        return [self.evaluate_record(record) for record in image_records]
+
+    def evaluate_record(self, record):
+        """
+        Report row of one image record, columns in the order of report_columns
+        """
+        row = {'Image name': record.image, 'Base OS': record.os_name}
+        upgrades = []
+        for language in report_languages:
+            lang = language.lower()
+            items = record.items(lang)
+            if lang == "java":
+                items = [item for item in map(self.reformat_java_item, items) if item is not None]
+            if len(items) > 0:
+                upgrade, eol = self.evaluate_items(items, lang)
+                if upgrade == "No":
+                    eol = ""
+            else:
+                upgrade, eol = "", ""
+            row[language] = ",".join("version: " + item for item in items) if len(items) > 0 else " "
+            row[language + " - Upgrade Required?"] = upgrade
+            row[language + " - Eol Details"] = eol
+            upgrades.append(upgrade)
+        row["Upgrade Required ?"] = overall_upgrade(upgrades)
+        return row
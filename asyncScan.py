@@ -0,0 +1,168 @@
+import asyncio
+import time
+from commandExecutor import TimedOutProcess
+from dockerBackend import DockerCliBackend, container_name
+from probeSession import ProbeSession
+from scanImage import ImageScanner
+
+
+class AsyncImageScanner(ImageScanner):
+    """
+    Container scan whose independent stages run at the same time on an asyncio loop:
+    syft, the os-release -> package manager chain and the language probes
+    """
+    async def arun_command(self, command, stage="run"):
+        """
+        Run an external command without blocking the loop, holding the concurrency slot of its stage when one is configured
+        """
+        with self.tracer.span(self.image_to_scan, stage, kind="command", command=" ".join(command)) as span:
+            limit = self.limits.get(stage)
+            waiting = time.perf_counter()
+            # the limits are threading semaphores shared with the other images of a batch
+            if not await asyncio.to_thread(self.acquire_slot, limit, stage):
+                process = TimedOutProcess(command, 0, skipped=True)
+            else:
+                try:
+                    if limit is not None:
+                        span["wait"] = time.perf_counter() - waiting
+                    timeout = self.command_timeout(stage)
+                    if timeout is not None and timeout <= 0:
+                        process = TimedOutProcess(command, 0, skipped=True)
+                    else:
+                        process = await self.executor.arun(command, timeout)
+                finally:
+                    if limit is not None:
+                        limit.release()
+            self.record_command(span, process, len(process.stdout or b""))
+            return process
+
+    async def arun_in_image(self, entrypoint, arguments, mount=False):
+        if not isinstance(self.docker, DockerCliBackend):
+            # the Engine API backend blocks on its socket, it runs in a worker thread instead of a subprocess
+            return await asyncio.to_thread(self.run_in_image, entrypoint, arguments, mount)
+        if self.probe is not None and self.probe.active:
+            return await self.arun_command(self.docker.exec_argv(self.probe.container_id, entrypoint, arguments), "run")
+        name = container_name()
+        process = await self.arun_command(self.docker.run_argv(self.image_to_scan, entrypoint, arguments, mount, name), "run")
+        if isinstance(process, TimedOutProcess) and not process.skipped:
+            # killing the docker client leaves the container running
+            await asyncio.to_thread(self.docker.remove_container, name)
+        return process
+
+    async def aget_os_name(self, syft_task):
+        try:
+            general_command_out = self.parse_os_release(await self.arun_in_image("cat", ["/etc/os-release"]))
+        except Exception as e:
+            return {'name': "NA - Tool(Syft and linux cmd) failed to find os"}
+        if general_command_out is None or len(general_command_out) == 0 or self.format_os_name(general_command_out) is None:
+            # the os name falls back to the syft distro, wait for the syft run instead of starting a second one
+            sbom, = await asyncio.gather(syft_task, return_exceptions=True)
+            if isinstance(sbom, BaseException) and not self.sbom_error:
+                # keep the error of the failed run so that the fallback does not run syft again on the event loop
+                self.sbom_error = str(sbom) or type(sbom).__name__
+        return self.os_name_from_release(general_command_out)
+
+    async def aget_languages_by_os(self, os_name):
+        try:
+            command_to_execute = self.package_manager_command(os_name["name"] if "name" in os_name else None)
+            if command_to_execute is None:
+                return []
+            return self.parse_package_list(await self.arun_in_image(command_to_execute[0], command_to_execute[1:]))
+        except Exception as e:
+            return []
+
+    async def aget_os_and_languages(self, syft_task):
+        chain, shared = await asyncio.to_thread(self.lookup_base_chain)
+        if shared is not None:
+            return shared["os"], shared["languages"]
+        os_name, languages = {}, []
+        try:
+            with self.stage("os-name"):
+                os_name = await self.aget_os_name(syft_task)
+            with self.stage("os-packages"):
+                languages = await self.aget_languages_by_os(os_name)
+        finally:
+            self.release_base_chain(chain, os_name, languages)
+        return os_name, languages
+
+    async def arun_language_version(self, language):
+        try:
+            entrypoint, arguments = self.language_version_command(language)
+            return language, self.parse_language_version(language, await self.arun_in_image(entrypoint, arguments))
+        except Exception as e:
+            self.logger.info("Exception while running individual command "+ str(e))
+            return language, None
+
+    async def arun_individual_language_command(self):
+        with self.stage("language-probe"):
+            return await self.arun_language_probe()
+
+    async def arun_language_probe(self):
+        self.logger.info("Going to run bash script for individual commands for the image : "+ self.image_to_scan)
+        resultant_data = {}
+        try:
+            process = await self.arun_in_image("sh", ["/eol-mount/utils/run_individual_commands.sh"], mount=True)
+            if process.returncode == 0:
+                resultant_data, remaining_languages = self.parse_language_script(process)
+                # the fallback probes of every language are independent of each other
+                versions = await asyncio.gather(*[self.arun_language_version(language) for language in remaining_languages])
+                for language, version in versions:
+                    if version is not None:
+                        resultant_data[language] = version
+        except Exception as e:
+            self.logger.info("Exception while running bash script command "+ str(e))
+        return resultant_data
+
+    async def ascan(self, syft_path):
+        result_os_images = {}
+        scan_image_details = {}
+        result_data_languages_os = []
+        result_data_languages_specific = {}
+        syft_results = [None] * 8
+        # syft only needs the image, so it starts before the probe container is up
+        syft_task = asyncio.ensure_future(asyncio.to_thread(self.get_sbom))
+        try:
+            if self.use_probe_session:
+                self.probe = ProbeSession(self.image_to_scan, self.logger, self.docker)
+                with self.stage("probe-start"):
+                    await asyncio.to_thread(self.probe.start)
+
+            (os_name, result_data_languages_os), result_data_languages_specific = await asyncio.gather(
+                self.aget_os_and_languages(syft_task), self.arun_individual_language_command())
+            scan_image_details["os"] = os_name
+
+            await syft_task
+            with self.stage("executables"):
+                syft_results = self.run_syft_to_get_binaries(syft_path)
+            self.fill_scan_details(scan_image_details, result_data_languages_os, result_data_languages_specific, syft_results)
+            result_os_images[self.image_to_scan] = {'scan_details': scan_image_details}
+        except Exception as e:
+            self.logger.info("Exception while getting scan image data " + str(e))
+            if not syft_task.done():
+                await asyncio.gather(syft_task, return_exceptions=True)
+
+            prepare_data = {}
+            prepare_data["languages"] = result_data_languages_os
+            prepare_data["languages-specific"] = result_data_languages_specific
+            prepare_data["languages-syft"] = [syft_results[0], syft_results[2], syft_results[4], syft_results[6]]
+            prepare_data["languages-syft-go-paths"] = syft_results[1]
+            prepare_data["languages-syft-java-paths"] = syft_results[3]
+            prepare_data["languages-syft-angular-paths"] = syft_results[5]
+            prepare_data["languages-syft-react-paths"] = syft_results[7]
+
+            result_os_images[self.image_to_scan] = {"scan_details": prepare_data}
+        result_os_images[self.image_to_scan]["scan_details"]["stages"] = self.stage_results()
+        return result_os_images
+
+    def get_scan_image(self, syft_path="utils/syft.template.yml"):
+        self.logger.info("Going to process the image "+ self.image_to_scan)
+        self.syft_path = syft_path
+        self.start_deadline()
+        try:
+            result_os_images = asyncio.run(self.ascan(syft_path))
+        finally:
+            if self.probe is not None:
+                self.probe.stop()
+                self.probe = None
+        self.cleanup_image()
+        return result_os_images
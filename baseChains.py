@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from singleFlight import SingleFlight
+
+# Build steps that may change the os release or the package database of the layers below them: package manager runs,
+# writes to the package database paths, and root filesystems added or copied in
+package_touch_pattern = re.compile(r"\b(?:apt|apt-get|aptitude|dpkg|apk|yum|dnf|microdnf|tdnf|rpm|zypper)\b|os-release|/var/lib/(?:dpkg|rpm)|/lib/apk"
+                                   r"|^(?:ADD|COPY)\b.*\s/(?:etc/\S*)?\s*(?:# buildkit)?$")
+
+# Dockerfile instructions that only change the image config; they add a history entry but no layer
+metadata_instructions = {"ENV", "LABEL", "CMD", "ENTRYPOINT", "EXPOSE", "USER", "ARG", "VOLUME", "STOPSIGNAL", "HEALTHCHECK",
+                         "SHELL", "ONBUILD", "MAINTAINER", "WORKDIR"}
+
+
+def build_step(created_by):
+    """
+    Dockerfile step of a history entry, without the shell prefix of the classic builder
+    """
+    step = created_by.strip()
+    if step.startswith("/bin/sh -c #(nop)"):
+        return step[len("/bin/sh -c #(nop)"):].strip()
+    if step.startswith("/bin/sh -c "):
+        return "RUN " + step[len("/bin/sh -c "):]
+    return step
+
+
+def layer_steps(layers, history):
+    """
+    Build step of every layer, from the history entries (size, created_by) oldest first; None when the history cannot
+    be lined up with the layers
+    """
+    steps = [build_step(created_by) for _, created_by in history]
+    candidates = [
+        [step for (size, _), step in zip(history, steps) if size != 0 or step.split(" ", 1)[0].upper() not in metadata_instructions],
+        [step for (size, _), step in zip(history, steps) if size != 0],
+    ]
+    for candidate in candidates:
+        if len(candidate) == len(layers):
+            return candidate
+    return None
+
+
+def base_chain(layers, history):
+    """
+    Lower layers that hold the os release and the package database of the image: up to the last layer whose build step
+    may touch them, or every layer when the history does not tell
+    """
+    steps = layer_steps(layers, history)
+    if steps is None:
+        return list(layers)
+    last = 0
+    for index, step in enumerate(steps):
+        # steps without a recorded command (other image builders) may touch anything
+        if step == "" or package_touch_pattern.search(step):
+            last = index
+    return list(layers[:last + 1])
+
+
+def chain_id(layers):
+    return "sha256:" + hashlib.sha256("\n".join(layers).encode()).hexdigest()
+
+
+class BaseChainIndex:
+    """
+    OS name and package manager inventory per base layer chain, shared by the images built on the same base.
+    One scanner per chain runs the OS half of the scan, the others of the same process wait for its result.
+    """
+    def __init__(self, logger, cache_dir=None):
+        self.logger = logger
+        path = ":memory:"
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, "base-chains.sqlite")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            if cache_dir is not None:
+                self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS chains (chain TEXT PRIMARY KEY, image TEXT, os TEXT, packages TEXT, "
+                                    "created REAL, last_used REAL, uses INTEGER)")
+        self.scans = SingleFlight(self.lock)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, chain):
+        with self.connection:
+            row = self.connection.execute("SELECT os, packages FROM chains WHERE chain = ?", (chain,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE chains SET last_used = ?, uses = uses + 1 WHERE chain = ?", (time.time(), chain))
+        return {"os": json.loads(row[0]), "languages": json.loads(row[1])}
+
+    def acquire(self, chain, image, timeout=None):
+        """
+        Shared OS scan of the chain, waiting while another image of this process scans it. None makes the image the
+        scanner of the chain, which must release it afterwards.
+        """
+        shared = self.scans.acquire(chain, image, lambda: self.lookup(chain), timeout)
+        with self.lock:
+            if shared is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return shared
+
+    def release(self, chain, image, shared=None):
+        """
+        Store the OS scan of the chain when it completed, and let the images waiting for it go on
+        """
+        def store():
+            now = time.time()
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO chains (chain, image, os, packages, created, last_used, uses) "
+                                        "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                                        (chain, image, json.dumps(shared["os"]), json.dumps(shared["languages"]), now, now))
+
+        self.scans.release(chain, image, store if shared is not None else None)
+
+    def stats(self):
+        with self.lock:
+            chains = self.connection.execute("SELECT COUNT(*) FROM chains").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "chains": chains}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
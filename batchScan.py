@@ -0,0 +1,168 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dockerBackend import DockerCliBackend
+from scanImage import ImageScanner
+from scanTrace import get_tracer
+
+
+class BatchScanner:
+    def __init__(self, logger, workers=4, pull_limit=2, run_limit=4, syft_limit=2, syft_path="utils/syft.template.yml", backend="container", sbom_dir=None, scan_cache=None, engine="sync", docker="cli", docker_socket=None, prefetch=0, disk_budget=None, insecure_registries=(), layer_cache=None, json_dir=None, stage_timeouts=None, image_timeout=None, base_chains=None, resolve_digests=False):
+        self.logger = logger
+        self.scan_cache = scan_cache
+        self.sbom_dir = sbom_dir
+        self.backend = backend
+        self.engine = engine
+        self.workers = workers
+        self.syft_path = syft_path
+        # The same semaphores are handed to every ImageScanner of the batch so the limits hold fleet-wide
+        self.limits = {
+            "pull": threading.BoundedSemaphore(pull_limit),
+            "run": threading.BoundedSemaphore(run_limit),
+            "syft": threading.BoundedSemaphore(syft_limit),
+        }
+        # One Engine API client, and so one connection pool, for the whole batch
+        self.docker_backend = None
+        if docker == "api":
+            from dockerBackend import DockerApiBackend, DockerEngineClient
+            self.docker_backend = DockerApiBackend(DockerEngineClient(docker_socket, pool_size=max(workers, 1) * 2), self.limits)
+        self.prefetch = prefetch
+        self.disk_budget = disk_budget
+        self.pull_manager = None
+        self.insecure_registries = insecure_registries
+        # Layer findings of the registry backend, shared by the images of the batch
+        self.known_layers = None
+        if backend == "registry":
+            from registryScan import KnownLayers
+            self.known_layers = KnownLayers()
+        self.layer_cache = layer_cache
+        self.json_dir = json_dir
+        # Per-stage command timeouts and the deadline of a whole image scan, in seconds
+        self.stage_timeouts = stage_timeouts if stage_timeouts is not None else {}
+        self.image_timeout = image_timeout
+        # OS scans shared by the images of the batch built on the same base layers (container backend)
+        self.base_chains = base_chains
+        # Record the content digest of every scanned image (the scan cache resolves it anyway)
+        self.resolve_digests = resolve_digests
+
+    def read_images(self, source):
+        """
+        Read image references from a file, or from stdin when the source is "-"
+        """
+        if source == "-":
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(source) as f:
+                lines = f.read().splitlines()
+        images = []
+        for line in lines:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            if line not in images:
+                images.append(line)
+        return images
+
+    def create_scanner(self, image):
+        image_scanner = self.new_scanner(image)
+        image_scanner.timeouts.update(self.stage_timeouts)
+        image_scanner.image_timeout = self.image_timeout
+        return image_scanner
+
+    def new_scanner(self, image):
+        if self.backend == "registry":
+            from registryScan import RegistryScanner
+            return RegistryScanner(image, self.limits, sbom_dir=self.sbom_dir, known_layers=self.known_layers,
+                                   insecure_registries=self.insecure_registries, layer_cache=self.layer_cache)
+        if self.backend == "filesystem":
+            from fsScanner import FilesystemScanner
+            return FilesystemScanner(image, self.limits, sbom_dir=self.sbom_dir, docker_backend=self.docker_backend,
+                                     layer_cache=self.layer_cache)
+        if self.engine == "async":
+            from asyncScan import AsyncImageScanner
+            return AsyncImageScanner(image, self.limits, sbom_dir=self.sbom_dir, docker_backend=self.docker_backend, base_chains=self.base_chains)
+        return ImageScanner(image, self.limits, sbom_dir=self.sbom_dir, docker_backend=self.docker_backend, base_chains=self.base_chains)
+
+    def prefetch_image(self, image):
+        """
+        Pull an image ahead of its scan, unless its digest is already in the scan cache
+        """
+        image_scanner = self.create_scanner(image)
+        if self.scan_cache is not None:
+            digest = image_scanner.resolve_digest()
+            if digest is not None and self.scan_cache.contains(digest, image_scanner.scan_backend):
+                return False
+        return image_scanner.pull_image()
+
+    def scan_one(self, image):
+        """
+        Scan a single image of the batch and return its image record
+        """
+        try:
+            with get_tracer().span(image, "scan", root=True):
+                return self.scan_image(image)
+        except Exception as e:
+            self.logger.info("Exception while scanning the image " + image + " in batch " + str(e))
+            return None
+        finally:
+            if self.pull_manager is not None:
+                self.pull_manager.release(image)
+
+    def scan_image(self, image):
+        """
+        Pull (or wait for the prefetched pull of) the image, scan it and return its image record
+        """
+        image_scanner = self.create_scanner(image)
+        pull = True
+        if self.pull_manager is not None:
+            with image_scanner.stage("pull-wait"):
+                self.pull_manager.wait(image)
+            # the pull manager decides when the image is removed
+            image_scanner.cleanup_enabled = False
+            pull = False
+        # the deadline of the image covers its own pull, not the wait for a prefetch slot
+        image_scanner.start_deadline()
+        if self.scan_cache is not None:
+            result = image_scanner.get_scan_image_cached(self.scan_cache, syft_path=self.syft_path, pull=pull)
+        else:
+            if pull:
+                image_scanner.pull_image()
+            if self.resolve_digests:
+                image_scanner.digest = image_scanner.resolve_digest()
+            result = image_scanner.get_scan_image(syft_path=self.syft_path)
+        file_name = image.replace(':', '_')
+        file_name = file_name.replace('/', '_')
+        return image_scanner.write_updated_json(file_name, result, self.json_dir)
+
+    def report_one(self, image, on_record):
+        record = self.scan_one(image)
+        if record is not None and on_record is not None:
+            try:
+                on_record(record)
+            except Exception as e:
+                self.logger.info("Exception while reporting the image " + image + " " + str(e))
+        return record
+
+    def scan(self, images, on_record=None):
+        """
+        Scan all the images with a bounded worker pool and return their records in input order,
+        handing every record to on_record as soon as its image is done
+        """
+        self.logger.info("Going to scan " + str(len(images)) + " images with " + str(self.workers) + " workers")
+        if self.backend != "registry" and (self.prefetch > 0 or self.disk_budget is not None):
+            from pullManager import PullManager
+            docker = self.docker_backend if self.docker_backend is not None else DockerCliBackend(limits=self.limits)
+            self.pull_manager = PullManager(self.logger, docker, self.prefetch_image, scan_workers=self.workers,
+                                            prefetch=self.prefetch, disk_budget=self.disk_budget)
+            self.pull_manager.start(images)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                image_records = list(executor.map(lambda image: self.report_one(image, on_record), images))
+        finally:
+            if self.pull_manager is not None:
+                self.pull_manager.close()
+                self.pull_manager = None
+        if self.base_chains is not None:
+            stats = self.base_chains.stats()
+            self.logger.info("Base chains: " + str(stats["hits"]) + " os scans reused, " + str(stats["misses"]) + " run, " + str(stats["chains"]) + " chains known")
+        return [record for record in image_records if record is not None]
@@ -0,0 +1,236 @@
+"""
+CPU-side benchmarks of the scan parsers and the EOL evaluation, on synthetic inputs only (no docker, no network).
+
+Every stage reports its best time over --repeat runs, the items per second and the tracemalloc peak of one extra run,
+and can be compared to a stored baseline:
+
+    python3 benchmarks/run_benchmarks.py --profile quick
+    python3 benchmarks/run_benchmarks.py --save benchmarks/baseline.json
+    python3 benchmarks/run_benchmarks.py --compare benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchmark_dir))
+
+import synthetic
+from addEolStatus import EOLArtifacts
+from sbomStream import parse_syft_stream
+from scanImage import ImageScanner
+
+# Sizes of every stage: syft artifacts per document, packages per listing, images per report
+profiles = {
+    "quick": {"syft": [1000, 20000], "listing": [2000], "images": [200]},
+    "standard": {"syft": [1000, 20000, 200000], "listing": [2000, 50000], "images": [200, 5000]},
+}
+
+# Peak memory differences below this are never reported as regressions
+memory_noise_kib = 64
+
+logger = logging.getLogger("eol-images-scan")
+
+
+def quiet_scanner(image="synthetic:latest"):
+    scanner = ImageScanner(image, probe_session=False)
+    # the parsers log every finding at info level, which would dominate the timings
+    logger.setLevel(logging.WARNING)
+    return scanner
+
+
+def frozen_eol_artifacts():
+    """
+    EOLArtifacts loaded through the snapshot loader from the synthetic snapshot, evaluated against a fixed day
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "eol-snapshot.json")
+        with open(path, "w") as f:
+            json.dump(synthetic.eol_snapshot(), f)
+        eol_artifacts = EOLArtifacts(logger, snapshot=path)
+        eol_artifacts.today = datetime.strptime(synthetic.frozen_today, "%Y-%m-%d")
+        eol_artifacts.apiData = eol_artifacts.get_eol_data()
+    return eol_artifacts
+
+
+def bench_syft_stream(size):
+    document = synthetic.syft_document(size)
+    return lambda: parse_syft_stream(io.BytesIO(document)), size, len(document)
+
+
+def bench_syft_extract(size):
+    # the in-memory path: one json.loads, then the go loop and the java / react / angular parsers
+    document = synthetic.syft_document(size)
+    scanner = quiet_scanner()
+
+    def work():
+        output = json.loads(document)
+        scanner.parse_syft_output(output, "go")
+        scanner.parse_syft_output_java(output)
+        scanner.parse_syft_output_react(output)
+        scanner.parse_syft_output_angular(output)
+    return work, size, len(document)
+
+
+def bench_package_list(manager):
+    def bench(size):
+        os_name, listing = synthetic.package_listing(manager, size)
+        scanner = quiet_scanner()
+        return lambda: scanner.extract_language(scanner.parse_package_list(listing), os_name), size, len(listing.stdout)
+    return bench
+
+
+def bench_probe_script(size):
+    outputs = synthetic.probe_outputs(size)
+    scanner = quiet_scanner()
+
+    def work():
+        for process in outputs:
+            versions, _ = scanner.parse_language_script(process)
+            for language, version in versions.items():
+                scanner.binary_version_detect(language, version)
+    return work, size, sum(len(process.stdout) for process in outputs)
+
+
+def synthetic_images(size):
+    images = []
+    for index in range(size):
+        image = "synthetic-" + str(index) + ":latest"
+        images.append((quiet_scanner(image), synthetic.scan_details(image, seed=index)))
+    return images
+
+
+def bench_report_columns(size):
+    # extract_language, language_format_for_csv and seperate_by_language of every image
+    images = synthetic_images(size)
+    return lambda: [scanner.create_csv_file(details) for scanner, details in images], size, 0
+
+
+def bench_eol_columns(size):
+    images = synthetic_images(size)
+    eol_artifacts = frozen_eol_artifacts()
+    columns = {}
+    for scanner, details in images:
+        for column, values in scanner.create_csv_file(details).items():
+            columns.setdefault(column, []).extend(values)
+
+    def work():
+        # add_eol_columns rewrites the java column in place
+        eol_artifacts.add_eol_columns({column: list(values) for column, values in columns.items()})
+    return work, size, 0
+
+
+def bench_eol_records(size):
+    images = synthetic_images(size)
+    eol_artifacts = frozen_eol_artifacts()
+    return lambda: eol_artifacts.add_eol_status([scanner.build_image_record(details) for scanner, details in images]), size, 0
+
+
+# (stage, profile size key, benchmark factory)
+stages = [
+    ("syft-stream", "syft", bench_syft_stream),
+    ("syft-extract", "syft", bench_syft_extract),
+    ("package-list-apt", "listing", bench_package_list("apt")),
+    ("package-list-apk", "listing", bench_package_list("apk")),
+    ("package-list-rpm", "listing", bench_package_list("rpm")),
+    ("probe-script", "images", bench_probe_script),
+    ("report-columns", "images", bench_report_columns),
+    ("eol-columns", "images", bench_eol_columns),
+    ("eol-records", "images", bench_eol_records),
+]
+
+
+def measure(work, repeat):
+    """
+    (best seconds over repeat runs, tracemalloc peak bytes of one more run)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        work()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run(profile, repeat, selected=None):
+    results = {}
+    for stage, size_key, factory in stages:
+        if selected and stage not in selected:
+            continue
+        for size in profile[size_key]:
+            work, items, input_bytes = factory(size)
+            seconds, peak = measure(work, repeat)
+            result = {"seconds": round(seconds, 6), "items_per_second": round(items / seconds, 1), "peak_kib": peak // 1024}
+            if input_bytes:
+                result["mib_per_second"] = round(input_bytes / seconds / 1024 / 1024, 2)
+            results[stage + "/" + str(size)] = result
+            print("%-24s %10.4f s %14.1f items/s %10d KiB peak" % (stage + "/" + str(size), seconds, result["items_per_second"], result["peak_kib"]))
+            sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Names of the stages slower or bigger than the baseline beyond the tolerance
+    """
+    regressions = []
+    print()
+    print("%-24s %12s %12s" % ("compared to baseline", "throughput", "peak"))
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference is None:
+            print("%-24s %12s" % (name, "new"))
+            continue
+        speed = result["items_per_second"] / reference["items_per_second"] - 1
+        memory = (result["peak_kib"] + 1) / (reference["peak_kib"] + 1) - 1
+        # a few KiB of peak difference is allocator noise, not a regression
+        grown = memory > tolerance and result["peak_kib"] - reference["peak_kib"] > memory_noise_kib
+        regressed = speed < -tolerance or grown
+        if regressed:
+            regressions.append(name)
+        print("%-24s %+11.1f%% %+11.1f%%%s" % (name, speed * 100, memory * 100, "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scan parsers and the EOL evaluation on synthetic data")
+    parser.add_argument("--profile", choices=sorted(profiles), default="standard", help="input sizes of the stages")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the fastest one is reported")
+    parser.add_argument("--stage", action="append", choices=[stage for stage, _, _ in stages], help="only run these stages")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a baseline file")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results to a baseline file and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative throughput loss or peak memory growth")
+    arguments = parser.parse_args()
+
+    results = run(profiles[arguments.profile], arguments.repeat, arguments.stage)
+
+    if arguments.save is not None:
+        with open(arguments.save, "w") as f:
+            json.dump({"profile": arguments.profile, "python": platform.python_version(), "machine": platform.machine(),
+                       "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if arguments.compare is not None:
+        with open(arguments.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, arguments.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Deterministic synthetic inputs for the benchmarks: syft documents, package manager listings, probe script output and a
+frozen endoflife.date snapshot. The same seed always produces the same bytes, so runs are comparable.
+"""
+import json
+import random
+import subprocess
+
+from eolData import eol_products
+
+# Share of the artifacts that hit one of the syft extractors, the rest are plain packages
+go_share = 0.02
+java_share = 0.05
+npm_share = 0.03
+
+# Frozen evaluation day, the snapshot cycles end before or after it
+frozen_today = "2024-06-01"
+
+
+def syft_artifact(rng, index):
+    kind = rng.random()
+    location = {"path": "/usr/lib/pkg-" + str(index), "layerID": "sha256:" + "%064x" % (index % 7)}
+    if kind < go_share:
+        return {"id": str(index), "name": "cmd-" + str(index), "version": "v0.0.0", "type": "go-module",
+                "foundBy": "go-module-binary-cataloger", "locations": [dict(location, path="/usr/local/bin/app-" + str(index))],
+                "metadata": {"goCompiledVersion": "go1." + str(rng.randint(8, 22)) + "." + str(rng.randint(0, 9)), "architecture": "amd64"}}
+    if kind < go_share + java_share:
+        directory = rng.choice(["/opt/app/", "/srv/", "/usr/share/java/", "/opt/app/lib/"])
+        return {"id": str(index), "name": "app-" + str(index), "version": "1.0." + str(index % 100), "type": "java-archive",
+                "foundBy": "java-archive-cataloger", "locations": [location],
+                "metadata": {"virtualPath": directory + "app-" + str(index) + ".jar",
+                             "manifest": {"main": {"Build-Jdk": rng.choice(["1.8.0_292", "11.0.19", "17.0.7", "21.0.1"])}}}}
+    if kind < go_share + java_share + npm_share:
+        name = rng.choice(["react", "@angular/cli", "@angular-devkit/core", "@schematics/angular", "left-pad"])
+        return {"id": str(index), "name": name, "version": str(rng.randint(8, 18)) + ".2." + str(rng.randint(0, 9)),
+                "type": "npm", "foundBy": "javascript-package-cataloger", "locations": [dict(location, path="/app/node_modules/" + name + "/package.json")]}
+    return {"id": str(index), "name": "lib" + str(index), "version": str(rng.randint(0, 9)) + "." + str(index % 50), "type": "deb",
+            "foundBy": "dpkg-db-cataloger", "locations": [location], "licenses": ["MIT"],
+            "metadata": {"package": "lib" + str(index), "source": "", "architecture": "amd64", "installedSize": rng.randint(1, 9000)}}
+
+
+def syft_document(artifacts, seed=1):
+    """
+    Encoded syft JSON document with the given number of artifacts
+    """
+    rng = random.Random(seed)
+    document = {
+        "artifacts": [syft_artifact(rng, index) for index in range(artifacts)],
+        "artifactRelationships": [{"parent": str(index), "child": str(index + 1), "type": "contains"} for index in range(0, artifacts, 10)],
+        "source": {"type": "image", "target": {"userInput": "synthetic:latest"}},
+        "distro": {"prettyName": "Debian GNU/Linux 12 (bookworm)", "name": "Debian GNU/Linux", "id": "debian", "versionID": "12"},
+        "descriptor": {"name": "syft", "version": "0.99.0"},
+        "schema": {"version": "11.0.1"},
+    }
+    return json.dumps(document).encode()
+
+
+# (os name, listing line of a language package, listing line of any other package) per package manager
+listing_formats = {
+    "apt": ("Debian GNU/Linux 12 (bookworm)", "{name}/stable,now {version} amd64 [installed]", "lib{index}/stable,now 1.{index} amd64 [installed]"),
+    "apk": ("Alpine Linux v3.18", "{name}-{version} x86_64 {{{name}}} (MIT) [installed]", "lib{index}-1.{index} x86_64 {{lib{index}}} (MIT) [installed]"),
+    "rpm": ("CentOS Linux 7 (Core)", "{name}-{version}.el7.x86_64", "lib{index}-1.{index}.el7.x86_64"),
+}
+language_packages = [("python3", "3.7.3"), ("python2.7", "2.7.16"), ("php7.4", "7.4.33"), ("nodejs", "12.22.12"),
+                     ("libruby2.7", "2.7.4"), ("openjdk-11-jre", "11.0.19"), ("go-1.15", "1.15.15")]
+
+
+def package_listing(manager, packages, seed=1):
+    """
+    (os name, completed process) of a package manager listing with the given number of installed packages
+    """
+    rng = random.Random(seed)
+    os_name, language_line, other_line = listing_formats[manager]
+    lines = []
+    for index in range(packages):
+        if rng.random() < 0.01:
+            name, version = rng.choice(language_packages)
+            lines.append(language_line.format(name=name, version=version))
+        else:
+            lines.append(other_line.format(index=index))
+    stdout = ("\n".join(lines) + "\n").encode()
+    return os_name, subprocess.CompletedProcess(["list"], 0, stdout, b"")
+
+
+def probe_outputs(count, seed=1):
+    """
+    Completed processes of utils/run_individual_commands.sh, one per image
+    """
+    from scanImage import script_languages
+    rng = random.Random(seed)
+    outputs = []
+    for _ in range(count):
+        versions = []
+        for language in script_languages:
+            if rng.random() < 0.6:
+                versions.append("sh: 1: " + language + ": not found")
+            elif language in ("node", "nodejs", "react", "angular"):
+                versions.append("v" + str(rng.randint(10, 20)) + ".1.0")
+            else:
+                versions.append(language.capitalize() + " " + str(rng.randint(2, 8)) + "." + str(rng.randint(0, 12)) + ".1")
+        stdout = ("#Separator#".join(versions) + "#Separator#").encode()
+        outputs.append(subprocess.CompletedProcess(["sh"], 0, stdout, b""))
+    return outputs
+
+
+def eol_snapshot(seed=1):
+    """
+    Raw endoflife.date data of every product, in the shape written by --eol-save-snapshot
+    """
+    rng = random.Random(seed)
+    snapshot = {}
+    for product in eol_products:
+        cycles = []
+        for major in range(1, 25):
+            for minor in range(0, 25 if product in ("go", "python", "php", "ruby", "kotlin", "django") else 1):
+                cycle = str(major) + "." + str(minor) if minor or product in ("go", "python", "php", "ruby") else str(major)
+                year = 2010 + (major + minor) % 20
+                eol = rng.choice([True, False, "%d-%02d-%02d" % (year, rng.randint(1, 12), rng.randint(1, 28))])
+                cycles.append({"cycle": cycle, "eol": eol, "latest": cycle + "." + str(rng.randint(0, 30)),
+                               "releaseDate": "%d-01-01" % (year - 3), "lts": False})
+        # endoflife.date lists the newest cycle first
+        snapshot[product] = cycles[::-1]
+    return snapshot
+
+
+def scan_details(image, seed=1):
+    """
+    Scan result of one image in the shape of ImageScanner.get_scan_image, as evaluated by the report stages
+    """
+    rng = random.Random(seed)
+    os_name, listing = package_listing(rng.choice(sorted(listing_formats)), 200, seed)
+    from scanImage import language_package_prefixes
+    # only the language packages survive ImageScanner.parse_package_list
+    lines = [line.decode() for line in listing.stdout.splitlines() if line.decode().startswith(language_package_prefixes)]
+    go = ["go1." + str(rng.randint(8, 22)) + ".1" for _ in range(rng.randint(0, 3))]
+    java = [rng.choice(["1.8.0_292", "11.0.19", "17.0.7"]) for _ in range(rng.randint(0, 3))]
+    return {image: {"scan_details": {
+        "os": {"name": os_name},
+        "languages": lines,
+        "languages-specific": {"python3": "Python 3." + str(rng.randint(5, 12)) + ".1", "node": "v" + str(rng.randint(10, 20)) + ".0.0"},
+        "languages-syft": [go, java, [], ["16.14.0"] if rng.random() < 0.3 else []],
+        "languages-syft-go-paths": ["/usr/local/bin/app(" + version + ")" for version in go],
+        "languages-syft-java-paths": ["/opt/app/app.jar(" + version + ")" for version in java],
+        "languages-syft-angular-paths": [],
+        "languages-syft-react-paths": ["/app/node_modules/react/package.json(16.14.0)"],
+    }}}
@@ -0,0 +1,279 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from sbomStream import TeeReader
+
+# Fixture files of a record / replay store
+commands_file = "commands.jsonl"
+http_file = "http.jsonl"
+
+# Exit code of a command killed at its deadline, as reported by timeout(1)
+timeout_returncode = 124
+
+
+def encode(data):
+    return base64.b64encode(data or b"").decode()
+
+
+def decode(data):
+    return base64.b64decode(data)
+
+
+def fixture_key(command):
+    """
+    argv with the parts that change between runs (temporary paths, the working directory) replaced,
+    so a replay matches the commands of a recorded run
+    """
+    temporary = re.escape(tempfile.gettempdir()) + r"/[^\s:]*"
+    cwd = os.getcwd()
+    return [re.sub(r"eol-scan-[0-9a-f]+", "<name>", re.sub(temporary, "<tmp>", argument.replace(cwd, "<cwd>"))) for argument in command]
+
+
+class TimedOutProcess(subprocess.CompletedProcess):
+    """
+    Result of a command killed at its deadline, or never started (skipped) because the deadline had already passed
+    """
+    def __init__(self, command, timeout, stdout=b"", stderr=b"", skipped=False):
+        message = "skipped, the deadline has passed" if skipped else "killed after " + str(round(timeout, 1)) + "s"
+        super().__init__(command, timeout_returncode, stdout or b"", (stderr or b"") + ("timeout: " + message).encode())
+        self.timeout = timeout
+        self.skipped = skipped
+
+
+class HttpResponse:
+    """
+    The parts of an HTTP response the scanner reads, header names are lower case
+    """
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = {name.lower(): value for name, value in headers.items()}
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(str(self.status_code) + " error for " + self.url)
+
+
+class SubprocessExecutor:
+    """
+    Runs the external commands and HTTP requests of a scan for real
+    """
+    def run(self, command, timeout=None):
+        """
+        Run the command, killing it once it runs longer than timeout seconds
+        """
+        try:
+            return subprocess.run(command, capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            return TimedOutProcess(command, timeout, e.stdout, e.stderr)
+
+    def stream(self, command, consume, timeout=None):
+        """
+        Run the command and hand its stdout to consume as a stream, returns (completed process without stdout, result)
+        """
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+            killed = threading.Event()
+
+            def kill():
+                killed.set()
+                process.kill()
+            # killing the process ends its stdout, so a consumer blocked on a read returns as well
+            killer = threading.Timer(timeout, kill) if timeout is not None else None
+            if killer is not None:
+                killer.start()
+            try:
+                result = consume(process.stdout)
+            finally:
+                # drain what the consumer did not read so the process can exit
+                while process.stdout.read(1024 * 1024):
+                    pass
+                process.wait()
+                if killer is not None:
+                    killer.cancel()
+            stderr.seek(0)
+            if killed.is_set():
+                return TimedOutProcess(command, timeout, b"", stderr.read()), result
+            return subprocess.CompletedProcess(command, process.returncode, b"", stderr.read()), result
+
+    async def arun(self, command, timeout=None):
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return TimedOutProcess(command, timeout)
+        return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+    def http_get(self, get_session, url, headers=None, timeout=None):
+        response = get_session().get(url, headers=headers, timeout=timeout)
+        return HttpResponse(url, response.status_code, dict(response.headers), response.content)
+
+
+class RecordingExecutor(SubprocessExecutor):
+    """
+    Runs everything for real and appends argv, exit code, stdout, stderr and duration of each call to a fixture store
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def append(self, file_name, fixture):
+        line = json.dumps(fixture) + "\n"
+        with self.lock, open(os.path.join(self.store_dir, file_name), "a") as f:
+            f.write(line)
+
+    def record(self, command, completed, stdout, duration):
+        self.append(commands_file, {"key": fixture_key(command), "argv": list(command), "returncode": completed.returncode,
+                                    "stdout": encode(stdout), "stderr": encode(completed.stderr), "duration": round(duration, 6),
+                                    "timed_out": isinstance(completed, TimedOutProcess)})
+
+    def run(self, command, timeout=None):
+        started = time.perf_counter()
+        completed = super().run(command, timeout)
+        self.record(command, completed, completed.stdout, time.perf_counter() - started)
+        return completed
+
+    def stream(self, command, consume, timeout=None):
+        captured = io.BytesIO()
+
+        def tee(stdout):
+            return consume(TeeReader(stdout, captured))
+        started = time.perf_counter()
+        completed, result = super().stream(command, tee, timeout)
+        self.record(command, completed, captured.getvalue(), time.perf_counter() - started)
+        return completed, result
+
+    async def arun(self, command, timeout=None):
+        started = time.perf_counter()
+        completed = await super().arun(command, timeout)
+        self.record(command, completed, completed.stdout, time.perf_counter() - started)
+        return completed
+
+    def http_get(self, get_session, url, headers=None, timeout=None):
+        started = time.perf_counter()
+        response = super().http_get(get_session, url, headers, timeout)
+        self.append(http_file, {"url": url, "status": response.status_code, "headers": response.headers,
+                                "body": encode(response.content), "duration": round(time.perf_counter() - started, 6)})
+        return response
+
+
+class ReplayExecutor:
+    """
+    Serves the calls recorded by RecordingExecutor without docker, syft or network; repeated calls of the same command
+    get its recordings in order. latency scales the recorded durations (0 answers at once, 1 replays them as recorded).
+    """
+    def __init__(self, store_dir, latency=0.0, logger=None):
+        self.latency = latency
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.commands = self.load(os.path.join(store_dir, commands_file), lambda fixture: json.dumps(fixture["key"]))
+        self.responses = self.load(os.path.join(store_dir, http_file), lambda fixture: fixture["url"])
+        self.misses = 0
+
+    def load(self, path, key):
+        fixtures = defaultdict(deque)
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        fixture = json.loads(line)
+                        fixtures[key(fixture)].append(fixture)
+        return fixtures
+
+    def next_fixture(self, fixtures, key):
+        with self.lock:
+            queue = fixtures.get(key)
+            if not queue:
+                self.misses += 1
+                return None
+            # the last recording keeps answering once the earlier ones are used up
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def command_fixture(self, command):
+        fixture = self.next_fixture(self.commands, json.dumps(fixture_key(command)))
+        if fixture is None:
+            if self.logger is not None:
+                self.logger.info("No recorded output for " + " ".join(command))
+            return None, subprocess.CompletedProcess(command, 127, b"", ("replay: no recorded output for " + " ".join(command)).encode())
+        if fixture.get("timed_out"):
+            completed = TimedOutProcess(command, fixture["duration"], decode(fixture["stdout"]))
+            completed.stderr = decode(fixture["stderr"])
+            return fixture, completed
+        return fixture, subprocess.CompletedProcess(command, fixture["returncode"], decode(fixture["stdout"]), decode(fixture["stderr"]))
+
+    def delay(self, fixture):
+        return fixture["duration"] * self.latency if fixture is not None else 0
+
+    def replayed(self, command, timeout):
+        """
+        (seconds to wait, completed process) of the next recording, a replayed latency beyond the timeout times out
+        """
+        fixture, completed = self.command_fixture(command)
+        delay = self.delay(fixture)
+        if timeout is not None and delay > timeout:
+            return timeout, TimedOutProcess(command, timeout)
+        return delay, completed
+
+    def run(self, command, timeout=None):
+        delay, completed = self.replayed(command, timeout)
+        if delay > 0:
+            time.sleep(delay)
+        return completed
+
+    def stream(self, command, consume, timeout=None):
+        delay, completed = self.replayed(command, timeout)
+        if delay > 0:
+            time.sleep(delay)
+        result = consume(io.BytesIO(completed.stdout))
+        completed.stdout = b""
+        return completed, result
+
+    async def arun(self, command, timeout=None):
+        delay, completed = self.replayed(command, timeout)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return completed
+
+    def http_get(self, get_session, url, headers=None, timeout=None):
+        fixture = self.next_fixture(self.responses, url)
+        if fixture is None:
+            raise Exception("replay: no recorded response for " + url)
+        if self.delay(fixture) > 0:
+            time.sleep(self.delay(fixture))
+        return HttpResponse(url, fixture["status"], fixture["headers"], decode(fixture["body"]))
+
+
+executor = SubprocessExecutor()
+
+
+def get_executor():
+    return executor
+
+
+def configure_executor(record_dir=None, replay_dir=None, replay_latency=0.0, logger=None):
+    """
+    Replace the process executor, used by every scanner and EOL loader created afterwards
+    """
+    global executor
+    if replay_dir is not None:
+        executor = ReplayExecutor(replay_dir, replay_latency, logger)
+    elif record_dir is not None:
+        executor = RecordingExecutor(record_dir)
+    else:
+        executor = SubprocessExecutor()
+    return executor
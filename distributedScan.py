@@ -0,0 +1,122 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from scanRecords import record_from_dict
+from scanTrace import get_tracer
+
+
+def default_worker_id():
+    return socket.gethostname() + ":" + str(os.getpid())
+
+
+class QueueWorker:
+    """
+    Scans the images leased from a shared work queue with the settings of a BatchScanner and stores their records in
+    the queue, until no job is queued or leased any more. The held leases are renewed by a heartbeat thread.
+    """
+    def __init__(self, logger, work_queue, batch_scanner, worker_id=None, poll=2.0):
+        self.logger = logger
+        self.work_queue = work_queue
+        self.batch_scanner = batch_scanner
+        self.worker_id = worker_id or default_worker_id()
+        self.poll = poll
+        # images leased by the threads of this worker
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.scanned = 0
+
+    def heartbeat(self):
+        interval = max(self.work_queue.lease_seconds / 3, 1)
+        while not self.stopped.wait(interval):
+            with self.lock:
+                held = list(self.held)
+            for image in held:
+                try:
+                    if not self.work_queue.heartbeat(image, self.worker_id):
+                        self.logger.info("Lost the lease of the image " + image + ", another worker may scan it again")
+                except Exception as e:
+                    self.logger.info("Exception while renewing the lease of the image " + image + " " + str(e))
+
+    def scan_job(self, image):
+        try:
+            with get_tracer().span(image, "scan", root=True, worker=self.worker_id):
+                record = self.batch_scanner.scan_image(image)
+        except Exception as e:
+            self.logger.info("Exception while scanning the leased image " + image + " " + str(e))
+            self.work_queue.fail(image, self.worker_id, str(e) or type(e).__name__)
+            return
+        self.work_queue.complete(image, self.worker_id, record.to_dict())
+        with self.lock:
+            self.scanned += 1
+
+    def drained(self):
+        counts = self.work_queue.counts()
+        # a queue without any job yet is waiting for its coordinator
+        return sum(counts.values()) > 0 and counts["queued"] == 0 and counts["leased"] == 0
+
+    def work(self):
+        while True:
+            image = self.work_queue.lease(self.worker_id)
+            if image is None:
+                if self.drained():
+                    return
+                time.sleep(self.poll)
+                continue
+            with self.lock:
+                self.held.add(image)
+            try:
+                self.scan_job(image)
+            finally:
+                with self.lock:
+                    self.held.discard(image)
+
+    def run(self):
+        """
+        Work the queue with the worker threads of the batch scanner, returns the number of images scanned
+        """
+        self.logger.info("Worker " + self.worker_id + " leasing images with " + str(self.batch_scanner.workers) + " threads")
+        heartbeat = threading.Thread(target=self.heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.batch_scanner.workers) as executor:
+                for future in [executor.submit(self.work) for _ in range(self.batch_scanner.workers)]:
+                    future.result()
+        finally:
+            self.stopped.set()
+        self.logger.info("Worker " + self.worker_id + " is done, " + str(self.scanned) + " images scanned")
+        return self.scanned
+
+
+def coordinate(logger, work_queue, images, on_record=None, poll=2.0):
+    """
+    Queue the images and collect the records the workers store, handing each one to on_record as it arrives;
+    returns the records in input order once every image is done or failed for good
+    """
+    queued = work_queue.enqueue(images)
+    logger.info("Queued " + str(queued) + " of " + str(len(images)) + " images, the others are already queued or done")
+    records = {}
+    pending = list(images)
+    last_counts = None
+    while True:
+        for image, data in work_queue.records(pending).items():
+            records[image] = record_from_dict(data)
+            if on_record is not None:
+                try:
+                    on_record(records[image])
+                except Exception as e:
+                    logger.info("Exception while reporting the image " + image + " " + str(e))
+        failures = work_queue.failures(pending)
+        pending = [image for image in pending if image not in records and image not in failures]
+        counts = work_queue.counts()
+        if counts != last_counts:
+            logger.info("Work queue: " + ", ".join(str(count) + " " + status for status, count in counts.items()))
+            last_counts = counts
+        if len(pending) == 0:
+            break
+        time.sleep(poll)
+    for image, error in work_queue.failures(images).items():
+        logger.info("The image " + image + " failed on every attempt: " + str(error))
+    return [records[image] for image in images if image in records]
@@ -0,0 +1,687 @@
+import base64
+import http.client
+import json
+import os
+import queue
+import re
+import socket
+import struct
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import quote, urlencode
+from commandExecutor import TimedOutProcess, get_executor
+
+default_docker_socket = "/var/run/docker.sock"
+
+
+# Units of the human readable sizes printed by the docker CLI
+size_units = {"B": 1, "kB": 1000, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+
+
+def container_name():
+    """
+    Name of a one-off scan container, so it can be removed when its docker client is killed at a deadline
+    """
+    return "eol-scan-" + uuid.uuid4().hex[:12]
+
+
+def parse_size(size):
+    matched = re.match(r"([\d.]+)\s*([kKMGT]?B)", size)
+    if matched is None:
+        return None
+    return int(float(matched.group(1)) * size_units[matched.group(2)])
+
+
+def split_reference(image):
+    """
+    (name, tag or digest) of an image reference, as the pull call of the Engine API takes them
+    """
+    if "@" in image:
+        return tuple(image.split("@", 1))
+    if ":" in image.rsplit("/", 1)[-1]:
+        return tuple(image.rsplit(":", 1))
+    return image, "latest"
+
+
+def registry_auth(image):
+    """
+    X-Registry-Auth header of the registry of the image from the docker login credentials, None when there are none
+    """
+    from registryClient import docker_config_auth, docker_hub_registry, parse_reference
+    registry = parse_reference(image)[0]
+    credentials = docker_config_auth(registry)
+    if credentials is None:
+        return None
+    server = "https://index.docker.io/v1/" if registry == docker_hub_registry else registry
+    auth = {"username": credentials[0], "password": credentials[1], "serveraddress": server}
+    return base64.urlsafe_b64encode(json.dumps(auth).encode()).decode()
+
+
+def docker_socket_path():
+    """
+    Socket of the docker daemon, from DOCKER_HOST when it points to a unix socket
+    """
+    docker_host = os.environ.get("DOCKER_HOST", "")
+    if docker_host.startswith("unix://"):
+        return docker_host[len("unix://"):]
+    return default_docker_socket
+
+
+class DockerCliBackend:
+    """
+    Talks to docker by running the docker CLI, every call forks a docker process
+    """
+    def __init__(self, run_command=None, limits=None):
+        # The scanner hands in its own run_command, otherwise commands hold the given stage limits
+        self.run_command = run_command if run_command is not None else self.run_limited
+        self.limits = limits if limits is not None else {}
+
+    def for_scan(self, command_timeout):
+        # the run_command of the scanner already applies its timeouts
+        return self
+
+    def run_limited(self, command, stage="run"):
+        limit = self.limits.get(stage)
+        if limit is None:
+            return get_executor().run(command)
+        with limit:
+            return get_executor().run(command)
+
+    def run_argv(self, image, entrypoint, arguments, mount=False, name=None):
+        command = ["docker", "run"]
+        if name is not None:
+            command = command + ["--name", name]
+        if mount:
+            command = command + ["-v", os.getcwd() + ":/eol-mount/"]
+        command = command + ["--entrypoint", entrypoint, "--memory-swap", "-1", "--rm", image]
+        return command + arguments
+
+    def exec_argv(self, container_id, entrypoint, arguments):
+        return ["docker", "exec", container_id, entrypoint] + arguments
+
+    def run(self, image, entrypoint, arguments, mount=False):
+        name = container_name()
+        process = self.run_command(self.run_argv(image, entrypoint, arguments, mount, name), "run")
+        if isinstance(process, TimedOutProcess) and not process.skipped:
+            # killing the docker client leaves the container running, --rm only applies once it exits
+            self.remove_container(name)
+        return process
+
+    def start_idle(self, image, entrypoint, arguments, mount=True):
+        command = ["docker", "run", "-d", "-i", "--memory-swap", "-1"]
+        if mount:
+            command = command + ["-v", os.getcwd() + ":/eol-mount/"]
+        started = self.run_command(command + ["--entrypoint", entrypoint, image] + arguments, "run")
+        if started.returncode != 0:
+            return None
+        return started.stdout.decode().strip()
+
+    def is_running(self, container_id):
+        state = self.run_command(["docker", "inspect", "-f", "{{.State.Running}}", container_id], "run")
+        return state.returncode == 0 and state.stdout.decode().strip() == "true"
+
+    def exec(self, container_id, entrypoint, arguments):
+        return self.run_command(self.exec_argv(container_id, entrypoint, arguments), "run")
+
+    def remove_container(self, container_id):
+        # cleanup commands still run once the deadline of the image has passed
+        self.run_command(["docker", "rm", "-f", container_id], "cleanup")
+
+    def remove_image(self, image):
+        return self.run_command(["docker", "rmi", image], "cleanup").returncode == 0
+
+    def pull_image(self, image):
+        return self.run_command(["docker", "pull", image], "pull")
+
+    def remote_digest(self, image):
+        """
+        Digest of the image in its registry without pulling it, None when it cannot be read
+        """
+        manifest_command = self.run_command(["docker", "buildx", "imagetools", "inspect", "--format", "{{json .Manifest}}", image], "pull")
+        if manifest_command.returncode != 0:
+            return None
+        try:
+            return json.loads(manifest_command.stdout)["digest"]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def image_digests(self, image):
+        """
+        (RepoDigests, Id) of a local image, None when the image is not present
+        """
+        inspect_command = self.run_command(["docker", "image", "inspect", "--format", "{{json .RepoDigests}} {{.Id}}", image], "run")
+        if inspect_command.returncode != 0:
+            return None
+        repo_digests, _, image_id = inspect_command.stdout.decode().strip().partition(" ")
+        return json.loads(repo_digests) or [], image_id
+
+    def image_layers(self, image):
+        """
+        (layer diff ids, history entries (size, created_by) oldest first) of a local image, None when it is not present
+        """
+        inspect_command = self.run_command(["docker", "image", "inspect", "--format", "{{json .RootFS.Layers}}", image], "run")
+        history_command = self.run_command(["docker", "image", "history", "--no-trunc", "--human=false", "--format", "{{.Size}}\t{{.CreatedBy}}", image], "run")
+        if inspect_command.returncode != 0 or history_command.returncode != 0:
+            return None
+        history = []
+        for line in history_command.stdout.decode().splitlines():
+            size, _, created_by = line.partition("\t")
+            history.append((int(size) if size.isdigit() else 1, created_by))
+        return json.loads(inspect_command.stdout) or [], history[::-1]
+
+    def save_image(self, image, path):
+        save_command = self.run_command(["docker", "save", "-o", path, image], "pull")
+        if save_command.returncode != 0:
+            raise Exception("docker save failed: " + save_command.stderr.decode().strip())
+
+    def disk_usage(self):
+        """
+        Bytes used by the local image layers, shared layers counted once
+        """
+        df_command = self.run_command(["docker", "system", "df", "--format", "{{json .}}"], "cleanup")
+        if df_command.returncode != 0:
+            return None
+        for line in df_command.stdout.decode().splitlines():
+            usage = json.loads(line)
+            if usage.get("Type") == "Images":
+                return parse_size(usage.get("Size", ""))
+        return None
+
+    def prune(self):
+        self.run_command(["docker", "system", "prune", "-a", "-f"], "cleanup")
+
+
+class DockerApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(str(status) + " " + message)
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def read_multiplexed(response):
+    """
+    Split the multiplexed stdout/stderr stream of a non-tty attach or exec into (stdout, stderr)
+    """
+    streams = {1: bytearray(), 2: bytearray()}
+    while True:
+        header = response.read(8)
+        if len(header) < 8:
+            break
+        stream, size = struct.unpack(">BxxxL", header)
+        data = response.read(size)
+        streams.get(stream, streams[1]).extend(data)
+    return bytes(streams[1]), bytes(streams[2])
+
+
+def interrupt(connection):
+    """
+    Unblock a thread reading the response of a stream connection, it reads the end of the stream
+    """
+    try:
+        connection.sock.shutdown(socket.SHUT_RDWR)
+    except (AttributeError, OSError):
+        pass
+
+
+class DockerEngineClient:
+    """
+    Minimal Docker Engine API client over the daemon unix socket with a pool of keep-alive connections
+    """
+    def __init__(self, socket_path=None, timeout=600, pool_size=8):
+        self.socket_path = socket_path or docker_socket_path()
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pool = queue.LifoQueue()
+
+    def new_connection(self, timeout=None):
+        return UnixHTTPConnection(self.socket_path, timeout if timeout is not None else self.timeout)
+
+    def url(self, path, query=None):
+        if query:
+            return path + "?" + urlencode(query)
+        return path
+
+    def send(self, connection, method, path, query=None, body=None, headers=None):
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        connection.request(method, self.url(path, query), body=data, headers=headers)
+        return connection.getresponse()
+
+    def request(self, method, path, query=None, body=None, timeout=None, headers=None):
+        """
+        Send a request on a pooled connection and return (status, body); timeout bounds every socket operation of the
+        request instead of the timeout of the client
+        """
+        for attempt in range(2):
+            try:
+                connection = self.pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                connection = self.new_connection()
+                reused = False
+            connection.timeout = timeout if timeout is not None else self.timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            try:
+                response = self.send(connection, method, path, query, body, headers)
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                # the daemon closed an idle pooled connection, retry once on a fresh one
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close or self.pool.qsize() >= self.pool_size:
+                connection.close()
+            else:
+                self.pool.put(connection)
+            return response.status, data
+
+    def call(self, method, path, query=None, body=None, missing_ok=False, timeout=None, headers=None):
+        status, data = self.request(method, path, query, body, timeout, headers)
+        if status == 404 and missing_ok:
+            return None
+        if status >= 400:
+            try:
+                message = json.loads(data)["message"]
+            except Exception:
+                message = data.decode(errors="replace")
+            raise DockerApiError(status, message)
+        return json.loads(data) if data else {}
+
+    def stream(self, method, path, query=None, body=None, timeout=None, headers=None):
+        """
+        Response of a hijacked stream (attach, exec start, image export or pull) on its own connection, the caller closes it
+        """
+        connection = self.new_connection(timeout)
+        try:
+            response = self.send(connection, method, path, query, body, headers)
+        except Exception:
+            connection.close()
+            raise
+        if response.status >= 400:
+            data = response.read()
+            connection.close()
+            try:
+                message = json.loads(data)["message"]
+            except Exception:
+                message = data.decode(errors="replace")
+            raise DockerApiError(response.status, message)
+        return connection, response
+
+    def ping(self):
+        return self.request("GET", "/_ping")[0] == 200
+
+    def image_inspect(self, image, timeout=None):
+        return self.call("GET", "/images/" + quote(image, safe="/:@") + "/json", missing_ok=True, timeout=timeout)
+
+    def remove_image(self, image, timeout=None):
+        return self.call("DELETE", "/images/" + quote(image, safe="/:@"), timeout=timeout)
+
+    def image_history(self, image, timeout=None):
+        return self.call("GET", "/images/" + quote(image, safe="/:@") + "/history", missing_ok=True, timeout=timeout)
+
+    def pull_image(self, image, auth=None, timeout=None):
+        """
+        Pull an image, raises DockerApiError with the error the daemon reports in its progress stream, and socket.timeout
+        when the pull takes longer than timeout seconds
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        name, tag = split_reference(image)
+        connection, response = self.stream("POST", "/images/create", {"fromImage": name, "tag": tag}, timeout=timeout,
+                                           headers={"X-Registry-Auth": auth} if auth is not None else None)
+        try:
+            # one JSON progress message per line, a failed pull still answers 200 and ends with an error message
+            for line in response:
+                if line.strip():
+                    progress = json.loads(line)
+                    if "error" in progress:
+                        raise DockerApiError(500, progress["error"])
+                if deadline is not None and time.monotonic() > deadline:
+                    raise socket.timeout("the pull of " + image + " timed out")
+        finally:
+            connection.close()
+
+    def distribution(self, image, auth=None, timeout=None):
+        """
+        Descriptor of the image in its registry, read by the daemon without pulling the image
+        """
+        return self.call("GET", "/distribution/" + quote(image, safe="/:@") + "/json", timeout=timeout,
+                         headers={"X-Registry-Auth": auth} if auth is not None else None)
+
+    def create_container(self, image, entrypoint, arguments, binds=None, open_stdin=False, timeout=None):
+        body = {"Image": image, "Entrypoint": [entrypoint], "Cmd": arguments,
+                "AttachStdout": not open_stdin, "AttachStderr": not open_stdin,
+                "OpenStdin": open_stdin, "Tty": False,
+                "HostConfig": {"MemorySwap": -1, "Binds": binds or []}}
+        return self.call("POST", "/containers/create", body=body, timeout=timeout)["Id"]
+
+    def start_container(self, container_id, timeout=None):
+        self.call("POST", "/containers/" + container_id + "/start", timeout=timeout)
+
+    def attach_container(self, container_id, timeout=None):
+        return self.stream("POST", "/containers/" + container_id + "/attach", {"stream": 1, "stdout": 1, "stderr": 1}, timeout=timeout)
+
+    def wait_container(self, container_id, timeout=None):
+        return self.call("POST", "/containers/" + container_id + "/wait", timeout=timeout)["StatusCode"]
+
+    def inspect_container(self, container_id, timeout=None):
+        return self.call("GET", "/containers/" + container_id + "/json", missing_ok=True, timeout=timeout)
+
+    def remove_container(self, container_id, timeout=None):
+        self.call("DELETE", "/containers/" + container_id, {"force": 1, "v": 1}, missing_ok=True, timeout=timeout)
+
+    def create_exec(self, container_id, command, timeout=None):
+        return self.call("POST", "/containers/" + container_id + "/exec",
+                         body={"Cmd": command, "AttachStdout": True, "AttachStderr": True}, timeout=timeout)["Id"]
+
+    def start_exec(self, exec_id, timeout=None):
+        return self.stream("POST", "/exec/" + exec_id + "/start", body={"Detach": False, "Tty": False}, timeout=timeout)
+
+    def exec_exit_code(self, exec_id, timeout=None):
+        # None while the command is still running
+        return self.call("GET", "/exec/" + exec_id + "/json", timeout=timeout)["ExitCode"]
+
+    def export_image(self, image, path, timeout=None):
+        """
+        Write the docker archive of an image to path, raises socket.timeout when it takes longer than timeout seconds
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        connection, response = self.stream("GET", "/images/" + quote(image, safe="/:@") + "/get", timeout=timeout)
+        try:
+            with open(path, "wb") as f:
+                while True:
+                    chunk = response.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise socket.timeout("the export of " + image + " timed out")
+        finally:
+            connection.close()
+
+    def disk_usage(self, timeout=None):
+        return self.call("GET", "/system/df", {"type": "image"}, timeout=timeout).get("LayersSize")
+
+    def prune(self, timeout=None):
+        self.call("POST", "/containers/prune", timeout=timeout)
+        self.call("POST", "/images/prune", {"filters": json.dumps({"dangling": ["false"]})}, timeout=timeout)
+        self.call("POST", "/networks/prune", timeout=timeout)
+        self.call("POST", "/build/prune", {"all": 1}, timeout=timeout)
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class DockerApiBackend:
+    """
+    Talks to the docker daemon through the Engine API on its unix socket, without forking the docker CLI
+    """
+    def __init__(self, client=None, limits=None, command_timeout=None):
+        self.client = client if client is not None else DockerEngineClient()
+        # Optional semaphores per stage shared by the images of a batch, like the CLI commands hold them
+        self.limits = limits if limits is not None else {}
+        # Seconds a call of a stage may take (the command_timeout of the scanner), no limit without one
+        self.command_timeout = command_timeout
+
+    def for_scan(self, command_timeout):
+        """
+        Backend of one image scan, sharing the client and the limits, whose calls end at the timeouts of the scan
+        """
+        return DockerApiBackend(self.client, self.limits, command_timeout)
+
+    def timeout(self, stage):
+        return self.command_timeout(stage) if self.command_timeout is not None else None
+
+    @contextmanager
+    def hold(self, stage):
+        """
+        Hold the slot of the stage and yield the seconds its call may take, None without a timeout; 0 when the slot
+        or the deadline did not leave any time, the call is skipped then
+        """
+        limit = self.limits.get(stage)
+        timeout = self.timeout(stage)
+        if timeout is not None and timeout <= 0:
+            yield 0
+            return
+        if limit is None:
+            yield timeout
+            return
+        if not (limit.acquire() if timeout is None else limit.acquire(timeout=timeout)):
+            yield 0
+            return
+        try:
+            # the wait for the slot counts against the call
+            yield self.timeout(stage)
+        finally:
+            limit.release()
+
+    @contextmanager
+    def expiry(self, timeout, expire):
+        """
+        Call expire from a timer thread once timeout seconds have passed, the yielded event is set when it did
+        """
+        expired = threading.Event()
+
+        def kill():
+            expired.set()
+            expire()
+        killer = threading.Timer(timeout, kill) if timeout is not None else None
+        if killer is not None:
+            killer.start()
+        try:
+            yield expired
+        finally:
+            if killer is not None:
+                killer.cancel()
+
+    def binds(self, mount):
+        return [os.getcwd() + ":/eol-mount/"] if mount else []
+
+    def failed(self, argv, returncode, error):
+        # Same shape as a failed docker CLI run so the probe parsers skip it
+        return subprocess.CompletedProcess(argv, returncode, b"", ("docker: Error response from daemon: " + str(error)).encode())
+
+    def timed_out(self, argv, timeout, stdout=b"", stderr=b""):
+        # without a stage timeout the socket timeout of the client ended the call
+        return TimedOutProcess(argv, timeout if timeout is not None else self.client.timeout, stdout, stderr)
+
+    def pull_image(self, image):
+        argv = ["docker", "pull", image]
+        with self.hold("pull") as timeout:
+            if timeout is not None and timeout <= 0:
+                return TimedOutProcess(argv, 0, skipped=True)
+            try:
+                self.client.pull_image(image, registry_auth(image), timeout)
+            except DockerApiError as e:
+                return self.failed(argv, 1, e.message)
+            except socket.timeout:
+                return self.timed_out(argv, timeout)
+        return subprocess.CompletedProcess(argv, 0, b"", b"")
+
+    def remote_digest(self, image):
+        """
+        Digest of the image in its registry without pulling it, None when it cannot be read
+        """
+        with self.hold("pull") as timeout:
+            if timeout is not None and timeout <= 0:
+                return None
+            try:
+                return self.client.distribution(image, registry_auth(image), timeout)["Descriptor"]["digest"]
+            except (DockerApiError, socket.timeout, KeyError, TypeError):
+                return None
+
+    def create_container(self, image, entrypoint, arguments, mount, timeout, open_stdin=False):
+        """
+        Create a container of the image, pulling the image first when the daemon does not have it, as docker run does
+        """
+        try:
+            return self.client.create_container(image, entrypoint, arguments, self.binds(mount), open_stdin, timeout)
+        except DockerApiError as e:
+            if e.status != 404 or "No such image" not in e.message:
+                raise
+            pulled = self.pull_image(image)
+            if pulled.returncode != 0:
+                raise DockerApiError(e.status, e.message + ", " + pulled.stderr.decode(errors="replace").strip())
+        return self.client.create_container(image, entrypoint, arguments, self.binds(mount), open_stdin, timeout)
+
+    def run(self, image, entrypoint, arguments, mount=False):
+        argv = [entrypoint] + arguments
+        with self.hold("run") as timeout:
+            if timeout is not None and timeout <= 0:
+                return TimedOutProcess(argv, 0, skipped=True)
+            try:
+                container_id = self.create_container(image, entrypoint, arguments, mount, timeout)
+            except DockerApiError as e:
+                return self.failed(argv, 125, e.message)
+            except socket.timeout:
+                return self.timed_out(argv, timeout)
+            try:
+                if timeout is not None:
+                    # a pull of the image counts against the run, like the implicit pull of docker run
+                    timeout = self.timeout("run")
+                    if timeout <= 0:
+                        return TimedOutProcess(argv, 0, skipped=True)
+                return self.run_container(argv, container_id, timeout)
+            finally:
+                self.client.remove_container(container_id, self.timeout("cleanup"))
+
+    def run_container(self, argv, container_id, timeout):
+        """
+        Attach to a created container, start it and wait for its exit. At the timeout the container is removed, which
+        ends its attach stream, the way the CLI backend removes the container of a killed docker client.
+        """
+        stdout, stderr = b"", b""
+        with self.expiry(timeout, lambda: self.client.remove_container(container_id, self.timeout("cleanup"))) as expired:
+            try:
+                # attach before start so no output is lost
+                connection, response = self.client.attach_container(container_id, timeout)
+                try:
+                    self.client.start_container(container_id, timeout)
+                    stdout, stderr = read_multiplexed(response)
+                finally:
+                    connection.close()
+                returncode = self.client.wait_container(container_id, timeout)
+            except DockerApiError as e:
+                # a container removed at the timeout can no longer be started or waited for
+                if not expired.is_set():
+                    return self.failed(argv, 127, e.message)
+            except socket.timeout:
+                expired.set()
+        if expired.is_set():
+            return self.timed_out(argv, timeout, stdout, stderr)
+        return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
+
+    def start_idle(self, image, entrypoint, arguments, mount=True):
+        with self.hold("run") as timeout:
+            if timeout is not None and timeout <= 0:
+                return None
+            try:
+                container_id = self.create_container(image, entrypoint, arguments, mount, timeout, open_stdin=True)
+            except (DockerApiError, socket.timeout):
+                return None
+            try:
+                self.client.start_container(container_id, timeout)
+            except (DockerApiError, socket.timeout):
+                self.client.remove_container(container_id, self.timeout("cleanup"))
+                return None
+            return container_id
+
+    def is_running(self, container_id):
+        try:
+            state = self.client.inspect_container(container_id, self.timeout("run"))
+        except socket.timeout:
+            return False
+        return state is not None and state["State"]["Running"]
+
+    def exec(self, container_id, entrypoint, arguments):
+        argv = [entrypoint] + arguments
+        with self.hold("run") as timeout:
+            if timeout is not None and timeout <= 0:
+                return TimedOutProcess(argv, 0, skipped=True)
+            stdout, stderr = b"", b""
+            try:
+                exec_id = self.client.create_exec(container_id, argv, timeout)
+                connection, response = self.client.start_exec(exec_id, timeout)
+                try:
+                    # like a killed docker exec client, the command is left to the removal of the probe container
+                    with self.expiry(timeout, lambda: interrupt(connection)) as expired:
+                        stdout, stderr = read_multiplexed(response)
+                finally:
+                    connection.close()
+                if expired.is_set():
+                    return self.timed_out(argv, timeout, stdout, stderr)
+                returncode = self.client.exec_exit_code(exec_id, timeout)
+            except DockerApiError as e:
+                return self.failed(argv, 126, e.message)
+            except socket.timeout:
+                return self.timed_out(argv, timeout, stdout, stderr)
+        return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
+
+    def remove_container(self, container_id):
+        self.client.remove_container(container_id, self.timeout("cleanup"))
+
+    def remove_image(self, image):
+        try:
+            self.client.remove_image(image, self.timeout("cleanup"))
+            return True
+        except (DockerApiError, socket.timeout):
+            return False
+
+    def image_digests(self, image):
+        inspect = self.client.image_inspect(image, self.timeout("run"))
+        if inspect is None:
+            return None
+        return inspect.get("RepoDigests") or [], inspect.get("Id")
+
+    def image_layers(self, image):
+        inspect = self.client.image_inspect(image, self.timeout("run"))
+        history = self.client.image_history(image, self.timeout("run"))
+        if inspect is None or history is None:
+            return None
+        # the daemon lists the history newest first
+        return inspect.get("RootFS", {}).get("Layers") or [], [(entry.get("Size", 1), entry.get("CreatedBy") or "") for entry in history[::-1]]
+
+    def save_image(self, image, path):
+        with self.hold("pull") as timeout:
+            if timeout is not None and timeout <= 0:
+                raise Exception("docker save failed: timeout: skipped, the deadline has passed")
+            try:
+                self.client.export_image(image, path, timeout)
+            except DockerApiError as e:
+                raise Exception("docker save failed: " + e.message)
+            except socket.timeout:
+                raise Exception("docker save failed: " + self.timed_out(["docker", "save"], timeout).stderr.decode())
+
+    def disk_usage(self):
+        try:
+            return self.client.disk_usage(self.timeout("cleanup"))
+        except (DockerApiError, socket.timeout):
+            return None
+
+    def prune(self):
+        self.client.prune(self.timeout("cleanup"))
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from commandExecutor import get_executor
+
+eol_api_url = "https://endoflife.date/api/"
+eol_products = ["go", "python", "node", "ruby", "react", "php",
+                "kotlin", "java", "laravel", "jquery", "django", "angular"]
+
+
+class EOLDataLoader:
+    """
+    Loads the endoflife.date cycles of every product, from a snapshot file, the on-disk cache or the API
+    """
+    def __init__(self, logger, cache_dir=None, snapshot=None, ttl=24 * 3600, timeout=(5, 30), workers=6):
+        self.logger = logger
+        self.cache_dir = cache_dir
+        self.snapshot = snapshot
+        self.ttl = ttl
+        self.timeout = timeout
+        self.workers = workers
+        self.session = None
+        # Fetches the API for real, or records / replays the responses
+        self.executor = get_executor()
+
+    def get_session(self):
+        if self.session is None:
+            # requests is only needed when the data actually comes from the network
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            self.session = requests.Session()
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=retry)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        return self.session
+
+    def cache_file(self, product):
+        return os.path.join(self.cache_dir, product + ".json")
+
+    def read_cache(self, product):
+        if self.cache_dir is None or not os.path.exists(self.cache_file(product)):
+            return None
+        try:
+            with open(self.cache_file(product)) as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.info("Exception while reading the cached EOL data of " + product + " " + str(e))
+            return None
+
+    def write_cache(self, product, entry):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temporary = self.cache_file(product) + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(entry, f)
+        os.replace(temporary, self.cache_file(product))
+
+    def fetch_product(self, product):
+        """
+        Cycles of one product, revalidating a stale cache entry with ETag / Last-Modified; None when neither the API
+        nor the cache has them
+        """
+        cached = self.read_cache(product)
+        if cached is not None and time.time() - cached["fetched"] < self.ttl:
+            return cached["data"]
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            response = self.executor.http_get(self.get_session, eol_api_url + product + ".json", headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and cached is not None:
+                cached["fetched"] = time.time()
+                self.write_cache(product, cached)
+                return cached["data"]
+            response.raise_for_status()
+            data = response.json()
+            self.write_cache(product, {"fetched": time.time(), "etag": response.headers.get("etag"),
+                                       "last_modified": response.headers.get("last-modified"), "data": data})
+            return data
+        except Exception as e:
+            self.logger.info("Exception while getting EOL data of " + product + " " + str(e))
+            if cached is not None:
+                self.logger.info("Using the stale cached EOL data of " + product)
+                return cached["data"]
+            # None marks the product unknown, an empty list would report its versions as supported
+            self.logger.warning("No EOL data of " + product + ", the EOL status of its versions is not evaluated")
+            return None
+
+    def load_snapshot(self):
+        self.logger.info("Loading EOL data from the snapshot " + self.snapshot)
+        with open(self.snapshot) as f:
+            snapshot = json.load(f)
+        # a product missing from the snapshot is unknown, like a failed fetch
+        return {product: snapshot.get(product) for product in eol_products}
+
+    def load(self):
+        """
+        Raw endoflife.date cycles of every product, None for the products whose data could not be loaded
+        """
+        if self.snapshot is not None:
+            return self.load_snapshot()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            data = list(executor.map(self.fetch_product, eol_products))
+        return dict(zip(eol_products, data))
+
+    def save_snapshot(self, path, raw_data):
+        """
+        Write the loaded data as a snapshot file for hosts without network access
+        """
+        with open(path, "w") as f:
+            json.dump({product: cycles for product, cycles in raw_data.items() if cycles is not None}, f)
+        self.logger.info("EOL data snapshot written to " + path)
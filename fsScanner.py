@@ -0,0 +1,505 @@
+import json
+import os
+import posixpath
+import re
+import shutil
+import sqlite3
+import struct
+import tarfile
+import tempfile
+from scanImage import ImageScanner, language_package_prefixes
+from sbomStream import parse_syft_layer, summarize_artifacts
+
+# Files read from the image layers, everything else in a layer is skipped without being extracted
+os_release_paths = ["etc/os-release", "usr/lib/os-release"]
+package_database_paths = {
+    "dpkg": "var/lib/dpkg/status",
+    "apk": "lib/apk/db/installed",
+    "rpm": "var/lib/rpm/rpmdb.sqlite",
+    "rpm-sysimage": "usr/lib/sysimage/rpm/rpmdb.sqlite",
+    "rpm-bdb": "var/lib/rpm/Packages",
+}
+wanted_file_patterns = [
+    re.compile(r"^var/lib/dpkg/status\.d/[^/]+$"),
+    re.compile(r"^usr/(?:local/)?include/python\d+\.\d+[a-z]*/patchlevel\.h$"),
+    re.compile(r"^usr/(?:local/)?lib/python\d+\.\d+/os\.py$"),
+    re.compile(r"^usr/(?:local/go|lib/go[^/]*)/VERSION$"),
+    re.compile(r"^usr/(?:local/)?include/node/node_version\.h$"),
+    re.compile(r"^usr/(?:local/)?include/php[^/]*/main/php_version\.h$"),
+    re.compile(r"^usr/(?:local/)?lib/ruby/\d+\.\d+\.\d+/[^/]+/rbconfig\.rb$"),
+    re.compile(r"(?:^|/)(?:jvm/[^/]+|openjdk[^/]*|jdk[^/]*|jre[^/]*|java[^/]*)/release$"),
+]
+max_wanted_file_size = 64 * 1024 * 1024
+
+python_patchlevel_pattern = re.compile(r"^usr/(?:local/)?include/python(\d+\.\d+)[a-z]*/patchlevel\.h$")
+python_library_pattern = re.compile(r"^usr/(?:local/)?lib/python(\d+\.\d+)/os\.py$")
+go_version_pattern = re.compile(r"^usr/(?:local/go|lib/go[^/]*)/VERSION$")
+node_version_pattern = re.compile(r"^usr/(?:local/)?include/node/node_version\.h$")
+php_version_pattern = re.compile(r"^usr/(?:local/)?include/php[^/]*/main/php_version\.h$")
+ruby_config_pattern = re.compile(r"^usr/(?:local/)?lib/ruby/\d+\.\d+\.\d+/[^/]+/rbconfig\.rb$")
+java_release_pattern = wanted_file_patterns[-1]
+
+# rpm header tags https://github.com/rpm-software-management/rpm/blob/master/include/rpm/rpmtag.h
+rpm_tags = {1000: "name", 1001: "version", 1002: "release", 1022: "arch"}
+
+
+def clean_path(name):
+    if name.startswith("./"):
+        name = name[2:]
+    return posixpath.normpath(name.lstrip("/"))
+
+
+def extract_member(layer, member, path, root):
+    """
+    Write a regular file or directory of a layer under root so syft can catalog the layer on its own
+    """
+    if path == ".." or path.startswith("../"):
+        return
+    target = os.path.join(root, path)
+    try:
+        if member.isdir():
+            os.makedirs(target, exist_ok=True)
+        elif member.isfile():
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                shutil.copyfileobj(layer.extractfile(member), f)
+        elif member.islnk():
+            # symlinks are not written, an absolute target would point syft at the host
+            source = os.path.join(root, clean_path(member.linkname))
+            if os.path.isfile(source):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+    except OSError:
+        pass
+
+
+def removed_by(path, prefixes):
+    path = path.lstrip("/")
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in prefixes)
+
+
+def version_key(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version))
+
+
+class FilesystemScanner(ImageScanner):
+    """
+    Scan an image from its saved archive (docker save) or exported root filesystem (docker export)
+    without ever running a container of the image
+    """
+    scan_backend = "filesystem"
+
+    def __init__(self, image, limits=None, image_tar=None, sbom_dir=None, docker_backend=None, layer_cache=None):
+        super().__init__(image, limits, probe_session=False, sbom_dir=sbom_dir, docker_backend=docker_backend)
+        self.image_tar = image_tar
+        self.saved_image_tar = None
+        # root filesystem of a docker export tarball extracted for syft, which cannot read such a tarball itself
+        self.extracted_root = None
+        self.files = None
+        self.config = {}
+        # With a layer cache every layer is also cataloged by syft on its own, and unchanged layers are never read again
+        self.layer_cache = layer_cache
+        self.layers = None
+        self.layers_reused = 0
+
+    def wanted(self, path):
+        if path in os_release_paths or path in package_database_paths.values():
+            return True
+        for pattern in wanted_file_patterns:
+            if pattern.search(path):
+                return True
+        return False
+
+    def collect_layer(self, layer, extract_to=None):
+        """
+        Collect the wanted files, whiteouts and opaque directories of a single layer tar stream,
+        extracting the whole layer under extract_to when it is given
+        """
+        findings = {"files": {}, "whiteouts": [], "opaque": []}
+        for member in layer:
+            path = clean_path(member.name)
+            if path == ".":
+                continue
+            directory, base_name = posixpath.split(path)
+            if base_name == ".wh..wh..opq":
+                findings["opaque"].append(directory)
+                continue
+            if base_name.startswith(".wh."):
+                findings["whiteouts"].append(posixpath.join(directory, base_name[4:]))
+                continue
+            if extract_to is not None:
+                extract_member(layer, member, path, extract_to)
+            if not self.wanted(path):
+                continue
+            if member.issym():
+                findings["files"][path] = ("symlink", member.linkname)
+            elif member.islnk():
+                findings["files"][path] = ("hardlink", clean_path(member.linkname))
+            elif member.isfile() and member.size <= max_wanted_file_size:
+                if extract_to is not None:
+                    with open(os.path.join(extract_to, path), "rb") as f:
+                        findings["files"][path] = f.read()
+                else:
+                    findings["files"][path] = layer.extractfile(member).read()
+        return findings
+
+    def layer_findings(self, diff_id, open_layer):
+        """
+        Findings of one layer from the layer cache, or read from the tar stream open_layer() yields and cached
+        """
+        if diff_id is not None and self.layer_cache is not None:
+            findings = self.layer_cache.get(diff_id)
+            if findings is not None:
+                self.layers_reused += 1
+                return findings
+        self.logger.info("Reading the layer " + str(diff_id) + " of " + self.image_to_scan)
+        if diff_id is None or self.layer_cache is None:
+            with open_layer() as layer:
+                return self.collect_layer(layer)
+        extract_to = tempfile.mkdtemp(prefix="eol-layer-")
+        try:
+            with open_layer() as layer:
+                findings = self.collect_layer(layer, extract_to)
+            layer_sbom = self.scan_layer(extract_to)
+        finally:
+            shutil.rmtree(extract_to, ignore_errors=True)
+        if layer_sbom is not None:
+            findings.update(layer_sbom)
+            self.layer_cache.put(diff_id, findings)
+        return findings
+
+    def scan_layer(self, path):
+        """
+        Run syft on the files of a single layer, None when syft fails
+        """
+        def consume(stdout):
+            try:
+                return parse_syft_layer(stdout)
+            except ValueError as e:
+                self.logger.info("Exception while parsing the syft output of a layer " + str(e))
+                return None
+
+        try:
+            syft_op, layer_sbom = self.stream_command(["syft", "--config", self.syft_path, "dir:" + path, "-o", "json"], consume, "syft")
+        except Exception as e:
+            self.logger.info("Exception while running syft on a layer " + str(e))
+            return None
+        if syft_op.returncode != 0:
+            self.logger.info("syft failed on a layer of " + self.image_to_scan + " " + syft_op.stderr.decode().strip())
+            return None
+        return layer_sbom
+
+    def diff_ids(self, count):
+        diff_ids = self.config.get("rootfs", {}).get("diff_ids") or []
+        return diff_ids if len(diff_ids) == count else [None] * count
+
+    def layered_sbom(self):
+        """
+        SBOM of the image merged from the per-layer syft findings, honouring whiteouts and opaque directories,
+        None when a layer has no findings of its own
+        """
+        if not self.layers or any("artifacts" not in layer for layer in self.layers):
+            return None
+        artifacts = {}
+        distro = None
+        artifact_count = 0
+        for layer in self.layers:
+            removed = layer["whiteouts"] + layer["opaque"]
+            artifacts = {key: found for key, found in artifacts.items() if not any(removed_by(path, removed) for path in found[2])}
+            for name, version, paths in layer["artifacts"]:
+                # a file replaced by an upper layer takes the place of the lower one
+                artifacts[(name, tuple(paths) or version)] = [name, version, paths]
+            artifact_count += layer["artifactCount"]
+            if layer.get("distro") and layer["distro"].get("prettyName"):
+                distro = layer["distro"]
+        return {"distro": distro, "artifactCount": artifact_count,
+                "extracted": summarize_artifacts(list(artifacts.values()), artifact_count)}
+
+    def merge_layers(self, layers):
+        """
+        Merge the per-layer findings bottom to top, honouring whiteouts and opaque directories
+        """
+        files = {}
+        for layer in layers:
+            for directory in layer["opaque"]:
+                prefix = directory + "/"
+                files = {path: content for path, content in files.items() if not path.startswith(prefix)}
+            for removed in layer["whiteouts"]:
+                prefix = removed + "/"
+                files = {path: content for path, content in files.items() if path != removed and not path.startswith(prefix)}
+            files.update(layer["files"])
+        return files
+
+    def read_file(self, path, depth=0):
+        """
+        Content of a file in the merged filesystem, following symlinks
+        """
+        content = self.files.get(path)
+        if isinstance(content, tuple) and depth < 10:
+            kind, target = content
+            if kind == "symlink":
+                target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+            return self.read_file(target, depth + 1)
+        if isinstance(content, tuple):
+            return None
+        return content
+
+    def save_image(self):
+        """
+        Save the image into a temporary docker archive, pulling it first when it is not present
+        """
+        if self.docker.image_digests(self.image_to_scan) is None:
+            self.pull_image()
+        handle, path = tempfile.mkstemp(prefix="eol-scan-", suffix=".tar")
+        os.close(handle)
+        self.logger.info("Saving the image " + self.image_to_scan + " to " + path)
+        try:
+            self.docker.save_image(self.image_to_scan, path)
+        except Exception:
+            os.remove(path)
+            raise
+        self.saved_image_tar = path
+        return path
+
+    def read_archive(self, path):
+        """
+        Read the layers of a docker save archive, or the single root filesystem of a docker export tarball
+        """
+        with tarfile.open(path) as archive:
+            names = archive.getnames()
+            if "manifest.json" not in names:
+                self.extracted_root = tempfile.mkdtemp(prefix="eol-rootfs-")
+                return [self.collect_layer(archive, self.extracted_root)], {}
+            manifest = json.load(archive.extractfile("manifest.json"))[0]
+            self.config = json.load(archive.extractfile(manifest["Config"]))
+            layers = []
+            for layer_name, diff_id in zip(manifest["Layers"], self.diff_ids(len(manifest["Layers"]))):
+                layers.append(self.layer_findings(diff_id, lambda: tarfile.open(fileobj=archive.extractfile(layer_name), mode="r:*")))
+            return layers, self.config
+
+    def load_filesystem(self):
+        if self.files is not None:
+            return
+        path = self.image_tar if self.image_tar is not None else self.save_image()
+        self.layers, self.config = self.read_archive(path)
+        self.files = self.merge_layers(self.layers)
+        # syft reads the same archive so the image is never run nor read twice from the daemon
+        if self.config:
+            self.syft_source = "docker-archive:" + path
+        else:
+            self.syft_source = "dir:" + self.extracted_root
+
+    def resolve_digest(self):
+        """
+        Config digest of the given tarball, or the digest of the image in the docker daemon
+        """
+        if self.image_tar is None:
+            return super().resolve_digest()
+        try:
+            with tarfile.open(self.image_tar) as archive:
+                manifest = json.load(archive.extractfile("manifest.json"))[0]
+            config_name = posixpath.basename(manifest["Config"])
+            return "sha256:" + config_name.replace(".json", "")
+        except Exception as e:
+            self.logger.info("Unable to read the config digest of " + self.image_tar + " " + str(e))
+            return None
+
+    def get_os_name_general(self):
+        """
+        Get the os name from the os-release file of the image filesystem
+        """
+        self.logger.info("Going to read os-release from the filesystem of the image " + self.image_to_scan)
+        for path in os_release_paths:
+            content = self.read_file(path)
+            if content:
+                processed_data = [line.strip() for line in content.decode(errors="replace").splitlines()]
+                return [line for line in processed_data if "NAME" in line or "PRETTY_NAME" in line or "VERSION" in line]
+
+    def read_dpkg_packages(self):
+        paragraphs = []
+        status = self.read_file(package_database_paths["dpkg"])
+        if status:
+            paragraphs.extend(status.decode(errors="replace").split("\n\n"))
+        # distroless images keep one status file per package
+        for path in sorted(self.files):
+            if path.startswith("var/lib/dpkg/status.d/") and not path.endswith(".md5sums"):
+                content = self.read_file(path)
+                if content:
+                    paragraphs.extend(content.decode(errors="replace").split("\n\n"))
+        packages = []
+        for paragraph in paragraphs:
+            fields = dict(re.findall(r"^([\w-]+):\s*(.*)$", paragraph, re.MULTILINE))
+            if "Package" not in fields or "Version" not in fields:
+                continue
+            if "Status" in fields and not fields["Status"].endswith(" installed"):
+                continue
+            packages.append(fields["Package"] + "/now " + fields["Version"] + " " + fields.get("Architecture", "") + " [installed]")
+        return packages
+
+    def read_apk_packages(self):
+        installed = self.read_file(package_database_paths["apk"])
+        packages = []
+        if not installed:
+            return packages
+        for record in installed.decode(errors="replace").split("\n\n"):
+            fields = dict(re.findall(r"^(\w):(.*)$", record, re.MULTILINE))
+            if "P" not in fields or "V" not in fields:
+                continue
+            packages.append(fields["P"] + "-" + fields["V"] + " " + fields.get("A", "") + " {" + fields.get("o", fields["P"]) + "} (" + fields.get("L", "") + ") [installed]")
+        return packages
+
+    def parse_rpm_header(self, blob):
+        index_count, _ = struct.unpack(">ii", blob[:8])
+        data_start = 8 + index_count * 16
+        header = {}
+        for i in range(index_count):
+            tag, tag_type, offset, _ = struct.unpack(">iiii", blob[8 + i * 16:24 + i * 16])
+            # type 6 is a NUL terminated string
+            if tag in rpm_tags and tag_type == 6:
+                end = blob.index(b"\0", data_start + offset)
+                header[rpm_tags[tag]] = blob[data_start + offset:end].decode(errors="replace")
+        return header
+
+    def read_rpm_packages(self):
+        packages = []
+        for database in ["rpm", "rpm-sysimage"]:
+            content = self.read_file(package_database_paths[database])
+            if not content:
+                continue
+            handle, path = tempfile.mkstemp(suffix=".sqlite")
+            try:
+                with os.fdopen(handle, "wb") as f:
+                    f.write(content)
+                connection = sqlite3.connect(path)
+                try:
+                    for (blob,) in connection.execute("SELECT blob FROM Packages"):
+                        header = self.parse_rpm_header(blob)
+                        if "name" in header:
+                            packages.append(header["name"] + "-" + header.get("version", "") + "-" + header.get("release", "") + "." + header.get("arch", ""))
+                finally:
+                    connection.close()
+            finally:
+                os.remove(path)
+            return packages
+        if self.read_file(package_database_paths["rpm-bdb"]):
+            self.logger.info("Berkeley DB rpm database is not supported by the filesystem scan for the image " + self.image_to_scan)
+        return packages
+
+    def get_languages_by_os(self, os_name):
+        """
+        Get installed programming languages from the package database files of the image
+        """
+        result_data = []
+        try:
+            if os_name is None:
+                return result_data
+            osname = os_name.lower()
+            if "alpine" in osname:
+                packages = self.read_apk_packages()
+            elif "debian" in osname or "ubuntu" in osname or "distroless" in osname:
+                packages = self.read_dpkg_packages()
+            else:
+                packages = self.read_rpm_packages()
+            result_data = [line for line in packages if line.startswith(language_package_prefixes)]
+            return result_data
+        except Exception as e:
+            self.logger.info("Exception while reading the package database " + str(e))
+            return result_data
+
+    def config_env(self):
+        env = {}
+        for item in self.config.get("config", {}).get("Env", None) or []:
+            key, _, value = item.partition("=")
+            env[key] = value
+        return env
+
+    def run_individual_language_command(self):
+        """
+        Get the default language versions from interpreter version files instead of running them
+        """
+        self.logger.info("Going to read language version files for the image : " + self.image_to_scan)
+        resultant_data = {}
+        try:
+            env = self.config_env()
+            python_versions, java_versions = [], []
+            for path in self.files:
+                matched = python_patchlevel_pattern.search(path)
+                if matched:
+                    content = self.read_file(path) or b""
+                    version = re.search(rb'#define PY_VERSION\s+"([^"+]+)', content)
+                    python_versions.append(version.group(1).decode() if version else matched.group(1))
+                    continue
+                matched = python_library_pattern.search(path)
+                if matched:
+                    version = matched.group(1)
+                    # Prefer the full version of the official images when it belongs to this interpreter
+                    if env.get("PYTHON_VERSION", "").startswith(version + "."):
+                        version = env["PYTHON_VERSION"]
+                    python_versions.append(version)
+                    continue
+                if go_version_pattern.search(path):
+                    content = (self.read_file(path) or b"").decode(errors="replace").strip()
+                    if content.startswith("go"):
+                        architecture = self.config.get("architecture", "amd64")
+                        resultant_data["go"] = "go version " + content.splitlines()[0] + " linux/" + architecture
+                    continue
+                if node_version_pattern.search(path):
+                    content = self.read_file(path) or b""
+                    parts = [re.search(rb"#define NODE_" + part + rb"_VERSION (\d+)", content) for part in [b"MAJOR", b"MINOR", b"PATCH"]]
+                    if None not in parts:
+                        resultant_data["node"] = "v" + ".".join(part.group(1).decode() for part in parts)
+                    continue
+                if php_version_pattern.search(path):
+                    version = re.search(rb'#define PHP_VERSION "([^"]+)"', self.read_file(path) or b"")
+                    if version:
+                        resultant_data["php"] = "PHP " + version.group(1).decode() + " (cli)"
+                    continue
+                if ruby_config_pattern.search(path):
+                    version = re.search(rb'CONFIG\["RUBY_PROGRAM_VERSION"\] = "([^"]+)"', self.read_file(path) or b"")
+                    if version:
+                        resultant_data["ruby"] = "ruby " + version.group(1).decode()
+                    continue
+                if java_release_pattern.search(path):
+                    version = re.search(rb'^JAVA_VERSION="([^"]+)"', self.read_file(path) or b"", re.MULTILINE)
+                    if version:
+                        java_versions.append(version.group(1).decode())
+            for version in sorted(set(python_versions), key=version_key):
+                language = "python2" if version.startswith("2") else "python3"
+                resultant_data[language] = "Python " + version
+            if java_versions:
+                resultant_data["java"] = 'openjdk version "' + max(java_versions, key=version_key) + '"'
+        except Exception as e:
+            self.logger.info("Exception while reading language version files " + str(e))
+        return resultant_data
+
+    def get_sbom(self):
+        if self.sbom is None and self.layer_cache is not None:
+            self.sbom = self.layered_sbom()
+            if self.sbom is not None:
+                self.logger.info("Merged the SBOM of " + self.image_to_scan + " from its layers, " + str(self.layers_reused) + " layers reused")
+        return super().get_sbom()
+
+    def get_scan_image(self, syft_path="utils/syft.template.yml"):
+        self.syft_path = syft_path
+        self.start_deadline()
+        try:
+            with self.stage("load-filesystem"):
+                self.load_filesystem()
+        except Exception as e:
+            self.logger.info("Exception while reading the filesystem of the image " + self.image_to_scan + " " + str(e))
+            self.files = {}
+        return super().get_scan_image(syft_path)
+
+    def cleanup_image(self):
+        """
+        Delete the temporary archive and extracted root filesystem, and the image only when it was saved from the docker daemon
+        """
+        if self.extracted_root is not None:
+            shutil.rmtree(self.extracted_root, ignore_errors=True)
+            self.extracted_root = None
+        if self.saved_image_tar is None:
+            return
+        if os.path.exists(self.saved_image_tar):
+            os.remove(self.saved_image_tar)
+        self.saved_image_tar = None
+        super().cleanup_image()
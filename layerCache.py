@@ -0,0 +1,57 @@
+import base64
+import json
+import os
+from sqliteLru import SqliteLru
+
+
+def encode_findings(findings):
+    files = {}
+    for path, content in findings["files"].items():
+        if isinstance(content, tuple):
+            files[path] = {content[0]: content[1]}
+        else:
+            files[path] = {"data": base64.b64encode(content).decode()}
+    return json.dumps(dict(findings, files=files))
+
+
+def decode_findings(data):
+    findings = json.loads(data)
+    files = {}
+    for path, content in findings["files"].items():
+        if "data" in content:
+            files[path] = base64.b64decode(content["data"])
+        else:
+            kind, target = next(iter(content.items()))
+            files[path] = (kind, target)
+    findings["files"] = files
+    return findings
+
+
+class LayerCache:
+    """
+    Persistent findings of single image layers keyed by layer diff id, evicting the least recently used layers over a size limit
+    """
+    def __init__(self, cache_dir, logger, max_bytes=1024 * 1024 * 1024):
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.store = SqliteLru(os.path.join(cache_dir, "layer-cache.sqlite"), logger, "layers", "diff_id", "findings", max_bytes,
+                               label="layer cache")
+
+    def get(self, diff_id):
+        """
+        Cached findings of a layer ({"files", "whiteouts", "opaque", "artifacts", "artifactCount", "distro"}), or None
+        """
+        data = self.store.get(diff_id)
+        return decode_findings(data) if data is not None else None
+
+    def put(self, diff_id, findings):
+        self.store.put(diff_id, encode_findings(findings))
+
+    def invalidate(self, diff_id=None):
+        return self.store.invalidate(diff_id)
+
+    def stats(self):
+        return self.store.stats()
+
+    def close(self):
+        self.store.close()
@@ -1,34 +1,254 @@
-import sys
-from scanImage import ImageScanner
-from addEolStatus import EOLArtifacts
+import argparse
+import json
 import logging
-import pandas as pd
 
 logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger("eol-images-scan")
 
 
+def stage_timeout(value):
+    stage, _, seconds = value.partition("=")
+    if stage not in ("pull", "run", "syft", "cleanup"):
+        raise argparse.ArgumentTypeError("unknown stage " + stage + ", expected pull, run, syft or cleanup")
+    try:
+        return stage, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected STAGE=SECONDS, got " + value)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Identify End-of-Life programming languages in docker images")
+    parser.add_argument("image", nargs="?", help="docker image with tag to scan")
+    parser.add_argument("--batch", metavar="FILE", help="file with one image per line to scan concurrently ('-' reads stdin)")
+    parser.add_argument("--workers", type=int, default=4, help="number of images scanned at once in batch mode")
+    parser.add_argument("--pull-limit", type=int, default=2, help="maximum concurrent docker pulls in batch mode")
+    parser.add_argument("--run-limit", type=int, default=4, help="maximum concurrent docker runs in batch mode")
+    parser.add_argument("--syft-limit", type=int, default=2, help="maximum concurrent syft runs in batch mode")
+    parser.add_argument("--prefetch", type=int, default=2, help="images pulled ahead of the running scans in batch mode")
+    parser.add_argument("--disk-budget-gb", type=float,
+                        help="keep pulled images up to this much image layer disk usage, evicting the least recently used ones (batch mode)")
+    parser.add_argument("--backend", choices=["container", "filesystem", "registry"], default="container",
+                        help="probe running containers, read the saved image filesystem without running it, or stream the layers from the registry without a docker daemon")
+    parser.add_argument("--insecure-registry", metavar="HOST", action="append", default=[],
+                        help="registry reached over plain http by the registry backend (localhost is always allowed)")
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync",
+                        help="run the stages of a container scan one after another, or overlap them on an asyncio loop")
+    parser.add_argument("--docker", choices=["cli", "api"], default="cli",
+                        help="drive docker through the docker CLI, or through the Engine API on the daemon socket")
+    parser.add_argument("--docker-socket", metavar="PATH", help="docker daemon socket for --docker api (default: DOCKER_HOST or /var/run/docker.sock)")
+    parser.add_argument("--image-tar", metavar="FILE", help="docker save or docker export tarball of the image (filesystem backend)")
+    parser.add_argument("--sbom-dir", metavar="DIR", help="persist the syft SBOM of every image here and reuse it on later runs")
+    parser.add_argument("--cache-dir", metavar="DIR", help="reuse scan results of image digests that were already scanned")
+    parser.add_argument("--layer-cache-dir", metavar="DIR",
+                        help="keep the findings of every image layer and rescan only the layers that changed (filesystem and registry backends)")
+    parser.add_argument("--share-base-scans", action="store_true",
+                        help="detect the os and its packages once per base layer chain and reuse them for the images built on it (container backend)")
+    parser.add_argument("--base-chain-dir", metavar="DIR", help="keep the shared base chain scans here across runs (implies --share-base-scans)")
+    parser.add_argument("--cache-max-mb", type=int, default=512, help="size limit of the scan cache, least recently used entries are evicted")
+    parser.add_argument("--cache-stats", action="store_true", help="print the scan cache statistics and exit")
+    parser.add_argument("--cache-invalidate", metavar="REF", help="drop the cached scans of a digest or image name ('all' drops everything) and exit")
+    parser.add_argument("--eol-cache-dir", metavar="DIR", help="cache the endoflife.date data here and revalidate it after --eol-ttl")
+    parser.add_argument("--eol-ttl", type=int, default=24 * 3600, help="seconds the cached endoflife.date data is used without revalidation")
+    parser.add_argument("--eol-snapshot", metavar="FILE", help="load the endoflife.date data from this snapshot file, without any network access")
+    parser.add_argument("--eol-save-snapshot", metavar="FILE", help="write the loaded endoflife.date data to a snapshot file and exit")
+    parser.add_argument("--trace-dir", metavar="DIR", help="write the timing spans of every image scan here as Chrome trace event JSON")
+    parser.add_argument("--metrics-file", metavar="FILE", help="keep Prometheus histograms of the stage and command durations in this textfile")
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument("--record", metavar="DIR", help="record every docker / syft command and EOL API response of the run into this fixture store")
+    fixtures.add_argument("--replay", metavar="DIR", help="answer the commands and EOL API requests from a recorded fixture store, without docker, syft or network")
+    parser.add_argument("--replay-latency", type=float, default=0.0, help="replay the recorded durations scaled by this factor (0 answers at once)")
+    parser.add_argument("--stage-timeout", metavar="STAGE=SECONDS", action="append", default=[], type=stage_timeout,
+                        help="kill the commands of a stage (pull, run, syft, cleanup) after this many seconds, repeatable")
+    parser.add_argument("--image-timeout", type=float, metavar="SECONDS",
+                        help="deadline of a whole image scan, the stages still running are killed and reported as timed out")
+    parser.add_argument("--queue", metavar="URL",
+                        help="shared work queue of a distributed batch: a SQLite file (path or sqlite:///path) or redis://host:port/db; "
+                             "with --batch this run queues the images and writes the combined report")
+    parser.add_argument("--worker", action="store_true", help="scan images leased from --queue until it is drained")
+    parser.add_argument("--lease-seconds", type=int, default=300, help="a leased image goes back to the queue when its worker misses heartbeats this long")
+    parser.add_argument("--max-attempts", type=int, default=3, help="leases of an image before it is reported as failed")
+    parser.add_argument("--serve", metavar="ADDRESS", help="run as a scan service on host:port or unix:/path/to.sock")
+    parser.add_argument("--output", default="eol-scan-results.csv", help="path of the generated report, one row is appended per scanned image")
+    parser.add_argument("--output-format", choices=["csv", "jsonl", "parquet"], help="report format (default: from the --output extension, else csv)")
+    parser.add_argument("--resume", action="store_true", help="keep the rows already in --output and skip their images")
+    parser.add_argument("--json-dir", metavar="DIR", help="also write the raw scan details of every image as <image>.json here")
+    parser.add_argument("--results-db", metavar="FILE",
+                        help="add every scan, its digest, runtimes and EOL verdicts to this SQLite results store (see utils/query_results.py)")
+    return parser.parse_args()
+
+
+def open_scan_cache(arguments):
+    if arguments.cache_dir is None:
+        return None
+    from scanCache import ScanCache
+    return ScanCache(arguments.cache_dir, logger, max_bytes=arguments.cache_max_mb * 1024 * 1024)
+
+
+def create_docker_backend(arguments):
+    if arguments.docker != "api":
+        return None
+    from dockerBackend import DockerApiBackend, DockerEngineClient
+    return DockerApiBackend(DockerEngineClient(arguments.docker_socket))
+
+
+def open_layer_cache(arguments):
+    if arguments.layer_cache_dir is None:
+        return None
+    from layerCache import LayerCache
+    return LayerCache(arguments.layer_cache_dir, logger)
+
+
+def open_base_chains(arguments):
+    if not arguments.share_base_scans and arguments.base_chain_dir is None:
+        return None
+    from baseChains import BaseChainIndex
+    return BaseChainIndex(logger, arguments.base_chain_dir)
+
+
+def scan_single_image(image_to_scan, arguments, scan_cache=None):
+    from scanTrace import get_tracer
+    with get_tracer().span(image_to_scan, "scan", root=True):
+        return scan_image(image_to_scan, arguments, scan_cache)
+
+
+def scan_image(image_to_scan, arguments, scan_cache=None):
+    docker_backend = create_docker_backend(arguments)
+    if arguments.backend == "registry":
+        from registryScan import RegistryScanner
+        image_scanner = RegistryScanner(image_to_scan, sbom_dir=arguments.sbom_dir, insecure_registries=arguments.insecure_registry,
+                                        layer_cache=open_layer_cache(arguments))
+    elif arguments.backend == "filesystem" or arguments.image_tar is not None:
+        from fsScanner import FilesystemScanner
+        image_scanner = FilesystemScanner(image_to_scan, image_tar=arguments.image_tar, sbom_dir=arguments.sbom_dir, docker_backend=docker_backend,
+                                          layer_cache=open_layer_cache(arguments))
+    elif arguments.engine == "async":
+        from asyncScan import AsyncImageScanner
+        image_scanner = AsyncImageScanner(image_to_scan, sbom_dir=arguments.sbom_dir, docker_backend=docker_backend, base_chains=open_base_chains(arguments))
+    else:
+        from scanImage import ImageScanner
+        image_scanner = ImageScanner(image_to_scan, sbom_dir=arguments.sbom_dir, docker_backend=docker_backend, base_chains=open_base_chains(arguments))
+    image_scanner.timeouts.update(dict(arguments.stage_timeout))
+    image_scanner.image_timeout = arguments.image_timeout
+    if scan_cache is not None:
+        result = image_scanner.get_scan_image_cached(scan_cache, syft_path='utils/syft.template.yml')
+    else:
+        if arguments.results_db is not None:
+            image_scanner.digest = image_scanner.resolve_digest()
+        result = image_scanner.get_scan_image(syft_path='utils/syft.template.yml')
+    file_name = image_to_scan.replace(':','_')
+    file_name = file_name.replace('/','_')
+    return image_scanner.write_updated_json(file_name, result, arguments.json_dir)
+
+
+def create_batch_scanner(arguments, scan_cache=None):
+    from batchScan import BatchScanner
+    return BatchScanner(logger, workers=arguments.workers, pull_limit=arguments.pull_limit,
+                        run_limit=arguments.run_limit, syft_limit=arguments.syft_limit,
+                        syft_path='utils/syft.template.yml', backend=arguments.backend, engine=arguments.engine,
+                        docker=arguments.docker, docker_socket=arguments.docker_socket,
+                        prefetch=arguments.prefetch, insecure_registries=arguments.insecure_registry,
+                        layer_cache=open_layer_cache(arguments),
+                        disk_budget=int(arguments.disk_budget_gb * 1000 ** 3) if arguments.disk_budget_gb is not None else None,
+                        sbom_dir=arguments.sbom_dir, scan_cache=scan_cache, json_dir=arguments.json_dir,
+                        stage_timeouts=dict(arguments.stage_timeout), image_timeout=arguments.image_timeout,
+                        base_chains=open_base_chains(arguments), resolve_digests=arguments.results_db is not None)
+
+
+def open_work_queue(arguments):
+    from workQueue import open_work_queue
+    return open_work_queue(arguments.queue, lease_seconds=arguments.lease_seconds, max_attempts=arguments.max_attempts)
+
+
+def scan_batch(arguments, scan_cache=None, on_record=None, skip_images=()):
+    batch_scanner = create_batch_scanner(arguments, scan_cache)
+    images = batch_scanner.read_images(arguments.batch)
+    images = [image for image in images if image not in skip_images]
+    if len(images) == 0:
+        logger.info("No images to scan in " + arguments.batch)
+        return []
+    if arguments.queue is not None:
+        # the workers scan, this run only queues the images and reports what they store
+        from distributedScan import coordinate
+        return coordinate(logger, open_work_queue(arguments), images, on_record)
+    return batch_scanner.scan(images, on_record)
+
+
 if __name__ == '__main__':
-    
-    if len(sys.argv) < 2:
+    arguments = parse_arguments()
+    from scanTrace import configure_tracing
+    tracer = configure_tracing(arguments.trace_dir, arguments.metrics_file)
+    from commandExecutor import configure_executor
+    configure_executor(arguments.record, arguments.replay, arguments.replay_latency, logger)
+    from addEolStatus import EOLArtifacts
+    eol_artifacts = EOLArtifacts(logger, cache_dir=arguments.eol_cache_dir, snapshot=arguments.eol_snapshot, ttl=arguments.eol_ttl)
+
+    if arguments.eol_save_snapshot is not None:
+        eol_artifacts.get_eol_data()
+        eol_artifacts.loader.save_snapshot(arguments.eol_save_snapshot, eol_artifacts.rawData)
+        exit(0)
+
+    scan_cache = open_scan_cache(arguments)
+
+    if scan_cache is None and (arguments.cache_stats or arguments.cache_invalidate is not None):
+        logger.info("--cache-stats and --cache-invalidate need the scan cache given with --cache-dir")
+        exit(1)
+    if scan_cache is not None and (arguments.cache_stats or arguments.cache_invalidate is not None):
+        if arguments.cache_invalidate is not None:
+            reference = None if arguments.cache_invalidate == "all" else arguments.cache_invalidate
+            logger.info("Removed " + str(scan_cache.invalidate(reference)) + " cached scans")
+        if arguments.cache_stats:
+            print(json.dumps(scan_cache.stats(), indent=2))
+        exit(0)
+
+    if arguments.serve is not None:
+        from scanService import ScanService, serve
+        service = ScanService(logger, create_batch_scanner(arguments, scan_cache), eol_artifacts,
+                              workers=arguments.workers, eol_refresh=arguments.eol_ttl)
+        serve(service, arguments.serve)
+        exit(0)
+
+    if arguments.worker:
+        if arguments.queue is None:
+            logger.info("--worker needs the --queue to lease images from")
+            exit(1)
+        from distributedScan import QueueWorker
+        QueueWorker(logger, open_work_queue(arguments), create_batch_scanner(arguments, scan_cache)).run()
+        tracer.close()
+        exit(0)
+
+    if arguments.image is None and arguments.batch is None:
         logging.info("Please provide image with tag to scan")
         exit(0)
-        
-    image_to_scan = sys.argv[1]
-    result = {}
-    image_scanner = ImageScanner(image_to_scan)
-    result = image_scanner.get_scan_image(syft_path='utils/syft.template.yml')
-    file_name = image_to_scan.replace(':','_')
-    file_name = file_name.replace('/','_')
-    scan_data = image_scanner.write_updated_json(file_name, result)
-    
-    #prepare final data with EOL status
-    eol_artifacts = EOLArtifacts(logger)
+
+    #EOL data is loaded first so every image is reported as soon as its scan is done
     eol_artifacts.apiData = eol_artifacts.get_eol_data()
-    final_data_with_eol = eol_artifacts.add_eol_columns(scan_data)
-    
-    #Create CSV file with final data
-    df = pd.DataFrame(final_data_with_eol)
-    df.to_csv("eol-scan-results.csv", index=False)
-    logger.info(" Final CSV file is generated")
-    
+
+    results_store = None
+    if arguments.results_db is not None:
+        from resultsStore import ResultsStore
+        results_store = ResultsStore(arguments.results_db, logger)
+
+    from reportSinks import open_sink
+    try:
+        with open_sink(arguments.output, arguments.output_format, arguments.resume) as sink:
+            reported = sink.existing_images()
+            if len(reported) > 0:
+                logger.info("Resuming, " + str(len(reported)) + " images are already in " + arguments.output)
+
+            def report(record):
+                row = eol_artifacts.evaluate_record(record)
+                sink.write(row)
+                if results_store is not None:
+                    results_store.add(record, row)
+
+            if arguments.batch is not None:
+                scan_batch(arguments, scan_cache, report, reported)
+            elif arguments.image not in reported:
+                report(scan_single_image(arguments.image, arguments, scan_cache))
+    finally:
+        # the scans reported before a failure are still written to the store
+        if results_store is not None:
+            results_store.close()
+    tracer.close()
+    logger.info(" Final report is generated: " + arguments.output + " (" + str(sink.rows) + " new rows)")
+
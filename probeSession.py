@@ -0,0 +1,60 @@
+class ProbeSession:
+    """
+    One idle container per image that receives every probe command through docker exec
+    """
+    # Commands that keep a container alive without doing any work, tried in order
+    idle_commands = [
+        ("cat", []),
+        ("sleep", ["infinity"]),
+        ("sh", ["-c", "while true; do sleep 3600; done"]),
+    ]
+
+    def __init__(self, image, logger, docker):
+        self.image = image
+        self.logger = logger
+        # Docker backend of the scanner (CLI or Engine API)
+        self.docker = docker
+        self.container_id = None
+
+    @property
+    def active(self):
+        return self.container_id is not None
+
+    def start(self):
+        """
+        Start the idle container, returns False when the image has nothing that can idle (e.g. distroless)
+        """
+        for entrypoint, arguments in self.idle_commands:
+            container_id = self.docker.start_idle(self.image, entrypoint, arguments)
+            if container_id is None:
+                continue
+            if self.docker.is_running(container_id):
+                self.container_id = container_id
+                self.logger.info("Started probe container " + container_id[:12] + " for the image " + self.image)
+                return True
+            self.docker.remove_container(container_id)
+        self.logger.info("Unable to start a probe container for the image " + self.image + ", falling back to docker run")
+        return False
+
+    def exec(self, entrypoint, arguments):
+        return self.docker.exec(self.container_id, entrypoint, arguments)
+
+    def stop(self):
+        """
+        Tear down the probe container
+        """
+        if self.container_id is None:
+            return
+        try:
+            self.docker.remove_container(self.container_id)
+        except Exception as e:
+            self.logger.info("Exception while removing the probe container " + str(e))
+        self.container_id = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class PullManager:
+    """
+    Pulls the images of a batch ahead of their scan, and afterwards keeps the pulled images local
+    under a disk budget, removing the least recently used ones first
+    """
+    def __init__(self, logger, docker, pull, scan_workers=4, prefetch=2, disk_budget=None):
+        self.logger = logger
+        self.docker = docker
+        # pull(image) pulls one image and returns whether it is now local
+        self.pull = pull
+        self.prefetch = prefetch
+        # Bytes of image layers allowed on disk, None removes every pulled image right after its scan
+        self.disk_budget = disk_budget
+        # An image holds a window slot from the start of its pull to the end of its scan
+        self.window = threading.Semaphore(scan_workers + prefetch)
+        self.executor = ThreadPoolExecutor(max_workers=max(prefetch, 1))
+        self.pulls = {}
+        self.evictable = OrderedDict()
+        self.lock = threading.Lock()
+        self.dispatcher = None
+
+    def start(self, images):
+        """
+        Start pulling the images in scan order, never more than prefetch images ahead of the scans
+        """
+        self.pulls = {image: Future() for image in images}
+        self.dispatcher = threading.Thread(target=self.dispatch, args=(list(images),), daemon=True)
+        self.dispatcher.start()
+
+    def dispatch(self, images):
+        for image in images:
+            self.window.acquire()
+            self.executor.submit(self.pull_one, image)
+
+    def pull_one(self, image):
+        future = self.pulls[image]
+        try:
+            # Images that were local before the batch belong to someone else and are never removed
+            local = self.docker.image_digests(image) is not None
+            pulled = self.pull(image)
+            future.set_result(pulled and not local)
+        except Exception as e:
+            self.logger.info("Exception while prefetching the image " + image + " " + str(e))
+            future.set_result(False)
+
+    def wait(self, image):
+        """
+        Block until the prefetched pull of the image is done
+        """
+        future = self.pulls.get(image)
+        if future is not None:
+            future.result()
+
+    def release(self, image):
+        """
+        The scan of the image is over, its slot goes to the next prefetch and the image becomes evictable
+        """
+        future = self.pulls.get(image)
+        if future is None:
+            return
+        self.window.release()
+        if not future.done() or not future.result():
+            return
+        with self.lock:
+            self.evictable[image] = True
+            self.evictable.move_to_end(image)
+            self.evict()
+
+    def evict(self):
+        if self.disk_budget is None:
+            while self.evictable:
+                self.remove(self.evictable.popitem(last=False)[0])
+            return
+        usage = self.docker.disk_usage()
+        while usage is not None and usage > self.disk_budget and self.evictable:
+            self.remove(self.evictable.popitem(last=False)[0])
+            usage = self.docker.disk_usage()
+
+    def remove(self, image):
+        # docker rmi only deletes the layers no other local image uses, shared base layers stay
+        self.logger.info("Evicting the image " + image)
+        if not self.docker.remove_image(image):
+            self.logger.info("Unable to remove the image " + image)
+
+    def close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import json
+import os
+import re
+
+docker_hub_registry = "registry-1.docker.io"
+manifest_media_types = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+]
+index_media_types = manifest_media_types[:2]
+
+
+def parse_reference(image):
+    """
+    Split an image reference into (registry, repository, tag or digest), with the docker hub defaults
+    """
+    name, reference = image, "latest"
+    if "@" in name:
+        name, reference = name.split("@", 1)
+    else:
+        last = name.rsplit("/", 1)[-1]
+        if ":" in last:
+            name, reference = name.rsplit(":", 1)
+    first, _, rest = name.partition("/")
+    if rest and ("." in first or ":" in first or first == "localhost"):
+        registry, repository = first, rest
+    else:
+        registry, repository = docker_hub_registry, name
+        if "/" not in repository:
+            repository = "library/" + repository
+    return registry, repository, reference
+
+
+def docker_config_auth(registry):
+    """
+    (user, password) stored by docker login for the registry, None when there is none
+    """
+    path = os.path.join(os.environ.get("DOCKER_CONFIG", os.path.expanduser("~/.docker")), "config.json")
+    try:
+        with open(path) as f:
+            auths = json.load(f).get("auths", {})
+    except Exception:
+        return None
+    keys = [registry, "https://" + registry]
+    if registry == docker_hub_registry:
+        keys.append("https://index.docker.io/v1/")
+    for key in keys:
+        auth = auths.get(key, {}).get("auth")
+        if auth:
+            user, _, password = base64.b64decode(auth).decode().partition(":")
+            return user, password
+    return None
+
+
+class RegistryClient:
+    """
+    OCI distribution client that reads manifests, configs and layer blobs straight from a registry, without a docker daemon
+    """
+    def __init__(self, registry, insecure=False, timeout=(5, 300), platform="linux/amd64"):
+        self.registry = registry
+        # Plain http is only used for registries explicitly marked insecure (e.g. a local registry:2)
+        self.base_url = ("http://" if insecure else "https://") + registry + "/v2/"
+        self.timeout = timeout
+        self.platform = platform
+        self.credentials = docker_config_auth(registry)
+        self.tokens = {}
+        self.session = None
+
+    def get_session(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        return self.session
+
+    def fetch_token(self, challenge, repository):
+        parameters = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        query = {"scope": parameters.get("scope", "repository:" + repository + ":pull")}
+        if "service" in parameters:
+            query["service"] = parameters["service"]
+        response = self.get_session().get(parameters["realm"], params=query, auth=self.credentials, timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        return body.get("token") or body.get("access_token")
+
+    def get(self, repository, path, headers=None, stream=False):
+        """
+        GET a registry path of the repository, answering a bearer or basic auth challenge once
+        """
+        headers = dict(headers or {})
+        if repository in self.tokens:
+            headers["Authorization"] = "Bearer " + self.tokens[repository]
+        url = self.base_url + repository + "/" + path
+        response = self.get_session().get(url, headers=headers, stream=stream, timeout=self.timeout)
+        if response.status_code == 401:
+            challenge = response.headers.get("WWW-Authenticate", "")
+            response.close()
+            if challenge.lower().startswith("bearer"):
+                self.tokens[repository] = self.fetch_token(challenge, repository)
+                headers["Authorization"] = "Bearer " + self.tokens[repository]
+                response = self.get_session().get(url, headers=headers, stream=stream, timeout=self.timeout)
+            elif self.credentials is not None:
+                response = self.get_session().get(url, headers=headers, stream=stream, timeout=self.timeout, auth=self.credentials)
+        response.raise_for_status()
+        return response
+
+    def fetch_manifest(self, repository, reference):
+        response = self.get(repository, "manifests/" + reference, {"Accept": ", ".join(manifest_media_types)})
+        digest = response.headers.get("Docker-Content-Digest") or "sha256:" + hashlib.sha256(response.content).hexdigest()
+        return response.json(), digest, response.headers.get("Content-Type", "").split(";")[0]
+
+    def manifest(self, repository, reference):
+        """
+        Image manifest and the digest the reference points to, resolving a multi-platform index to the configured platform
+        """
+        manifest, digest, content_type = self.fetch_manifest(repository, reference)
+        if manifest.get("mediaType", content_type) in index_media_types or "manifests" in manifest:
+            os_name, _, architecture = self.platform.partition("/")
+            for entry in manifest["manifests"]:
+                platform = entry.get("platform", {})
+                if platform.get("os") == os_name and platform.get("architecture") == architecture:
+                    # the index digest is what docker reports as the repo digest of the image
+                    return self.fetch_manifest(repository, entry["digest"])[0], digest
+            raise Exception("no " + self.platform + " image in the index of " + repository + ":" + reference)
+        return manifest, digest
+
+    def blob(self, repository, digest):
+        return self.get(repository, "blobs/" + digest).content
+
+    def open_blob(self, repository, digest):
+        """
+        Streaming response of a blob, read through response.raw so layers are never fully buffered
+        """
+        return self.get(repository, "blobs/" + digest, stream=True)
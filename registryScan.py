@@ -0,0 +1,151 @@
+import json
+import tarfile
+import threading
+from contextlib import contextmanager
+from fsScanner import FilesystemScanner
+from registryClient import RegistryClient, parse_reference
+from singleFlight import SingleFlight
+
+# Registries reached over plain http without being listed as insecure
+local_registries = ("localhost", "127.0.0.1")
+
+# Layer blobs tarfile reads as a stream by itself, plain or gzip compressed
+tar_layer_media_types = {
+    "application/vnd.docker.image.rootfs.diff.tar.gzip",
+    "application/vnd.docker.image.rootfs.foreign.diff.tar.gzip",
+    "application/vnd.oci.image.layer.v1.tar",
+    "application/vnd.oci.image.layer.v1.tar+gzip",
+    "application/vnd.oci.image.layer.nondistributable.v1.tar",
+    "application/vnd.oci.image.layer.nondistributable.v1.tar+gzip",
+}
+
+# Layer blobs decompressed with the zstandard package before tarfile reads them
+zstd_layer_media_types = {
+    "application/vnd.oci.image.layer.v1.tar+zstd",
+    "application/vnd.oci.image.layer.nondistributable.v1.tar+zstd",
+}
+
+
+def zstd_reader(stream):
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("the zstandard package is required for zstd compressed layers")
+    return zstandard.ZstdDecompressor().stream_reader(stream)
+
+
+class KnownLayers:
+    """
+    Findings per layer digest, shared by the images of a batch so common base layers are read once. One image reads a
+    layer, the others of the process wait for its findings.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.findings = {}
+        self.reads = SingleFlight(self.lock)
+
+    def acquire(self, digest, image, with_artifacts=False, timeout=None):
+        """
+        Findings of the layer, waiting while another image reads it. None makes the image the reader of the layer,
+        which must release it afterwards. with_artifacts asks for findings that include the syft artifacts of the layer.
+        """
+        def lookup():
+            findings = self.findings.get(digest)
+            if findings is not None and (not with_artifacts or "artifacts" in findings):
+                return findings
+            return None
+
+        return self.reads.acquire(digest, image, lookup, timeout)
+
+    def release(self, digest, image, findings=None):
+        """
+        Store the findings of the layer when its read completed, and let the images waiting for it go on
+        """
+        def store():
+            self.findings[digest] = findings
+
+        self.reads.release(digest, image, store if findings is not None else None)
+
+
+class RegistryScanner(FilesystemScanner):
+    """
+    Scan an image straight from its registry: the manifest, the config and the layer blobs are streamed
+    through the filesystem scanner without a docker daemon, and layers already read are not fetched again
+    """
+    scan_backend = "registry"
+
+    def __init__(self, image, limits=None, sbom_dir=None, known_layers=None, insecure_registries=(), layer_cache=None):
+        super().__init__(image, limits, sbom_dir=sbom_dir, layer_cache=layer_cache)
+        self.registry, self.repository, self.reference = parse_reference(image)
+        insecure = self.registry.split(":")[0] in local_registries or self.registry in insecure_registries
+        self.client = RegistryClient(self.registry, insecure=insecure)
+        # Findings per layer digest, shared by the images of a batch so common base layers are read once
+        self.known_layers = known_layers if known_layers is not None else KnownLayers()
+        self.manifest = None
+        self.digest = None
+        # syft reads the registry itself, no daemon involved
+        self.syft_source = "registry:" + image
+
+    def get_manifest(self):
+        if self.manifest is None:
+            self.manifest, self.digest = self.client.manifest(self.repository, self.reference)
+        return self.manifest
+
+    @contextmanager
+    def open_layer(self, layer):
+        """
+        Stream-decompress one layer blob, the blob never touches the disk
+        """
+        media_type = layer.get("mediaType")
+        if media_type is not None and media_type not in tar_layer_media_types and media_type not in zstd_layer_media_types:
+            raise Exception("unsupported layer media type " + media_type + " in the image " + self.image_to_scan)
+        limit = self.limits.get("pull")
+        if limit is not None:
+            limit.acquire()
+        try:
+            response = self.client.open_blob(self.repository, layer["digest"])
+            try:
+                if media_type in zstd_layer_media_types:
+                    blob, mode = zstd_reader(response.raw), "r|"
+                else:
+                    blob, mode = response.raw, "r|*"
+                with tarfile.open(fileobj=blob, mode=mode) as stream:
+                    yield stream
+            finally:
+                response.close()
+        finally:
+            if limit is not None:
+                limit.release()
+
+    def load_filesystem(self):
+        if self.files is not None:
+            return
+        manifest = self.get_manifest()
+        self.config = json.loads(self.client.blob(self.repository, manifest["config"]["digest"]))
+        layers = []
+        for layer, diff_id in zip(manifest["layers"], self.diff_ids(len(manifest["layers"]))):
+            # findings read without a layer cache lack the layer artifacts the cache needs
+            findings = self.known_layers.acquire(layer["digest"], self.image_to_scan, self.layer_cache is not None, self.command_timeout("pull"))
+            if findings is None:
+                try:
+                    findings = self.layer_findings(diff_id, lambda: self.open_layer(layer))
+                finally:
+                    self.known_layers.release(layer["digest"], self.image_to_scan, findings)
+            layers.append(findings)
+        self.layers = layers
+        self.files = self.merge_layers(layers)
+
+    def resolve_digest(self):
+        try:
+            self.get_manifest()
+            return self.digest
+        except Exception as e:
+            self.logger.info("Unable to resolve the digest of the image " + self.image_to_scan + " " + str(e))
+            return None
+
+    def pull_image(self):
+        # Nothing is pulled, the layers are streamed during the scan
+        return True
+
+    def cleanup_image(self):
+        return
@@ -0,0 +1,208 @@
+import csv
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from scanRecords import report_columns
+
+
+def complete_csv_rows(path):
+    """
+    (rows, byte length) of the complete rows at the start of a CSV report: every column present and the row ended by
+    a newline. A quoted cell may span lines, so rows are found by the csv reader rather than by line.
+    """
+    consumed = []
+
+    def lines(f):
+        # the reader pulls lines lazily, so the bytes read up to a row are known when the row is returned
+        for line in f:
+            consumed.append(line)
+            yield line.decode("utf-8", errors="replace")
+
+    rows = []
+    length = 0
+    with open(path, "rb") as f:
+        try:
+            for row in csv.reader(lines(f)):
+                if len(row) != len(report_columns) or not consumed[-1].endswith(b"\n"):
+                    break
+                rows.append(row)
+                length = sum(len(line) for line in consumed)
+        except csv.Error:
+            pass
+    return rows, length
+
+
+def complete_lines_length(path):
+    """
+    Byte length of a report up to its last newline, a line cut short by a crash ends after it
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    return data.rfind(b"\n") + 1
+
+
+def truncate_to(path, length):
+    with open(path, "r+b") as f:
+        f.truncate(length)
+
+
+class ReportSink(ABC):
+    """
+    Report output that receives one row per image as soon as its scan is evaluated
+    """
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.resume = resume
+        self.lock = threading.Lock()
+        self.rows = 0
+
+    def existing_images(self):
+        """
+        Images already in the output, skipped by a resumed run
+        """
+        return set()
+
+    def write(self, row):
+        with self.lock:
+            self.write_row(row)
+            self.rows += 1
+
+    @abstractmethod
+    def write_row(self, row):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class CsvSink(ReportSink):
+    def __init__(self, path, resume=False):
+        super().__init__(path, resume)
+        rows = []
+        if resume and os.path.exists(path):
+            rows, length = complete_csv_rows(path)
+            if rows[:1] == [report_columns]:
+                # a row cut short by a crash is dropped and its image scanned again
+                truncate_to(path, length)
+            else:
+                rows = []
+        self.existing = {row[0] for row in rows[1:]}
+        append = len(rows) > 0
+        self.file = open(path, "a" if append else "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=report_columns)
+        if not append:
+            self.writer.writeheader()
+            self.file.flush()
+
+    def existing_images(self):
+        return self.existing
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesSink(ReportSink):
+    def __init__(self, path, resume=False):
+        super().__init__(path, resume)
+        if resume and os.path.exists(path):
+            # the new rows must not be glued to a line cut short by a crash
+            truncate_to(path, complete_lines_length(path))
+        self.file = open(path, "a" if resume else "w")
+
+    def existing_images(self):
+        if not self.resume or not os.path.exists(self.path):
+            return set()
+        images = set()
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    images.add(json.loads(line)["Image name"])
+                except (ValueError, KeyError):
+                    continue
+        return images
+
+    def write_row(self, row):
+        self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink(ReportSink):
+    """
+    Rows are buffered into row groups, the file is complete once the sink is closed
+    """
+    def __init__(self, path, resume=False, row_group_size=1000):
+        super().__init__(path, resume)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception("pyarrow is required for Parquet output")
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.row_group_size = row_group_size
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in report_columns])
+        self.buffer = []
+        self.existing = None
+        if resume and os.path.exists(path):
+            self.existing = self.parquet.read_table(path)
+        # Parquet files cannot be appended, a resumed run rewrites the earlier rows into the new file
+        self.temporary = path + ".partial"
+        self.writer = self.parquet.ParquetWriter(self.temporary, self.schema)
+        if self.existing is not None:
+            self.writer.write_table(self.existing.select(report_columns).cast(self.schema))
+
+    def existing_images(self):
+        if self.existing is None:
+            return set()
+        return set(self.existing.column("Image name").to_pylist())
+
+    def flush(self):
+        if self.buffer:
+            columns = {column: [row.get(column) for row in self.buffer] for column in report_columns}
+            self.writer.write_table(self.pyarrow.table(columns, schema=self.schema))
+            self.buffer = []
+
+    def write_row(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.writer.close()
+            os.replace(self.temporary, self.path)
+
+
+report_sinks = {
+    "csv": CsvSink,
+    "jsonl": JsonLinesSink,
+    "parquet": ParquetSink,
+}
+
+
+def open_sink(path, output_format=None, resume=False):
+    """
+    Report sink of the given format, or of the output file extension
+    """
+    if output_format is None:
+        extension = os.path.splitext(path)[1].lstrip(".").lower()
+        output_format = {"json": "jsonl", "ndjson": "jsonl", "pq": "parquet"}.get(extension, extension)
+        if output_format not in report_sinks:
+            output_format = "csv"
+    return report_sinks[output_format](path, resume=resume)
@@ -0,0 +1,179 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from scanRecords import report_languages
+
+schema = [
+    "CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started REAL, finished REAL, images INTEGER)",
+    "CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, name TEXT UNIQUE, first_seen REAL, last_scan INTEGER)",
+    "CREATE TABLE IF NOT EXISTS digests (image INTEGER, digest TEXT, first_seen REAL, last_seen REAL, PRIMARY KEY (image, digest))",
+    "CREATE TABLE IF NOT EXISTS scans (id INTEGER PRIMARY KEY, run INTEGER, image INTEGER, digest TEXT, scanned REAL, os TEXT, "
+    "upgrade_required INTEGER, partial INTEGER, stages TEXT)",
+    "CREATE TABLE IF NOT EXISTS runtimes (scan INTEGER, language TEXT, version TEXT, cycle TEXT, source TEXT, path TEXT)",
+    "CREATE TABLE IF NOT EXISTS verdicts (scan INTEGER, language TEXT, upgrade_required INTEGER, eol_details TEXT)",
+    "CREATE INDEX IF NOT EXISTS digests_digest ON digests (digest)",
+    "CREATE INDEX IF NOT EXISTS scans_image ON scans (image, scanned)",
+    "CREATE INDEX IF NOT EXISTS scans_scanned ON scans (scanned)",
+    "CREATE INDEX IF NOT EXISTS runtimes_scan ON runtimes (scan)",
+    "CREATE INDEX IF NOT EXISTS runtimes_cycle ON runtimes (language, cycle)",
+    "CREATE INDEX IF NOT EXISTS runtimes_version ON runtimes (language, version)",
+    "CREATE INDEX IF NOT EXISTS verdicts_scan ON verdicts (scan, language)",
+    "CREATE INDEX IF NOT EXISTS verdicts_language ON verdicts (language, upgrade_required)",
+]
+
+# strftime format of every trend period
+trend_periods = {"day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m"}
+
+
+def version_cycle(version):
+    """
+    major.minor release cycle of a detected version string ("3.7.3-2" -> "3.7", "go1.15.2" -> "1.15")
+    """
+    matched = re.search(r"(\d+)(?:\.(\d+))?", version or "")
+    if matched is None:
+        return None
+    return matched.group(1) + ("." + matched.group(2) if matched.group(2) is not None else "")
+
+
+class ResultsStore:
+    """
+    Scan history in one SQLite file: the images, their digests, every scan with its detected runtimes and EOL verdicts.
+    Scans are buffered and written batch_size at a time (or every flush_seconds) in a single transaction.
+    """
+    def __init__(self, path, logger=None, batch_size=200, flush_seconds=5.0, read_only=False):
+        self.path = path
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.run = None
+        if read_only:
+            self.connection = sqlite3.connect("file:" + path + "?mode=ro", uri=True, check_same_thread=False)
+            return
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in schema:
+                self.connection.execute(statement)
+            self.run = self.connection.execute("INSERT INTO runs (started, images) VALUES (?, 0)", (time.time(),)).lastrowid
+
+    def add(self, record, row):
+        """
+        Queue the image record of a scan and its evaluated report row
+        """
+        with self.lock:
+            self.pending.append((record, row, time.time()))
+            if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush > self.flush_seconds:
+                self.write_pending()
+
+    def flush(self):
+        with self.lock:
+            self.write_pending()
+
+    def image_id(self, name, now):
+        self.connection.execute("INSERT OR IGNORE INTO images (name, first_seen) VALUES (?, ?)", (name, now))
+        return self.connection.execute("SELECT id FROM images WHERE name = ?", (name,)).fetchone()[0]
+
+    def write_pending(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        with self.connection:
+            for record, row, scanned in self.pending:
+                image = self.image_id(record.image, scanned)
+                if record.digest is not None:
+                    self.connection.execute("INSERT INTO digests (image, digest, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                                            "ON CONFLICT(image, digest) DO UPDATE SET last_seen = excluded.last_seen",
+                                            (image, record.digest, scanned, scanned))
+                partial = any(status in ("timed-out", "skipped") for status in record.stages.values())
+                scan = self.connection.execute("INSERT INTO scans (run, image, digest, scanned, os, upgrade_required, partial, stages) "
+                                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                               (self.run, image, record.digest, scanned, record.os_name, row.get("Upgrade Required ?") == "Yes",
+                                                partial, json.dumps(record.stages))).lastrowid
+                self.connection.executemany("INSERT INTO runtimes (scan, language, version, cycle, source, path) VALUES (?, ?, ?, ?, ?, ?)",
+                                            [(scan, runtime.language, runtime.version, version_cycle(runtime.version), runtime.source, runtime.path)
+                                             for runtime in record.runtimes])
+                # only the languages found in the image have a verdict
+                self.connection.executemany("INSERT INTO verdicts (scan, language, upgrade_required, eol_details) VALUES (?, ?, ?, ?)",
+                                            [(scan, language.lower(), row.get(language + " - Upgrade Required?") == "Yes", row.get(language + " - Eol Details") or "")
+                                             for language in report_languages if (row.get(language) or "").strip()])
+                self.connection.execute("UPDATE images SET last_scan = ? WHERE id = ?", (scan, image))
+            self.connection.execute("UPDATE runs SET images = images + ? WHERE id = ?", (len(self.pending), self.run))
+        self.pending = []
+
+    def select(self, sql, parameters=()):
+        """
+        (column names, rows) of a query
+        """
+        with self.lock:
+            cursor = self.connection.execute(sql, parameters)
+            return [column[0] for column in cursor.description or []], cursor.fetchall()
+
+    def runtime_images(self, language, version=None):
+        """
+        Images whose latest scan ships the language, optionally only a version or a release cycle ("3.7" matches 3.7.3-2)
+        """
+        # the latest scan queries start from the images (CROSS JOIN keeps that order), one indexed lookup per image
+        sql = ("SELECT i.name AS image, s.digest, r.version, r.source, r.path, datetime(s.scanned, 'unixepoch') AS scanned "
+               "FROM images i CROSS JOIN scans s ON s.id = i.last_scan JOIN runtimes r ON r.scan = s.id WHERE r.language = ?")
+        parameters = [language.lower()]
+        if version is not None:
+            sql += " AND (r.cycle = ? OR r.version = ? OR r.version LIKE ?)"
+            parameters += [version, version, version + ".%"]
+        return self.select(sql + " ORDER BY i.name, r.version", parameters)
+
+    def eol_summary(self):
+        """
+        Per language: images whose latest scan needs an upgrade, out of the images that ship it
+        """
+        return self.select("SELECT v.language, SUM(v.upgrade_required) AS upgrade_required, COUNT(*) AS images "
+                           "FROM images i CROSS JOIN verdicts v ON v.scan = i.last_scan GROUP BY v.language ORDER BY v.language")
+
+    def eol_images(self, language=None):
+        """
+        Images whose latest scan needs an upgrade, with the EOL details of each language
+        """
+        sql = ("SELECT i.name AS image, s.os, v.language, v.eol_details FROM images i CROSS JOIN scans s ON s.id = i.last_scan "
+               "JOIN verdicts v ON v.scan = s.id WHERE v.upgrade_required = 1")
+        parameters = []
+        if language is not None:
+            sql += " AND v.language = ?"
+            parameters.append(language.lower())
+        return self.select(sql + " ORDER BY i.name, v.language", parameters)
+
+    def eol_trend(self, period="month", since=None):
+        """
+        Per period and language: images needing an upgrade by their last scan of the period, out of the images scanned
+        """
+        sql = ("WITH latest AS (SELECT id, strftime(?, scanned, 'unixepoch') AS period, MAX(scanned) FROM scans WHERE scanned >= ? "
+               "GROUP BY image, period) "
+               "SELECT latest.period, v.language, SUM(v.upgrade_required) AS upgrade_required, COUNT(*) AS images "
+               "FROM latest JOIN verdicts v ON v.scan = latest.id GROUP BY latest.period, v.language ORDER BY latest.period, v.language")
+        return self.select(sql, (trend_periods[period], since or 0))
+
+    def image_history(self, image):
+        """
+        Every scan of an image, oldest first
+        """
+        return self.select("SELECT datetime(s.scanned, 'unixepoch') AS scanned, s.digest, s.os, s.upgrade_required, s.partial, s.run "
+                           "FROM scans s JOIN images i ON i.id = s.image WHERE i.name = ? ORDER BY s.scanned", (image,))
+
+    def stats(self):
+        with self.lock:
+            return {table: self.connection.execute("SELECT COUNT(*) FROM " + table).fetchone()[0]
+                    for table in ["runs", "images", "digests", "scans", "runtimes", "verdicts"]}
+
+    def close(self):
+        with self.lock:
+            if self.run is not None:
+                self.write_pending()
+                with self.connection:
+                    self.connection.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self.run))
+                # refresh the planner statistics of the indexes that changed
+                self.connection.execute("PRAGMA optimize")
+            self.connection.close()
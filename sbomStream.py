@@ -0,0 +1,247 @@
+import codecs
+import json
+
+# Top-level keys of the syft document that are kept whole, every other array is streamed and dropped
+kept_keys = ("distro", "source", "descriptor", "schema")
+chunk_size = 1024 * 1024
+whitespace = " \t\r\n"
+
+
+def is_library_path(path):
+    """
+    checking if the jar file is coming from the library (dependency)
+    """
+    return ("lib/" in path) or ("libs/" in path) or ("share/" in path)
+
+
+def location_paths(artifact):
+    return [location["path"] for location in artifact.get("locations") or [] if "path" in location]
+
+
+def extract_go(artifact):
+    metadata = artifact.get("metadata") or {}
+    if "goCompiledVersion" in metadata:
+        return metadata["goCompiledVersion"], location_paths(artifact)
+
+
+def extract_java(artifact):
+    if "metadata" not in artifact or "java" not in artifact.get("foundBy", ""):
+        return None
+    metadata = artifact["metadata"] or {}
+    java_version = ((metadata.get("manifest") or {}).get("main") or {}).get("Build-Jdk")
+    path = metadata.get("virtualPath", "")
+    if java_version and path and not is_library_path(path):
+        return java_version, [path]
+
+
+def extract_angular(artifact):
+    if artifact.get("name") in ("@angular-devkit/core", "@angular/cli", "@schematics/angular") and "version" in artifact:
+        return artifact["version"], location_paths(artifact)
+
+
+def extract_react(artifact):
+    if artifact.get("name") == "react" and "version" in artifact:
+        return artifact["version"], location_paths(artifact)
+
+
+# Every artifact passes once through this table, a new consumer of the SBOM only needs an entry here
+syft_extractors = {
+    "go": extract_go,
+    "java": extract_java,
+    "angular": extract_angular,
+    "react": extract_react,
+}
+
+
+class ArtifactCollector:
+    """
+    Accumulates the versions and paths found by the extractors, one artifact at a time
+    """
+    def __init__(self, extractors=None):
+        self.extractors = extractors if extractors is not None else syft_extractors
+        self.artifacts = 0
+        self.failed = 0
+        self.versions = {name: [] for name in self.extractors}
+        self.paths = {name: [] for name in self.extractors}
+
+    def add(self, artifact):
+        self.artifacts += 1
+        for name, extract in self.extractors.items():
+            try:
+                found = extract(artifact)
+            except Exception:
+                self.failed += 1
+                continue
+            if found is None:
+                continue
+            version, paths = found
+            self.record(name, version, paths)
+
+    def record(self, name, version, paths):
+        self.versions[name].append(version)
+        self.paths[name].extend(path + "(" + version + ")" for path in paths)
+
+    def result(self, name):
+        if self.artifacts == 0:
+            return None, None
+        return list(set(self.versions[name])), self.paths[name]
+
+    def summary(self):
+        return {name: list(self.result(name)) for name in self.extractors}
+
+
+class LayerArtifactCollector(ArtifactCollector):
+    """
+    Also keeps every found version with its own paths, so the findings of one layer can later be merged with others
+    """
+    def __init__(self, extractors=None):
+        super().__init__(extractors)
+        self.found = []
+
+    def record(self, name, version, paths):
+        super().record(name, version, paths)
+        self.found.append([name, version, paths])
+
+
+def summarize_artifacts(found, artifact_count, extractors=None):
+    """
+    Extractor results in the ArtifactCollector.summary shape from [name, version, paths] findings
+    """
+    collector = ArtifactCollector(extractors)
+    collector.artifacts = artifact_count
+    for name, version, paths in found:
+        if name in collector.versions:
+            collector.record(name, version, paths)
+    return collector.summary()
+
+
+class SyftStreamParser:
+    """
+    Single-pass parser for syft JSON output, memory is bounded by the largest artifact instead of the document
+    """
+    def __init__(self, stream, collector):
+        self.stream = stream
+        self.collector = collector
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            raise ValueError("unexpected end of syft output")
+        chunk = self.stream.read(chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buffer = self.buffer[self.position:] + self.text_decoder.decode(b"", final=True)
+        else:
+            self.buffer = self.buffer[self.position:] + self.text_decoder.decode(chunk)
+        self.position = 0
+
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in whitespace:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            self.fill()
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError("expected " + character + " in syft output")
+        self.position += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A value that touches the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def elements(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.position += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError("expected , or ] in syft output")
+
+    def parse(self):
+        """
+        Stream the document, feeding every artifact to the collector and keeping only the small top-level values
+        """
+        document = {}
+        self.expect("{")
+        if self.peek() == "}":
+            return document
+        while True:
+            key = self.value()
+            self.expect(":")
+            if self.peek() == "[":
+                kept = [] if key in kept_keys else None
+                for element in self.elements():
+                    if key == "artifacts":
+                        self.collector.add(element)
+                    elif kept is not None:
+                        kept.append(element)
+                if kept is not None:
+                    document[key] = kept
+            else:
+                value = self.value()
+                if key in kept_keys:
+                    document[key] = value
+            separator = self.peek()
+            self.position += 1
+            if separator == "}":
+                return document
+            if separator != ",":
+                raise ValueError("expected , or } in syft output")
+
+
+class TeeReader:
+    """
+    Copies everything read from a stream into a sink, used to persist the SBOM while it is parsed
+    """
+    def __init__(self, stream, sink):
+        self.stream = stream
+        self.sink = sink
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        if chunk:
+            self.sink.write(chunk)
+        return chunk
+
+
+def parse_syft_stream(stream, extractors=None):
+    """
+    Parse syft JSON from a binary stream into the kept top-level values plus the extractor results
+    """
+    collector = ArtifactCollector(extractors)
+    document = SyftStreamParser(stream, collector).parse()
+    document["artifactCount"] = collector.artifacts
+    document["extracted"] = collector.summary()
+    return document
+
+
+def parse_syft_layer(stream, extractors=None):
+    """
+    Parse the syft JSON of a single layer into its artifact count, [name, version, paths] findings and distro
+    """
+    collector = LayerArtifactCollector(extractors)
+    document = SyftStreamParser(stream, collector).parse()
+    return {"artifactCount": collector.artifacts, "artifacts": collector.found, "distro": document.get("distro")}
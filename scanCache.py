@@ -0,0 +1,52 @@
+import json
+import os
+from sqliteLru import SqliteLru
+
+# Bump when the scan_details of a scan change, entries written by an older version are never reused
+scan_format_version = 2
+
+
+class ScanCache:
+    """
+    Persistent scan_details cache keyed by image digest, scan backend and scan format version, evicting the least
+    recently used entries over a size limit
+    """
+    def __init__(self, cache_dir, logger, max_bytes=512 * 1024 * 1024):
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.store = SqliteLru(os.path.join(cache_dir, "scan-cache.sqlite"), logger, "scan_entries", "entry", "scan_details", max_bytes,
+                               columns=["digest", "image", "backend"], label="scan cache")
+        # entries of the first format were keyed by the digest alone
+        with self.store.lock, self.store.connection:
+            self.store.connection.execute("DROP TABLE IF EXISTS scans")
+
+    def entry(self, digest, backend):
+        return digest + " " + backend + " v" + str(scan_format_version)
+
+    def get(self, digest, backend):
+        """
+        Cached scan_details of a digest scanned by the backend, or None
+        """
+        data = self.store.get(self.entry(digest, backend))
+        return json.loads(data) if data is not None else None
+
+    def contains(self, digest, backend):
+        """
+        Whether a digest scanned by the backend is cached, without counting a lookup
+        """
+        return self.store.contains(self.entry(digest, backend))
+
+    def put(self, digest, backend, image, scan_details):
+        self.store.put(self.entry(digest, backend), json.dumps(scan_details), digest=digest, image=image, backend=backend)
+
+    def invalidate(self, reference=None):
+        """
+        Drop the entries of a digest or of an image name, or every entry when no reference is given
+        """
+        return self.store.invalidate(reference)
+
+    def stats(self):
+        return self.store.stats()
+
+    def close(self):
+        self.store.close()
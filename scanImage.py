@@ -1,14 +1,307 @@
 import logging
 import json
-import subprocess
+import os
 import re
-import pandas as pd
+import tempfile
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from baseChains import base_chain, chain_id
+from commandExecutor import TimedOutProcess, get_executor
+from dockerBackend import DockerCliBackend
+from probeSession import ProbeSession
+from scanRecords import ImageRecord
+from scanTrace import CountingReader, get_tracer
+from versionNormalizer import binary_version, find_full_version
+from sbomStream import ArtifactCollector, TeeReader, is_library_path, parse_syft_stream, syft_extractors
+
+# Seconds a single command of each stage may run before it is killed, None waits forever
+default_stage_timeouts = {"pull": 1800, "run": 300, "syft": 1800, "cleanup": 120}
+
+# Pipeline stages reported in the scan details
+scan_stages = ["os-name", "os-packages", "language-probe", "executables"]
+
+# Commands counted by the pipeline stage running them, per thread and asyncio task
+current_stage = ContextVar("current_stage", default=None)
+
+# Package names (as listed by the os package managers) that hold a programming language
+language_package_prefixes = ("python", "go", "node", "php", "libruby", "openjdk", "angular", "react")
+
+# https://distrowatch.com/dwres.php?resource=package-management\
+pkg_manager_command = {
+    "centos" : "rpm -q -a", "fedora": "rpm -q -a", "red": "rpm -q -a",
+    "photon" : "yum list installed",
+    "oracle linux" : "rpm -q -a",
+    "alpine": "apk list -I",
+    "debian": "apt list --installed", "ubuntu": "apt list --installed",
+    }
+
+# Languages reported by utils/run_individual_commands.sh, in the order of its output
+script_languages = [
+    "python3",
+    "python2.7",
+    "python2",
+    "python",
+    "go",
+    "php8",
+    "php7",
+    "php",
+    "node",
+    "nodejs",
+    "ruby",
+    'java',
+    "angular",
+    "react"
+]
+
+# Version argument of each language binary when it is run on its own
+language_version_arguments = {
+    "python3" : "--version",
+    "python2.7": "--version",
+    "python2": "--version",
+    "python": "--version",
+    "go": "version",
+    "php8": "--version",
+    "php7": "--version",
+    "php": "--version",
+    "node" : "--version",
+    "nodejs" : "--version",
+    "ruby" : "--version",
+    "java" : "-version",
+    "angular": "version",
+    "react": "-v"
+}
 
 class ImageScanner:
-    def __init__(self, image):
+    # --backend that produced a scan, cached scans are only reused by the same backend
+    scan_backend = "container"
+
+    def __init__(self, image, limits=None, probe_session=True, sbom_dir=None, docker_backend=None, base_chains=None):
         logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
         self.logger = logging.getLogger("eol-images-scan")
         self.image_to_scan = image
+        # Source handed to syft, a filesystem scan points it at the saved image archive instead
+        self.syft_source = image
+        self.syft_path = "utils/syft.template.yml"
+        # One syft SBOM per image, shared by the distro lookup and the executable extractors
+        self.sbom = None
+        self.sbom_error = ""
+        self.sbom_dir = sbom_dir
+        # Optional semaphores per stage ("pull", "run", "syft") shared by the images of a batch
+        self.limits = limits if limits is not None else {}
+        self.use_probe_session = probe_session
+        # Cache hits never pull the image, so there is nothing to delete afterwards
+        self.cleanup_enabled = True
+        self.probe = None
+        # Docker CLI by default, or a DockerApiBackend sharing the daemon connections of the batch, bound to the timeouts below
+        self.docker = docker_backend.for_scan(self.command_timeout) if docker_backend is not None else DockerCliBackend(self.run_command)
+        # Timing spans of the stages and commands of this scan
+        self.tracer = get_tracer()
+        # Runs the docker and syft commands, or records / replays them
+        self.executor = get_executor()
+        # Seconds a single command of each stage may run, and the whole scan of the image
+        self.timeouts = dict(default_stage_timeouts)
+        self.image_timeout = None
+        self.deadline = None
+        # Pipeline stage -> completed, reused, timed-out, skipped or failed
+        self.stage_status = {}
+        # OS scans shared by the images built on the same base layers
+        self.base_chains = base_chains
+        # Content digest of the image, when resolved for the scan cache or the results store
+        self.digest = None
+
+    def run_command(self, command, stage="run"):
+        """
+        Run an external command, holding the concurrency slot of its stage when one is configured
+        """
+        with self.tracer.span(self.image_to_scan, stage, kind="command", command=" ".join(command)) as span:
+            limit = self.limits.get(stage)
+            waiting = time.perf_counter()
+            if not self.acquire_slot(limit, stage):
+                process = TimedOutProcess(command, 0, skipped=True)
+            else:
+                try:
+                    if limit is not None:
+                        span["wait"] = time.perf_counter() - waiting
+                    timeout = self.command_timeout(stage)
+                    if timeout is not None and timeout <= 0:
+                        process = TimedOutProcess(command, 0, skipped=True)
+                    else:
+                        process = self.executor.run(command, timeout)
+                finally:
+                    if limit is not None:
+                        limit.release()
+            self.record_command(span, process, len(process.stdout or b""))
+            return process
+
+    def stream_command(self, command, consume, stage="run"):
+        """
+        Run an external command and hand its stdout to consume as a stream instead of buffering it
+        """
+        with self.tracer.span(self.image_to_scan, stage, kind="command", command=" ".join(command)) as span:
+            limit = self.limits.get(stage)
+            waiting = time.perf_counter()
+            if not self.acquire_slot(limit, stage):
+                completed = TimedOutProcess(command, 0, skipped=True)
+                self.record_command(span, completed, 0)
+                return completed, None
+            readers = []
+            try:
+                if limit is not None:
+                    span["wait"] = time.perf_counter() - waiting
+                timeout = self.command_timeout(stage)
+                if timeout is not None and timeout <= 0:
+                    completed, result = TimedOutProcess(command, 0, skipped=True), None
+                else:
+                    def counted(stdout):
+                        readers.append(CountingReader(stdout))
+                        return consume(readers[0])
+                    completed, result = self.executor.stream(command, counted, timeout)
+                self.record_command(span, completed, readers[0].bytes if readers else 0)
+                return completed, result
+            finally:
+                if limit is not None:
+                    limit.release()
+
+    def start_deadline(self):
+        """
+        Start the per-image deadline, once per scan
+        """
+        if self.image_timeout is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.image_timeout
+
+    def command_timeout(self, stage):
+        """
+        Seconds a command of the stage may run: the stage timeout, cut to what is left of the image deadline.
+        Cleanup commands only get their own timeout so that timed out scans are still torn down.
+        """
+        timeout = self.timeouts.get(stage)
+        if self.deadline is not None and stage != "cleanup":
+            remaining = self.deadline - time.monotonic()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def acquire_slot(self, limit, stage):
+        """
+        Wait for the concurrency slot of the stage, no longer than the command would be allowed to run
+        """
+        if limit is None:
+            return True
+        timeout = self.command_timeout(stage)
+        if timeout is None:
+            return limit.acquire()
+        return timeout > 0 and limit.acquire(timeout=timeout)
+
+    def record_command(self, span, process, stdout_bytes):
+        span["exit_code"] = process.returncode
+        span["stdout_bytes"] = stdout_bytes
+        outcome = current_stage.get()
+        if outcome is not None:
+            outcome["commands"] += 1
+        if isinstance(process, TimedOutProcess):
+            span["status"] = "skipped" if process.skipped else "timed-out"
+            if outcome is not None:
+                outcome["skipped" if process.skipped else "timed_out"] += 1
+            if not process.skipped:
+                self.logger.info("Killed " + " ".join(process.args) + " of the image " + self.image_to_scan + " after " + str(round(process.timeout, 1)) + "s")
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Timing span of one pipeline stage of this image, its status (completed, timed-out, skipped or failed) is kept for the scan details
+        """
+        outcome = {"commands": 0, "timed_out": 0, "skipped": 0}
+        token = current_stage.set(outcome)
+        try:
+            with self.tracer.span(self.image_to_scan, name) as span:
+                try:
+                    yield span
+                except Exception:
+                    self.stage_status[name] = "failed"
+                    raise
+                if outcome["timed_out"] > 0:
+                    status = "timed-out"
+                elif outcome["skipped"] > 0 and outcome["skipped"] == outcome["commands"]:
+                    status = "skipped"
+                else:
+                    status = "completed"
+                self.stage_status[name] = status
+                if status != "completed":
+                    span["status"] = status
+        finally:
+            current_stage.reset(token)
+
+    def stage_results(self):
+        """
+        Status of every pipeline stage, the stages that never ran are skipped
+        """
+        results = {name: "skipped" for name in scan_stages}
+        results.update(self.stage_status)
+        return results
+
+    def lookup_base_chain(self):
+        """
+        (id of the base layer chain of the image, the OS scan shared for it or None); (None, None) without a base chain
+        index or when the image is not local
+        """
+        if self.base_chains is None:
+            return None, None
+        with self.stage("base-chain"):
+            layers = self.docker.image_layers(self.image_to_scan)
+            if layers is None or len(layers[0]) == 0:
+                return None, None
+            chain = chain_id(base_chain(*layers))
+            shared = self.base_chains.acquire(chain, self.image_to_scan, self.command_timeout("run"))
+        if shared is not None:
+            self.logger.info("Reusing the OS scan of the base layers " + chain + " for the image " + self.image_to_scan)
+            self.stage_status["os-name"] = "reused"
+            self.stage_status["os-packages"] = "reused"
+        return chain, shared
+
+    def release_base_chain(self, chain, os_name, languages):
+        """
+        Share the OS scan of the image with the other images of its base chain, when both of its stages completed
+        """
+        if chain is None:
+            return
+        shared = None
+        name = os_name.get("name", "") if isinstance(os_name, dict) else ""
+        completed = self.stage_status.get("os-name") == "completed" and self.stage_status.get("os-packages") == "completed"
+        if completed and name and not name.startswith(("No image available", "NA")):
+            shared = {"os": os_name, "languages": languages}
+        self.base_chains.release(chain, self.image_to_scan, shared)
+
+    def run_in_image(self, entrypoint, arguments, mount=False):
+        """
+        Run a probe command in the image, through the probe container when one is running
+        """
+        if isinstance(self.docker, DockerCliBackend):
+            # the docker CLI goes through run_command, which times the command itself
+            if self.probe is not None and self.probe.active:
+                return self.probe.exec(entrypoint, arguments)
+            return self.docker.run(self.image_to_scan, entrypoint, arguments, mount)
+        with self.tracer.span(self.image_to_scan, "run", kind="command", command=" ".join([entrypoint] + arguments)) as span:
+            if self.probe is not None and self.probe.active:
+                process = self.probe.exec(entrypoint, arguments)
+            else:
+                process = self.docker.run(self.image_to_scan, entrypoint, arguments, mount)
+            self.record_command(span, process, len(process.stdout or b""))
+            return process
+
+    def pull_image(self):
+        """
+        Pull the image explicitly so that pulls are bounded separately from container runs
+        """
+        self.logger.info("Pulling the image " + self.image_to_scan)
+        if isinstance(self.docker, DockerCliBackend):
+            pull_command = self.docker.pull_image(self.image_to_scan)
+        else:
+            with self.tracer.span(self.image_to_scan, "pull", kind="command", command="docker pull " + self.image_to_scan) as span:
+                pull_command = self.docker.pull_image(self.image_to_scan)
+                self.record_command(span, pull_command, 0)
+        if pull_command.returncode != 0:
+            self.logger.info("Unable to pull the image " + self.image_to_scan + " " + pull_command.stderr.decode().strip())
+        return pull_command.returncode == 0
             
     def get_os_name_general(self):
         """
@@ -16,7 +309,13 @@ class ImageScanner:
         """
         self.logger.info("Going to process the image by running general command to find out os " + self.image_to_scan)
         
-        general_command = subprocess.run(["docker","run","--entrypoint","cat","--memory-swap", "-1","--rm",self.image_to_scan,"/etc/os-release"], capture_output=True)
+        general_command = self.run_in_image("cat", ["/etc/os-release"])
+        return self.parse_os_release(general_command)
+
+    def parse_os_release(self, general_command):
+        """
+        Name and version lines of the /etc/os-release output, None when the file could not be read
+        """
         result_data = []
         if general_command.returncode == 0:
             result = general_command.stdout
@@ -30,26 +329,80 @@ class ImageScanner:
         """
         Delete the image after processing
         """
+        if not self.cleanup_enabled:
+            return
         try:
-            delete_command = subprocess.run(["docker","rmi", self.image_to_scan], capture_output=True)
+            self.docker.remove_image(self.image_to_scan)
         except Exception as e:
             self.logger.info("Exception while deleting the image " + str(e))
     
+    def sbom_file(self):
+        """
+        Persisted SBOM of the image content, named by its digest so that a tag pointing to a new image is not served
+        the old SBOM; None when the digest cannot be resolved
+        """
+        if self.digest is None:
+            self.digest = self.resolve_digest()
+        if self.digest is None:
+            return None
+        return os.path.join(self.sbom_dir, self.digest.replace(':', '_').replace('/', '_') + ".syft.json")
+
+    def get_sbom(self):
+        """
+        Run syft once for the image and keep its SBOM, loading a persisted one when available
+        """
+        if self.sbom is not None or self.sbom_error:
+            return self.sbom
+        sbom_file = self.sbom_file() if self.sbom_dir is not None else None
+        if sbom_file is not None and os.path.exists(sbom_file):
+            self.logger.info("Loading the persisted SBOM " + sbom_file)
+            with self.stage("sbom-load"), open(sbom_file, "rb") as f:
+                self.sbom = parse_syft_stream(f)
+            return self.sbom
+        self.logger.info("Running syft on the image " + self.image_to_scan)
+        sink = None
+        if sbom_file is not None:
+            os.makedirs(self.sbom_dir, exist_ok=True)
+            # images of the same digest may run syft at the same time, each writes its own partial file
+            sink = tempfile.NamedTemporaryFile(dir=self.sbom_dir, prefix=os.path.basename(sbom_file) + ".", suffix=".partial", delete=False)
+
+        def consume(stdout):
+            try:
+                return parse_syft_stream(stdout if sink is None else TeeReader(stdout, sink))
+            except ValueError as e:
+                self.logger.info("Exception while parsing the syft output " + str(e))
+                return None
+
+        try:
+            # a stage of its own: syft runs under whichever stage first needs the SBOM, or beside them in the async engine
+            with self.stage("sbom"):
+                syft_op, sbom = self.stream_command(["syft","--config", self.syft_path, self.syft_source,"-o","json"], consume, "syft")
+        finally:
+            if sink is not None:
+                sink.close()
+        if sbom is not None and syft_op.returncode == 0:
+            self.sbom = sbom
+            if sink is not None:
+                os.replace(sink.name, sbom_file)
+        else:
+            self.sbom_error = syft_op.stderr.decode() or "syft exited with " + str(syft_op.returncode)
+        if sink is not None and os.path.exists(sink.name):
+            os.remove(sink.name)
+        return self.sbom
+
     def run_syft(self):
         """
-        Run syft on the image to get the os name
+        Get the os name from the syft SBOM of the image
         """
-        syft_op = subprocess.run(["syft","--scope","all-layers",self.image_to_scan,"-o","json"],capture_output=True)
+        distro = self.get_sbom()
         os_name = None
-        if(syft_op.stdout and syft_op.returncode==0):
-            distro=json.loads(syft_op.stdout)
+        if distro is not None:
             try:
                 os_name=distro["distro"]["prettyName"]
             except Exception as e:
                 os_name = distro["distro"]
         else:
-            error_msg = syft_op.stderr.decode()
-            if "could not fetch image" in error_msg:
+            if "could not fetch image" in self.sbom_error:
                 os_name = "No image available (Unable to pull)"
         return os_name
     
@@ -106,11 +459,20 @@ class ImageScanner:
         """
         Get OS name by running general command and syft
         """
-        os = {}
-        os_name = None
         try:
             # Run the general command to get os name
             general_command_out = self.get_os_name_general()
+        except Exception as e:
+            return {'name': "NA - Tool(Syft and linux cmd) failed to find os"}
+        return self.os_name_from_release(general_command_out)
+
+    def os_name_from_release(self, general_command_out):
+        """
+        OS name from the os-release lines, falling back to the distro found by syft
+        """
+        os = {}
+        os_name = None
+        try:
             if general_command_out is not None and len(general_command_out) > 0:
                 os_name = self.format_os_name(general_command_out)
             # If general command is not produces any result, try running syft    
@@ -131,282 +493,175 @@ class ImageScanner:
         """
         Get installed programming languages from package managers
         """
-        # https://distrowatch.com/dwres.php?resource=package-management\
-        pkg_manager_command = {
-            "centos" : "rpm -q -a", "fedora": "rpm -q -a", "red": "rpm -q -a",
-            "photon" : "yum list installed",
-            "oracle linux" : "rpm -q -a",
-            "alpine": "apk list -I",
-            "debian": "apt list --installed", "ubuntu": "apt list --installed", 
-            }  
-        result_data = []       
+        result_data = []
         try:
-            if os_name is not None:    
-                osname = os_name.lower()
-                for item in pkg_manager_command:
-                    if item in osname:
-                        command_to_execute = pkg_manager_command[item]
-                        command_to_execute = command_to_execute.split()
-                        languages_os = subprocess.run(["docker","run","--entrypoint",command_to_execute[0],"--memory-swap", "-1","--rm",self.image_to_scan,command_to_execute[1],command_to_execute[2]], capture_output=True)
-                        
-                        if languages_os.returncode == 0:
-                            result = languages_os.stdout
-                            if result:
-                                data = result.splitlines()
-                                processed_data = [process.decode().strip() for process in data]
-                                result_data = [line for line in processed_data if \
-                                    line.startswith("python") or line.startswith("go") or line.startswith("node") or \
-                                    line.startswith("php") or line.startswith("libruby") or line.startswith("openjdk") or \
-                                    line.startswith("angular") or line.startswith("react")]
-                                return result_data
-                        break
+            command_to_execute = self.package_manager_command(os_name)
+            if command_to_execute is not None:
+                languages_os = self.run_in_image(command_to_execute[0], command_to_execute[1:])
+                result_data = self.parse_package_list(languages_os)
             return result_data
         except Exception as e:
             return result_data
-    
+
+    def package_manager_command(self, os_name):
+        """
+        Command listing the installed packages of the os, None when the package manager is not known
+        """
+        if os_name is None:
+            return None
+        osname = os_name.lower()
+        for item in pkg_manager_command:
+            if item in osname:
+                return pkg_manager_command[item].split()
+        return None
+
+    def parse_package_list(self, languages_os):
+        result_data = []
+        if languages_os.returncode == 0:
+            result = languages_os.stdout
+            if result:
+                data = result.splitlines()
+                processed_data = [process.decode().strip() for process in data]
+                result_data = [line for line in processed_data if line.startswith(language_package_prefixes)]
+        return result_data
+
     def run_individual_docker_run(self, languages):
         self.logger.info("Going to run individual language command for the image :"+ self.image_to_scan)
-        language_command = {
-            "python3" : "--version",
-            "python2.7": "--version",
-            "python2": "--version",
-            "python": "--version",
-            "go": "version",
-            "php8": "--version",
-            "php7": "--version",
-            "php": "--version",
-            "node" : "--version",
-            "nodejs" : "--version",
-            "ruby" : "--version",
-            "java" : "-version",
-            "angular": "version",
-            "react": "-v"
-        }
         resultant_data = {}
-        for iterate_lang in languages:
+        for language in languages:
             try:
-                language = iterate_lang
-                command = language_command[language]
-                if language == "angular":
-                    languages_os = subprocess.run(["docker","run","--entrypoint", "ng", "--memory-swap", "-1","--rm",self.image_to_scan,command],capture_output=True)
-                elif language == "react":
-                    languages_os = subprocess.run(["docker","run","--entrypoint", "npm", "--memory-swap", "-1","--rm",self.image_to_scan,"view", "react", "version"],capture_output=True)
-                else:
-                    languages_os = subprocess.run(["docker","run","--entrypoint", language, "--memory-swap", "-1","--rm",self.image_to_scan,command],capture_output=True)
-                    
-                if languages_os.returncode == 0:
-                    result = languages_os.stdout
-                    if result:
-                        data = result.splitlines()
-                        processed_data = [process.decode().strip() for process in data]
-                        if language == "angular":
-                            for i in processed_data:
-                                if "Angluar CLI" in i:
-                                    resultant_data[language] = i
-                            continue
-                        if len(processed_data) > 0 and processed_data[0] != '':
-                            resultant_data[language] = processed_data[0]
-                    else:
-                        # Sometimes Error message holds the data
-                        result_err = languages_os.stderr
-                        if result_err:
-                            data_err = result_err.splitlines()
-                            processed_data_err = [process_err.decode().strip() for process_err in data_err]
-                            if len(processed_data_err) > 0:
-                                data_to_write = processed_data_err[0]
-                                if "docker" not in data_to_write:
-                                    resultant_data[language] = data_to_write
+                entrypoint, arguments = self.language_version_command(language)
+                version = self.parse_language_version(language, self.run_in_image(entrypoint, arguments))
+                if version is not None:
+                    resultant_data[language] = version
             except Exception as e:
                 self.logger.info("Exception while running individual command "+ str(e))
-        
+
         return resultant_data
 
+    def language_version_command(self, language):
+        command = language_version_arguments[language]
+        if language == "angular":
+            return "ng", [command]
+        if language == "react":
+            return "npm", ["view", "react", "version"]
+        return language, [command]
+
+    def parse_language_version(self, language, languages_os):
+        """
+        Version line printed by a language binary, None when the language is not found
+        """
+        version = None
+        if languages_os.returncode == 0:
+            result = languages_os.stdout
+            if result:
+                data = result.splitlines()
+                processed_data = [process.decode().strip() for process in data]
+                if language == "angular":
+                    for i in processed_data:
+                        if "Angluar CLI" in i:
+                            version = i
+                    return version
+                if len(processed_data) > 0 and processed_data[0] != '':
+                    version = processed_data[0]
+            else:
+                # Sometimes Error message holds the data
+                result_err = languages_os.stderr
+                if result_err:
+                    data_err = result_err.splitlines()
+                    processed_data_err = [process_err.decode().strip() for process_err in data_err]
+                    if len(processed_data_err) > 0:
+                        data_to_write = processed_data_err[0]
+                        if "docker" not in data_to_write:
+                            version = data_to_write
+        return version
+
 
     def run_individual_language_command(self):
         self.logger.info("Going to run bash script for individual commands for the image : "+ self.image_to_scan)
-        language_command = [
-            "python3",
-            "python2.7",
-            "python2",
-            "python",
-            "go",
-            "php8",
-            "php7",
-            "php",
-            "node",
-            "nodejs",
-            "ruby",
-            'java',
-            "angular",
-            "react"
-        ]
         resultant_data = {}
         try:
-            path = subprocess.run(["pwd"], capture_output=True)
-            path = path.stdout.decode('utf-8').strip()
-            path = path+":/eol-mount/"
-            process = subprocess.run(["docker", "run", "-v", path, "--rm", "--entrypoint", "sh", self.image_to_scan, "/eol-mount/utils/run_individual_commands.sh"], capture_output=True)
+            process = self.run_in_image("sh", ["/eol-mount/utils/run_individual_commands.sh"], mount=True)
             if process.returncode == 0:
-                #While running individual language command the error message also comes in stdout if it is not found, it will give error only if bash script is not found in the docker container.
-                #So if bash is not present in the container, we'll run docker container for each language command
-                if process.stderr.decode('utf-8').strip() != '':        
-                    self.logger.info(f"Exception while running sh in the image: {self.image_to_scan}")
-                    self.logger.info("Going to run individual docker commands for all languages")
-                    resultant_data = self.run_individual_docker_run(self.image_to_scan, language_command)
-                    return resultant_data
-                versions = process.stdout.decode('utf-8').strip().split('#Separator#')
-                for i in range(len(language_command)):
-                    if "not found" in versions[i] or "/eol-mount/" in versions[i]:
-                        continue
-                    else:
-                        # multiple versions os same language in a image are concatenated with ',' as a separator, this is used later to extract the numeric version of each found versions. 
-                        # So here we remove the commas if present just to make sure there will be no invalid versions wile parsing.
-                        if language_command[i] == 'react':
-                            v = re.findall(
-                                "[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]", versions[i])
-                            if v == []:
-                                continue
-                            else:
-                                resultant_data[language_command[i]] = v[0]
-                                continue
-                        if language_command[i] == 'node' or language_command[i] == 'nodejs':
-                            v = re.findall("[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]", versions[i])
-                            if v == []:
-                                continue
-                            else:
-                                resultant_data[language_command[i]] = 'v'+v[0]
-                                continue                            
-                        if language_command[i] == "angular":
-                            v = re.findall(
-                                "[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]", versions[i])
-                            if v == []:
-                                continue
-                            else:
-                                resultant_data[language_command[i]] = v[0]
-                                continue
-                        if language_command[i] == "java":
-                            result = self.run_individual_docker_run(self.image_to_scan, ['java'])
-                            if 'java' in result:
-                                resultant_data[language_command[i]] = result['java']
-                            continue
-                        resultant_data[language_command[i]] = versions[i].replace(',', ' ')
+                resultant_data, remaining_languages = self.parse_language_script(process)
+                if len(remaining_languages) > 0:
+                    resultant_data.update(self.run_individual_docker_run(remaining_languages))
         except Exception as e:
             self.logger.info("Exception while running bash script command "+ str(e))
         return resultant_data
 
+    def parse_language_script(self, process):
+        """
+        Versions found by the language script and the languages that still have to be run on their own
+        """
+        resultant_data = {}
+        #While running individual language command the error message also comes in stdout if it is not found, it will give error only if bash script is not found in the docker container.
+        #So if bash is not present in the container, we'll run docker container for each language command
+        if process.stderr.decode('utf-8').strip() != '':
+            self.logger.info(f"Exception while running sh in the image: {self.image_to_scan}")
+            self.logger.info("Going to run individual docker commands for all languages")
+            return resultant_data, list(script_languages)
+        remaining_languages = []
+        versions = process.stdout.decode('utf-8').strip().split('#Separator#')
+        for i in range(len(script_languages)):
+            if "not found" in versions[i] or "/eol-mount/" in versions[i]:
+                continue
+            else:
+                # multiple versions os same language in a image are concatenated with ',' as a separator, this is used later to extract the numeric version of each found versions.
+                # So here we remove the commas if present just to make sure there will be no invalid versions wile parsing.
+                if script_languages[i] in ('react', 'node', 'nodejs', 'angular'):
+                    v = find_full_version(versions[i])
+                    if v is None:
+                        continue
+                    resultant_data[script_languages[i]] = 'v'+v if script_languages[i] in ('node', 'nodejs') else v
+                    continue
+                if script_languages[i] == "java":
+                    # java -version prints to stderr, so java is always run on its own
+                    remaining_languages.append('java')
+                    continue
+                resultant_data[script_languages[i]] = versions[i].replace(',', ' ')
+        return resultant_data, remaining_languages
+
     def check_if_library(self, path):
         """
         checking if the jar file is coming from the library (dependency)
         """
-        if ("lib/" in path) or ("libs/" in path) or ("share/" in path):
-            # Returning True if the jar/war is coming from library
-            return True
-        return False
-    
-    def parse_syft_output_java(self, output):
+        return is_library_path(path)
+
+    def parse_syft_output(self, output, name):
+        """
+        Run one extractor of the syft extractor table over an already loaded syft document
+        """
         try:
-            artifacts = output["artifacts"] if "artifacts" in output else [] 
-            if artifacts != []:
-                versions = []
-                paths = []
-                for item in artifacts:
-                    if 'metadata' in item:
-                        if 'java' in item['foundBy']:
-                            metadata = item["metadata"]
-                            path = metadata['virtualPath'] if "virtualPath" in metadata else ""
-                            if "manifest" in metadata:
-                                if "main" in metadata["manifest"]:
-                                    if "Build-Jdk" in metadata["manifest"]["main"]:
-                                        java_version = metadata["manifest"]["main"]["Build-Jdk"]
-                                        if path and not self.check_if_library(path):
-                                           versions.append(java_version)
-                                           paths.append(path + "("+ java_version + ")")
-                return list(set(versions)), paths
+            collector = ArtifactCollector({name: syft_extractors[name]})
+            for item in output.get("artifacts") or []:
+                collector.add(item)
+            return collector.result(name)
         except Exception as e:
-            self.logger.info("Exception while finding java version by syft: " + str(e))
+            self.logger.info("Exception while finding " + name + " version by syft: " + str(e))
             return None, None
-        return None, None
 
-    def parse_syft_output_react(self, output):
-        try:
-            artifacts = output['artifacts'] if "artifacts" in output else [] 
-            if artifacts != []:
-                versions = []
-                paths = []
-                for i in artifacts:
-                    if i["name"] == "react":
-                        if "version" in i:
-                            version = i["version"]
-                            versions.append(version)
-                            if "locations" in i:
-                                locations = i["locations"]
-                                for item_loc in locations:
-                                    if "path" in item_loc:
-                                        path = item_loc["path"] +"("+version+")"
-                                        paths.append(path)
-                return list(set(versions)), paths
+    def parse_syft_output_java(self, output):
+        return self.parse_syft_output(output, "java")
 
-        except Exception as e:
-            self.logger.info("Exception while finding react version by syft")
-            return None, None
-        return None, None
+    def parse_syft_output_react(self, output):
+        return self.parse_syft_output(output, "react")
 
     def parse_syft_output_angular(self, output):
-        try:
-            artifacts = output['artifacts'] if "artifacts" in output else [] 
-            if artifacts != []:
-                versions = []
-                paths = []
-                for i in artifacts:
-                    if i["name"] == "@angular-devkit/core" or i["name"] == "@angular/cli" or i["name"] == "@schematics/angular":
-                        if "version" in i:
-                            version = i["version"]
-                            versions.append(version)
-                            if "locations" in i:
-                                locations = i["locations"]
-                                for item_loc in locations:
-                                    if "path" in item_loc:
-                                        path = item_loc["path"] +"("+version+")"
-                                        paths.append(path)
-                return list(set(versions)), paths
-
-        except Exception as e:
-            self.logger.info("Exception while finding angular version by syft")
-            return None, None
-        return None, None
+        return self.parse_syft_output(output, "angular")
 
     def run_syft_to_get_binaries(self, syft_path):
         self.logger.info("running syft to get executable details")
-        syft_op = subprocess.run(["syft","--config", syft_path, self.image_to_scan,"-o","json"],capture_output=True)
-        
-        if(syft_op.stdout and syft_op.returncode==0):
-            syft_result=json.loads(syft_op.stdout)
-            java_versions, java_paths = self.parse_syft_output_java(syft_result)
-            angular_versions, angular_paths = self.parse_syft_output_angular(syft_result)         
-            react_versions, react_paths = self.parse_syft_output_react(syft_result)    
-            try:
-                artifacts = syft_result["artifacts"] if "artifacts" in syft_result else []
-                if artifacts != []:
-                    versions = []
-                    paths = []
-                    # Found something related to go
-                    for item in artifacts:
-                        if "metadata" in item:
-                            metadata = item["metadata"]
-                            if "goCompiledVersion" in metadata:
-                                go_version = metadata["goCompiledVersion"]
-                                versions.append(go_version)
-                                if "locations" in item:
-                                    locations = item["locations"]
-                                    for item_loc in locations:
-                                        if "path" in item_loc:
-                                            path = item_loc["path"] +"("+go_version+")"
-                                            paths.append(path)
-                    return list(set(versions)), paths, java_versions, java_paths, angular_versions, angular_paths, react_versions, react_paths
-                            
-            except Exception as e:
-                self.logger.info("Exception while finding go version by syft: " + str(e))
-                return None, None, java_versions, java_paths, angular_versions, angular_paths, react_versions, react_paths
+        self.syft_path = syft_path
+        syft_result = self.get_sbom()
+
+        if syft_result is not None:
+            extracted = syft_result["extracted"]
+            go_versions, go_paths = extracted["go"]
+            java_versions, java_paths = extracted["java"]
+            angular_versions, angular_paths = extracted["angular"]
+            react_versions, react_paths = extracted["react"]
+            return go_versions, go_paths, java_versions, java_paths, angular_versions, angular_paths, react_versions, react_paths
         return None, None, None, None, None, None, None, None
     
     def extract_language(self, data, os):
@@ -436,8 +691,51 @@ class ImageScanner:
             self.logger.info("Exception while extracting language : "+ str(e))
             return final_dict
                            
+    def resolve_digest(self):
+        """
+        Content digest of the image, from the local image when present, otherwise from the registry without pulling
+        """
+        local_image = self.docker.image_digests(self.image_to_scan)
+        if local_image is not None:
+            repo_digests, image_id = local_image
+            if len(repo_digests) > 0:
+                return repo_digests[0].split("@")[-1]
+            # Locally built image that was never pushed
+            return image_id or None
+        digest = self.docker.remote_digest(self.image_to_scan)
+        if digest is None:
+            self.logger.info("Unable to resolve the digest of the image " + self.image_to_scan)
+        return digest
+
+    def get_scan_image_cached(self, scan_cache, syft_path="utils/syft.template.yml", pull=False):
+        """
+        Return the cached scan of the image digest, or scan the image and cache the result
+        """
+        digest = self.resolve_digest()
+        self.digest = digest
+        if digest is not None:
+            scan_details = scan_cache.get(digest, self.scan_backend)
+            if scan_details is not None:
+                self.logger.info("Using the cached scan of " + digest + " for the image " + self.image_to_scan)
+                self.cleanup_enabled = False
+                return {self.image_to_scan: {'scan_details': scan_details}}
+        self.start_deadline()
+        if pull:
+            self.pull_image()
+        result_os_images = self.get_scan_image(syft_path)
+        scan_details = result_os_images[self.image_to_scan]['scan_details']
+        # Failed scans are not cached so the next run retries them
+        os_name = scan_details.get("os", {}).get("name")
+        # neither are partial scans whose stages timed out or were skipped at the image deadline
+        partial = {"timed-out", "skipped"} & set(scan_details.get("stages", {}).values())
+        if digest is not None and os_name is not None and not os_name.startswith(("No image available", "NA - Tool")) and not partial:
+            scan_cache.put(digest, self.scan_backend, self.image_to_scan, scan_details)
+        return result_os_images
+
     def get_scan_image(self, syft_path="utils/syft.template.yml"):
         self.logger.info("Going to process the image "+ self.image_to_scan)
+        self.syft_path = syft_path
+        self.start_deadline()
         try:
             
             result_os_images = {}
@@ -454,46 +752,37 @@ class ImageScanner:
             syft_executables_react = None
             syft_path_react = None 
 
-            os_name = self.get_os_name()
-            scan_image_details["os"] = os_name
-            
-            #get programming languages by os (pakage manager)
-            name_of_os = os_name['name'] if "name" in os_name else None
-            result_data_languages_os = self.get_languages_by_os(name_of_os)
-            result_data_languages_specific = self.run_individual_language_command()
-            
-            #Comparing the package manager result and individual language command result and removing the duplicates
-            if result_data_languages_specific != {} and result_data_languages_os is not None and len(result_data_languages_os) > 0:
-                matched_languages = list(result_data_languages_specific.keys())
-                
-                remove_languages = []
-                for match in matched_languages:
-                    for os_languages in result_data_languages_os:
-                        if os_languages.startswith(match):
-                            remove_languages.append(os_languages)
-                
-                result_data_languages_os = [item for item in result_data_languages_os if item not in remove_languages]
-                scan_image_details["languages"] = result_data_languages_os
+            # images on an already scanned base chain skip the os half of the scan
+            chain, shared = self.lookup_base_chain()
+
+            if self.use_probe_session:
+                self.probe = ProbeSession(self.image_to_scan, self.logger, self.docker)
+                with self.stage("probe-start"):
+                    self.probe.start()
+
+            if shared is not None:
+                os_name, result_data_languages_os = shared["os"], shared["languages"]
+                scan_image_details["os"] = os_name
             else:
-                scan_image_details["languages"] = result_data_languages_os
-            
-            
-            #get programming languages - specific
-            scan_image_details["languages-specific"] = result_data_languages_specific
-       
-            syft_executables_go, syft_path_go, syft_executables_java, syft_path_java, syft_executables_angular, syft_path_angular, syft_executables_react, syft_path_react = self.run_syft_to_get_binaries(syft_path)
-            scan_image_details["languages-syft"] = [syft_executables_go, syft_executables_java, syft_executables_angular, syft_executables_react]
-
-            scan_image_details["languages-syft-go-paths"] = syft_path_go
-            scan_image_details["languages-syft-java-paths"] = syft_path_java
-            scan_image_details["languages-syft-angular-paths"] = syft_path_angular
-            scan_image_details["languages-syft-react-paths"] = syft_path_react
-            
-            self.logger.info("OS level programming languages ")
-            self.logger.info(scan_image_details["languages"])
-            
-            self.logger.info("Default programming languages ")
-            self.logger.info(scan_image_details["languages-specific"])
+                os_name = {}
+                try:
+                    with self.stage("os-name"):
+                        os_name = self.get_os_name()
+                    scan_image_details["os"] = os_name
+
+                    #get programming languages by os (pakage manager)
+                    name_of_os = os_name['name'] if "name" in os_name else None
+                    with self.stage("os-packages"):
+                        result_data_languages_os = self.get_languages_by_os(name_of_os)
+                finally:
+                    self.release_base_chain(chain, os_name, result_data_languages_os)
+            with self.stage("language-probe"):
+                result_data_languages_specific = self.run_individual_language_command()
+
+            with self.stage("executables"):
+                syft_results = self.run_syft_to_get_binaries(syft_path)
+            syft_executables_go, syft_path_go, syft_executables_java, syft_path_java, syft_executables_angular, syft_path_angular, syft_executables_react, syft_path_react = syft_results
+            self.fill_scan_details(scan_image_details, result_data_languages_os, result_data_languages_specific, syft_results)
             result_os_images[self.image_to_scan] = {'scan_details': scan_image_details}
             
         except Exception as e:
@@ -509,11 +798,46 @@ class ImageScanner:
             prepare_data["languages-syft-react-paths"] = syft_path_react
             
             result_os_images[self.image_to_scan] = {"scan_details": prepare_data}
-            
+        result_os_images[self.image_to_scan]["scan_details"]["stages"] = self.stage_results()
+
+        if self.probe is not None:
+            self.probe.stop()
+            self.probe = None
         self.cleanup_image()
         return result_os_images
 
             
+    def fill_scan_details(self, scan_image_details, result_data_languages_os, result_data_languages_specific, syft_results):
+        syft_executables_go, syft_path_go, syft_executables_java, syft_path_java, syft_executables_angular, syft_path_angular, syft_executables_react, syft_path_react = syft_results
+        #Comparing the package manager result and individual language command result and removing the duplicates
+        if result_data_languages_specific != {} and result_data_languages_os is not None and len(result_data_languages_os) > 0:
+            matched_languages = list(result_data_languages_specific.keys())
+
+            remove_languages = []
+            for match in matched_languages:
+                for os_languages in result_data_languages_os:
+                    if os_languages.startswith(match):
+                        remove_languages.append(os_languages)
+
+            result_data_languages_os = [item for item in result_data_languages_os if item not in remove_languages]
+        scan_image_details["languages"] = result_data_languages_os
+
+        #get programming languages - specific
+        scan_image_details["languages-specific"] = result_data_languages_specific
+        scan_image_details["languages-syft"] = [syft_executables_go, syft_executables_java, syft_executables_angular, syft_executables_react]
+
+        scan_image_details["languages-syft-go-paths"] = syft_path_go
+        scan_image_details["languages-syft-java-paths"] = syft_path_java
+        scan_image_details["languages-syft-angular-paths"] = syft_path_angular
+        scan_image_details["languages-syft-react-paths"] = syft_path_react
+
+        self.logger.info("OS level programming languages ")
+        self.logger.info(scan_image_details["languages"])
+
+        self.logger.info("Default programming languages ")
+        self.logger.info(scan_image_details["languages-specific"])
+        return scan_image_details
+
     def language_format_for_csv(self, languages):
         data = ''
         try:
@@ -530,24 +854,7 @@ class ImageScanner:
             return data
     
     def binary_version_detect(self, language, version):
-        version = version.split()
-        binary_version_detect = {
-                                 "python" : version[1] if len(version) > 2 else "".join(version),
-                                 "python2" : version[1] if len(version) > 2 else "".join(version),
-                                 "python2.7" : version[1] if len(version) > 2 else "".join(version),
-                                 "python3" : version[1] if len(version) > 2 else "".join(version),
-                                 "go": version[2] if len(version) > 3 else "".join(version),
-                                 "php": version[1] if len(version) > 2 else "".join(version),
-                                 "php7": version[1] if len(version) > 2 else "".join(version),
-                                 "php8": version[1] if len(version) > 2 else "".join(version),
-                                 "nodejs": version[0] if len(version) > 1 else "".join(version), 
-                                 "node": version[0] if len(version) > 1 else "".join(version),
-                                 "ruby": version[1] if len(version) > 1 else "".join(version),
-                                 "java": version[2] if len(version) > 2 else "".join(version),
-                                 "angular": version[2] if len(version) > 2 else "".join(version),
-                                 "react": version[0]
-                                 }
-        return binary_version_detect[language]
+        return binary_version(language, version)
     
     def seperate_by_language(self, oslanguages, languages_specific, languages_executables_go, languages_executables_java, languages_executables_angular, languages_executables_react):
         try:
@@ -679,6 +986,9 @@ class ImageScanner:
         return go, python, php, node, ruby, java, angular, react                    
                 
     def create_csv_file(self, scan_image_data):
+        """
+        Report columns of the image as {column: [value]}, ready for csv.DictWriter or a DataFrame
+        """
         image_names = []
         os = []
         os_languages = []
@@ -749,20 +1059,52 @@ class ImageScanner:
             'Image name' : image_names, 'Base OS' : os, 
             'Python' : python_list, 'Go' : go_list, 'Php' : php_list, 'Node' : node_list, "Ruby": ruby_list, "Java": java_list, "Angular": angular_list, "React": react_list
             }
-        df = pd.DataFrame(final_data)
-        return df
+        return final_data
         
-    def write_updated_json(self, filename, result_os_images):
+    def build_image_record(self, scan_image_data):
+        """
+        Build the typed record of the detected runtimes straight from the scan details
+        """
+        scan_details = scan_image_data[self.image_to_scan]['scan_details']
+        os_name = scan_details.get('os', {}).get('name', "NA")
+        record = ImageRecord(self.image_to_scan, os_name, digest=self.digest, stages=scan_details.get("stages"))
+        try:
+            oslanguages = scan_details.get('languages')
+            if type(oslanguages) is list:
+                for language, version in self.extract_language(oslanguages, str(os_name)).items():
+                    record.add(language, version, "os")
+
+            languagesspecific = scan_details.get('languages-specific')
+            if type(languagesspecific) is dict:
+                for language, version in languagesspecific.items():
+                    record.add(language, self.binary_version_detect(language, version), "default")
+
+            executablelanguages = scan_details.get('languages-syft') or []
+            for index, language in enumerate(["go", "java", "angular", "react"]):
+                versions = executablelanguages[index] if index < len(executablelanguages) else None
+                paths = scan_details.get('languages-syft-' + language + '-paths') or []
+                for version in versions or []:
+                    suffix = "(" + version + ")"
+                    version_paths = [path[:-len(suffix)] for path in paths if path.endswith(suffix)]
+                    for path in version_paths or [None]:
+                        record.add(language, version, "executable", path)
+        except Exception as e:
+            self.logger.info("Exception while building the record of the image " + self.image_to_scan + " " + str(e))
+        return record
+
+    def write_updated_json(self, filename, result_os_images, json_dir=None):
         
-        self.logger.info("Going to prepare the csv file")
-        with open(filename+".json", "w") as f:
-            json.dump(result_os_images, f)
-        dataframe = self.create_csv_file(result_os_images)
-        self.cleanup_image()
-        return dataframe
+        self.logger.info("Going to prepare the report record")
+        # The raw scan details are only kept on disk when a directory is given for them
+        if json_dir is not None:
+            os.makedirs(json_dir, exist_ok=True)
+            with open(os.path.join(json_dir, filename+".json"), "w") as f:
+                json.dump(result_os_images, f)
+        # get_scan_image already removed the image
+        return self.build_image_record(result_os_images)
 
     def cleanup_docker_space(self):
         try:
-            delete_command = subprocess.run(["docker","system", "prune", "-a", "-f"], capture_output=True)
+            self.docker.prune()
         except Exception as e:
             self.logger.info("Exception while deleting the docker space " + str(e))
@@ -0,0 +1,67 @@
+# Report columns, in order, and the record language each one holds
+report_languages = ["Python", "Go", "Php", "Node", "Ruby", "Java", "Angular", "React"]
+record_languages = [language.lower() for language in report_languages]
+# Columns of a report row
+report_columns = ["Image name", "Base OS"] + [column for language in report_languages for column in
+                                              (language, language + " - Upgrade Required?", language + " - Eol Details")] + ["Upgrade Required ?"]
+
+
+class RuntimeRecord:
+    """
+    One detected language runtime: source is "os" (package manager), "default" (binary on the path) or "executable" (syft)
+    """
+    __slots__ = ("language", "version", "source", "path")
+
+    def __init__(self, language, version, source, path=None):
+        self.language = language
+        self.version = version
+        self.source = source
+        self.path = path
+
+    def item(self):
+        return self.version + "(" + self.source + ")"
+
+    def to_dict(self):
+        return {"language": self.language, "version": self.version, "source": self.source, "path": self.path}
+
+    def __repr__(self):
+        return "RuntimeRecord(" + self.language + ", " + self.item() + ")"
+
+
+class ImageRecord:
+    """
+    The runtimes detected in one image, carried as is from detection to the EOL evaluation and the report
+    """
+    __slots__ = ("image", "os_name", "runtimes", "digest", "stages")
+
+    def __init__(self, image, os_name, runtimes=None, digest=None, stages=None):
+        self.image = image
+        self.os_name = os_name
+        self.runtimes = runtimes if runtimes is not None else []
+        # content digest of the scanned image when it was resolved, and the status of the scan stages
+        self.digest = digest
+        self.stages = stages if stages is not None else {}
+
+    def add(self, language, version, source, path=None):
+        # A package or binary name is attributed to every report language it contains (e.g. nodejs -> node)
+        for record_language in record_languages:
+            if record_language in language:
+                self.runtimes.append(RuntimeRecord(record_language, version, source, path))
+
+    def items(self, language):
+        """
+        Distinct "<version>(<source>)" items of a language, in detection order
+        """
+        return list(dict.fromkeys(runtime.item() for runtime in self.runtimes if runtime.language == language))
+
+    def to_dict(self):
+        return {"image": self.image, "os": self.os_name, "runtimes": [runtime.to_dict() for runtime in self.runtimes],
+                "digest": self.digest, "stages": self.stages}
+
+
+def record_from_dict(data):
+    """
+    ImageRecord of its to_dict form, e.g. a record stored by a queue worker
+    """
+    runtimes = [RuntimeRecord(runtime["language"], runtime["version"], runtime["source"], runtime.get("path")) for runtime in data["runtimes"]]
+    return ImageRecord(data["image"], data["os"], runtimes, data.get("digest"), data.get("stages"))
@@ -0,0 +1,231 @@
+import json
+import math
+import os
+import queue
+import socketserver
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from scanTrace import get_tracer
+
+
+class ScanJob:
+    def __init__(self, image, digest):
+        self.id = uuid.uuid4().hex
+        self.image = image
+        self.digest = digest
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self.callers = 1
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {"id": self.id, "image": self.image, "digest": self.digest, "status": self.status,
+                "result": self.result, "error": self.error, "submitted": self.submitted,
+                "finished": self.finished, "callers": self.callers}
+
+
+class ScanService:
+    """
+    Long-running scanner: queues scan jobs, keeps the EOL data warm and runs one scan per digest at a time
+    """
+    def __init__(self, logger, batch_scanner, eol_artifacts, workers=2, eol_refresh=24 * 3600, keep_jobs=10000):
+        self.logger = logger
+        self.batch_scanner = batch_scanner
+        self.eol_artifacts = eol_artifacts
+        self.workers = workers
+        self.eol_refresh = eol_refresh
+        self.keep_jobs = keep_jobs
+        self.jobs = {}
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.eol_lock = threading.Lock()
+        self.eol_loaded = 0
+        self.pending = queue.Queue()
+
+    def get_eol_artifacts(self):
+        """
+        EOL data loaded once and reloaded by the next job after eol_refresh seconds
+        """
+        with self.eol_lock:
+            if time.time() - self.eol_loaded > self.eol_refresh:
+                # the index is compiled against today, so cycles whose EOL date passed since the last load expire
+                self.eol_artifacts.today = datetime.today()
+                self.eol_artifacts.apiData = self.eol_artifacts.get_eol_data()
+                self.eol_loaded = time.time()
+        return self.eol_artifacts
+
+    def submit(self, image):
+        """
+        Queue a scan of the image, or join the scan of the same digest that is already queued or running
+        """
+        digest = self.batch_scanner.create_scanner(image).resolve_digest()
+        key = digest or image
+        with self.lock:
+            job = self.inflight.get(key)
+            if job is not None:
+                job.callers += 1
+                self.logger.info("Joining the running scan of " + key + " for the image " + image)
+                return job
+            job = ScanJob(image, digest)
+            self.jobs[job.id] = job
+            self.inflight[key] = job
+            self.forget_old_jobs()
+        self.pending.put(job)
+        return job
+
+    def forget_old_jobs(self):
+        if len(self.jobs) <= self.keep_jobs:
+            return
+        finished = sorted((job for job in self.jobs.values() if job.done.is_set()), key=lambda job: job.finished)
+        for job in finished[:len(self.jobs) - self.keep_jobs]:
+            del self.jobs[job.id]
+
+    def run_job(self, job):
+        job.status = "running"
+        try:
+            record = self.batch_scanner.scan_one(job.image)
+            if record is None:
+                raise Exception("scan failed")
+            job.result = self.get_eol_artifacts().add_eol_status([record])[0]
+            job.status = "completed"
+        except Exception as e:
+            self.logger.info("Exception while running the scan job of " + job.image + " " + str(e))
+            job.error = str(e)
+            job.status = "failed"
+        job.finished = time.time()
+        with self.lock:
+            self.inflight.pop(job.digest or job.image, None)
+        job.done.set()
+
+    def worker(self):
+        while True:
+            job = self.pending.get()
+            if job is None:
+                return
+            self.run_job(job)
+
+    def start(self):
+        self.get_eol_artifacts()
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    def stop(self):
+        for _ in range(self.workers):
+            self.pending.put(None)
+
+
+class ScanRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /scans {"image": ...} queues a scan, GET /scans/<id>?wait=<seconds> returns it, GET /health, GET /metrics
+    """
+    service = None
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def wait_seconds(self, query):
+        """
+        Seconds to wait for the job from the wait query parameter, 0 when it is missing or negative, raises ValueError
+        when it is not a finite number
+        """
+        wait = parse_qs(query).get("wait")
+        if not wait:
+            return 0
+        seconds = float(wait[0])
+        if not math.isfinite(seconds):
+            raise ValueError("wait is not a finite number")
+        return max(seconds, 0)
+
+    def send_metrics(self):
+        data = get_tracer().metrics_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/scans":
+            return self.send_json(404, {"error": "not found"})
+        try:
+            wait = self.wait_seconds(url.query)
+        except ValueError:
+            return self.send_json(400, {"error": "expected wait to be a number of seconds"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            image = json.loads(self.rfile.read(length))["image"]
+        except Exception:
+            return self.send_json(400, {"error": "expected a JSON body with an image"})
+        job = self.service.submit(image)
+        if wait:
+            job.done.wait(wait)
+        self.send_json(202 if not job.done.is_set() else 200, job.to_dict())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self.send_json(200, {"status": "ok", "queued": self.service.pending.qsize(), "jobs": len(self.service.jobs)})
+        if url.path == "/metrics":
+            return self.send_metrics()
+        if not url.path.startswith("/scans/"):
+            return self.send_json(404, {"error": "not found"})
+        try:
+            wait = self.wait_seconds(url.query)
+        except ValueError:
+            return self.send_json(400, {"error": "expected wait to be a number of seconds"})
+        job = self.service.jobs.get(url.path[len("/scans/"):])
+        if job is None:
+            return self.send_json(404, {"error": "unknown job"})
+        if wait:
+            job.done.wait(wait)
+        self.send_json(200, job.to_dict())
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        self.service.logger.info(self.address_string() + " " + format % args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def serve(service, address):
+    """
+    Serve the scan API on "host:port" or on a Unix socket given as "unix:/path/to.sock"
+    """
+    handler = type("BoundScanRequestHandler", (ScanRequestHandler,), {"service": service})
+    if address.startswith("unix:"):
+        server = ThreadingUnixHTTPServer(address[len("unix:"):], handler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), handler)
+    service.start()
+    service.logger.info("Scan service listening on " + address)
+    try:
+        server.serve_forever()
+    finally:
+        service.stop()
+        server.server_close()
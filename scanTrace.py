@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the duration histograms, from a quick probe up to the 20 minute scans
+duration_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+
+# Histogram per span kind: kind -> (metric name, help)
+duration_metrics = {
+    "stage": ("eol_scan_stage_duration_seconds", "Duration of the scan pipeline stages"),
+    "command": ("eol_scan_command_duration_seconds", "Duration of the external commands run by the scans"),
+}
+
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def trace_file_name(image):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", image) + ".trace.json"
+
+
+def replace_file(path, write):
+    """
+    Write a file through a temporary file of its own next to it and move it in place, readers never see a partial file
+    """
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".partial")
+    try:
+        with os.fdopen(handle, "w") as f:
+            write(f)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(duration_buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(duration_buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(duration_buckets, self.counts):
+            cumulative += count
+            yield name + "_bucket{" + labels + ',le="' + str(bound) + '"} ' + str(cumulative)
+        yield name + "_bucket{" + labels + ',le="+Inf"} ' + str(self.count)
+        yield name + "_sum{" + labels + "} " + repr(round(self.total, 6))
+        yield name + "_count{" + labels + "} " + str(self.count)
+
+
+class Tracer:
+    """
+    Timing spans of the scan stages and of every external command, aggregated into per-stage histograms and,
+    when a trace directory is set, written as one Chrome trace event file per image (chrome://tracing, Perfetto)
+    """
+    def __init__(self, trace_dir=None, metrics_file=None):
+        self.trace_dir = trace_dir
+        self.metrics_file = metrics_file
+        if trace_dir is not None:
+            os.makedirs(trace_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        # the trace and metrics files are written by whichever thread finishes an image, one at a time
+        self.export_lock = threading.Lock()
+        # image (None for spans outside any image) -> finished spans, only kept while traces are written
+        self.spans = defaultdict(list)
+        # (kind, stage, status) -> duration histogram
+        self.durations = defaultdict(Histogram)
+        # (stage,) -> seconds spent waiting for a concurrency slot
+        self.waits = defaultdict(Histogram)
+        # stage -> stdout bytes of the commands
+        self.stdout_bytes = defaultdict(int)
+        self.started = time.time()
+
+    @contextmanager
+    def span(self, image, stage, kind="stage", root=False, **attributes):
+        """
+        Time the block as a span; the block may add attributes such as exit_code or stdout_bytes to the yielded dict.
+        The trace file of the image is written when its root span ends.
+        """
+        span = dict(attributes, image=image, stage=stage, kind=kind, start=time.time(), thread=threading.get_ident())
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["status"] = "error"
+            span.setdefault("error", type(e).__name__ + ": " + str(e))
+            raise
+        finally:
+            span["duration"] = time.perf_counter() - started
+            if "status" not in span:
+                span["status"] = "failed" if span.get("exit_code") not in (None, 0) else "ok"
+            self.record(span)
+            if root:
+                self.finish_image(image)
+
+    def record(self, span):
+        with self.lock:
+            self.durations[(span["kind"], span["stage"], span["status"])].observe(span["duration"])
+            if "wait" in span:
+                self.waits[span["stage"]].observe(span["wait"])
+            if span.get("stdout_bytes"):
+                self.stdout_bytes[span["stage"]] += span["stdout_bytes"]
+            if self.trace_dir is not None:
+                self.spans[span["image"]].append(span)
+
+    def finish_image(self, image):
+        """
+        Write the trace file of the image and the metrics file, and drop the spans of the image
+        """
+        with self.lock:
+            spans = self.spans.pop(image, [])
+        try:
+            if self.trace_dir is not None and spans:
+                self.write_trace(os.path.join(self.trace_dir, trace_file_name(image or "run-" + str(os.getpid()))), spans)
+            self.write_metrics()
+        except Exception as e:
+            # the scan itself is done, a failed export must not fail it
+            logging.getLogger("eol-images-scan").info("Exception while writing the trace or metrics of " + str(image) + " " + str(e))
+
+    def write_trace(self, path, spans):
+        events = []
+        for span in spans:
+            arguments = {key: value for key, value in span.items() if key not in ("stage", "kind", "start", "duration", "thread")}
+            events.append({"name": span["stage"], "cat": span["kind"], "ph": "X", "pid": os.getpid(), "tid": span["thread"],
+                           "ts": int(span["start"] * 1000000), "dur": int(span["duration"] * 1000000), "args": arguments})
+        with self.export_lock:
+            replace_file(path, lambda f: json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str))
+
+    def metrics_text(self):
+        """
+        Prometheus text exposition of the histograms and counters
+        """
+        with self.lock:
+            durations = sorted(self.durations.items())
+            waits = sorted(self.waits.items())
+            stdout_bytes = sorted(self.stdout_bytes.items())
+        lines = []
+        for kind, (name, description) in duration_metrics.items():
+            lines.append("# HELP " + name + " " + description)
+            lines.append("# TYPE " + name + " histogram")
+            for (span_kind, stage, status), histogram in durations:
+                if span_kind == kind:
+                    lines.extend(histogram.lines(name, 'stage="' + label_value(stage) + '",status="' + label_value(status) + '"'))
+        lines.append("# HELP eol_scan_command_wait_seconds Time the commands waited for a concurrency slot of their stage")
+        lines.append("# TYPE eol_scan_command_wait_seconds histogram")
+        for stage, histogram in waits:
+            lines.extend(histogram.lines("eol_scan_command_wait_seconds", 'stage="' + label_value(stage) + '"'))
+        lines.append("# HELP eol_scan_command_stdout_bytes_total Bytes written to stdout by the commands")
+        lines.append("# TYPE eol_scan_command_stdout_bytes_total counter")
+        for stage, total in stdout_bytes:
+            lines.append('eol_scan_command_stdout_bytes_total{stage="' + label_value(stage) + '"} ' + str(total))
+        lines.append("# HELP eol_scan_start_time_seconds Start time of the scanner process")
+        lines.append("# TYPE eol_scan_start_time_seconds gauge")
+        lines.append("eol_scan_start_time_seconds " + repr(round(self.started, 3)))
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        """
+        Rewrite the metrics file atomically, as the node_exporter textfile collector expects
+        """
+        if self.metrics_file is None:
+            return
+        with self.export_lock:
+            text = self.metrics_text()
+            replace_file(self.metrics_file, lambda f: f.write(text))
+
+    def close(self):
+        # spans outside any image (e.g. loading the EOL data) go to the run trace
+        for image in list(self.spans):
+            self.finish_image(image)
+        self.write_metrics()
+
+
+class CountingReader:
+    """
+    Counts the bytes read from a stream for the stdout_bytes of a streamed command
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+tracer = Tracer()
+
+
+def get_tracer():
+    return tracer
+
+
+def configure_tracing(trace_dir=None, metrics_file=None):
+    """
+    Replace the process tracer, used by every scanner created afterwards
+    """
+    global tracer
+    tracer = Tracer(trace_dir, metrics_file)
+    return tracer
@@ -0,0 +1,43 @@
+import threading
+
+
+class SingleFlight:
+    """
+    One owner at a time produces the value of a key, the other callers of the process wait for it instead of
+    producing it again
+    """
+    def __init__(self, lock=None):
+        # shared with the caller when its lookups and stores need the caller's own lock
+        self.lock = lock if lock is not None else threading.Lock()
+        # key -> (event set once its value is stored or given up, owner producing it)
+        self.inflight = {}
+
+    def acquire(self, key, owner, lookup, timeout=None):
+        """
+        Value lookup() finds for the key, waiting while another owner produces it. None makes the caller the owner of
+        the key, which must release it afterwards. lookup runs under the lock.
+        """
+        while True:
+            with self.lock:
+                value = lookup()
+                if value is not None:
+                    return value
+                entry = self.inflight.get(key)
+                if entry is None:
+                    self.inflight[key] = (threading.Event(), owner)
+                    return None
+            if not entry[0].wait(timeout):
+                # the owner is taking too long, the caller produces the value without sharing
+                return None
+
+    def release(self, key, owner, store=None):
+        """
+        Run store() under the lock when the owner produced the value, and let the callers waiting for the key go on
+        """
+        with self.lock:
+            if store is not None:
+                store()
+            entry = self.inflight.get(key)
+            if entry is not None and entry[1] == owner:
+                del self.inflight[key]
+                entry[0].set()
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class SqliteLru:
+    """
+    SQLite table of text values keyed by one column, evicting the least recently used rows once their total size is over
+    max_bytes. Lookups, stores, evictions and invalidations are counted in a stats table of the same file.
+    """
+    def __init__(self, path, logger, table, key, value, max_bytes, columns=(), label=None):
+        self.logger = logger
+        self.table = table
+        self.key = key
+        self.value = value
+        # extra indexed columns stored with every row, an invalidation matches them as well as the key
+        self.columns = list(columns)
+        self.max_bytes = max_bytes
+        self.label = label or table
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS " + table + " (" + key + " TEXT PRIMARY KEY, " +
+                                    "".join(column + " TEXT, " for column in self.columns) +
+                                    value + " TEXT, size INTEGER, created REAL, last_used REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS " + table + "_last_used ON " + table + " (last_used)")
+            for column in self.columns:
+                self.connection.execute("CREATE INDEX IF NOT EXISTS " + table + "_" + column + " ON " + table + " (" + column + ")")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+
+    def count(self, name, value=1):
+        self.connection.execute("INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, value))
+
+    def get(self, key):
+        """
+        Stored value of a key, or None
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT " + self.value + " FROM " + self.table + " WHERE " + self.key + " = ?", (key,)).fetchone()
+            if row is None:
+                self.count("misses")
+                return None
+            self.connection.execute("UPDATE " + self.table + " SET last_used = ? WHERE " + self.key + " = ?", (time.time(), key))
+            self.count("hits")
+        return row[0]
+
+    def contains(self, key):
+        """
+        Whether a key is stored, without counting a lookup
+        """
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM " + self.table + " WHERE " + self.key + " = ?", (key,)).fetchone() is not None
+
+    def put(self, key, value, **columns):
+        now = time.time()
+        names = [self.key] + self.columns + [self.value, "size", "created", "last_used"]
+        values = [key] + [columns.get(column) for column in self.columns] + [value, len(value), now, now]
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO " + self.table + " (" + ", ".join(names) + ") VALUES (" + ", ".join("?" * len(names)) + ")",
+                                    values)
+            self.count("stores")
+            self.evict()
+
+    def evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM " + self.table).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.connection.execute("SELECT " + self.key + ", size FROM " + self.table + " ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.connection.execute("DELETE FROM " + self.table + " WHERE " + self.key + " = ?", (key,))
+            total -= size
+            evicted += 1
+        self.count("evictions", evicted)
+        self.logger.info("Evicted " + str(evicted) + " entries from the " + self.label)
+
+    def invalidate(self, reference=None):
+        """
+        Drop the rows whose key or extra column is the reference, or every row when no reference is given
+        """
+        with self.lock, self.connection:
+            if reference is None:
+                removed = self.connection.execute("DELETE FROM " + self.table).rowcount
+            else:
+                matched = [self.key] + self.columns
+                removed = self.connection.execute("DELETE FROM " + self.table + " WHERE " + " OR ".join(column + " = ?" for column in matched),
+                                                  [reference] * len(matched)).rowcount
+            self.count("invalidations", removed)
+        return removed
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.connection.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM " + self.table).fetchone()
+        for name in ["hits", "misses", "stores", "evictions", "invalidations"]:
+            stats.setdefault(name, 0)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["entries"] = entries
+        stats["size_bytes"] = size
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
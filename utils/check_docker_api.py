@@ -0,0 +1,238 @@
+"""
+Engine API backend against a fake docker daemon on a unix socket.
+
+The fake daemon answers the container create / attach / start / wait / remove, exec, image pull and distribution
+calls of DockerApiBackend, with "echo" printing its arguments and "sleep" hanging until the container is removed.
+The checks cover a plain run and exec, a run of an image that is pulled first, a run and an exec killed at their
+timeout, a call skipped once the deadline has passed, a failed pull and the registry digest of an image.
+
+    python3 utils/check_docker_api.py
+    python3 utils/check_docker_api.py --timeout 2
+"""
+import argparse
+import http.server
+import json
+import os
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commandExecutor import TimedOutProcess
+from dockerBackend import DockerApiBackend, DockerEngineClient
+
+
+class FakeDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, FakeDaemonHandler)
+        self.lock = threading.Lock()
+        self.containers = {}
+        self.execs = {}
+        # local images, and the images the fake registry can pull with their digest
+        self.images = {"alpine:latest"}
+        self.registry = {"alpine:latest": "sha256:" + "a" * 64, "registry.lan/team/app:1.0": "sha256:" + "b" * 64}
+        # (method, path without the query) of every request
+        self.calls = []
+
+
+class FakeDaemonHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, command, ended, started=None):
+        """
+        Multiplexed output of a command once started is set, "sleep" sends nothing until ended is set
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.flush()
+        if started is not None:
+            started.wait(60)
+        if command[0] == "echo":
+            data = (" ".join(command[1:]) + "\n").encode()
+            self.wfile.write(struct.pack(">BxxxL", 1, len(data)) + data)
+        elif command[0] == "sleep":
+            ended.wait(60)
+        self.wfile.flush()
+        self.close_connection = True
+
+    def body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def pull(self, image):
+        """
+        Progress stream of a pull, ending with an error message for the images the fake registry does not have
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        if image in self.server.registry:
+            self.server.images.add(image)
+            messages = [{"status": "Pulling from " + image}, {"status": "Downloaded newer image for " + image}]
+        else:
+            messages = [{"error": "pull access denied for " + image}]
+        self.wfile.write(b"".join(json.dumps(message).encode() + b"\r\n" for message in messages))
+        self.wfile.flush()
+        self.close_connection = True
+
+    def handle_request(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        path = url.path
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        parts = path.strip("/").split("/")
+        body = self.body()
+        with server.lock:
+            server.calls.append((method, path))
+        if path == "/images/create":
+            return self.pull(query["fromImage"] + ":" + query["tag"])
+        if parts[0] == "distribution":
+            image = "/".join(parts[1:-1])
+            if image not in server.registry:
+                return self.reply(404, {"message": "manifest unknown"})
+            return self.reply(200, {"Descriptor": {"digest": server.registry[image]}})
+        if path == "/containers/create":
+            image = body["Image"] if ":" in body["Image"].rsplit("/", 1)[-1] else body["Image"] + ":latest"
+            if image not in server.images:
+                return self.reply(404, {"message": "No such image: " + body["Image"]})
+            container_id = uuid.uuid4().hex
+            server.containers[container_id] = {"command": body["Entrypoint"] + body["Cmd"], "started": threading.Event(),
+                                               "removed": threading.Event(), "idle": body.get("OpenStdin", False)}
+            return self.reply(201, {"Id": container_id})
+        if parts[0] == "exec":
+            execution = server.execs.get(parts[1])
+            if execution is None:
+                return self.reply(404, {"message": "No such exec instance"})
+            if parts[2] == "start":
+                self.stream(execution["command"], execution["container"]["removed"])
+                execution["exit"] = 0
+                return
+            return self.reply(200, {"ExitCode": execution.get("exit")})
+        container = server.containers.get(parts[1])
+        if container is None or container["removed"].is_set():
+            return self.reply(404, {"message": "No such container: " + parts[1]})
+        action = parts[2] if len(parts) > 2 else None
+        if method == "DELETE":
+            container["removed"].set()
+            return self.reply(204)
+        if action == "attach":
+            return self.stream(container["command"], container["removed"], container["started"])
+        if action == "start":
+            container["started"].set()
+            return self.reply(204)
+        if action == "wait":
+            if container["command"][0] == "sleep":
+                container["removed"].wait(60)
+                return self.reply(404, {"message": "No such container: " + parts[1]})
+            return self.reply(200, {"StatusCode": 0})
+        if action == "exec":
+            exec_id = uuid.uuid4().hex
+            server.execs[exec_id] = {"command": body["Cmd"], "container": container}
+            return self.reply(201, {"Id": exec_id})
+        if action == "json":
+            return self.reply(200, {"State": {"Running": container["started"].is_set() and container["idle"]}})
+        return self.reply(404, {"message": "unknown call " + path})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+def check(name, passed, detail=""):
+    print("%-40s %s" % (name, "ok" if passed else "FAILED " + detail))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Engine API backend against a fake docker daemon")
+    parser.add_argument("--timeout", type=float, default=1, help="run timeout of the commands that hang")
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="eol-fake-docker-")
+    socket_path = os.path.join(directory, "docker.sock")
+    daemon = FakeDaemon(socket_path)
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    client = DockerEngineClient(socket_path, timeout=30)
+    timeouts = {"run": None, "cleanup": 5}
+    backend = DockerApiBackend(client).for_scan(lambda stage: timeouts.get(stage))
+    results = []
+    try:
+        process = backend.run("alpine", "echo", ["hello"])
+        results.append(check("run", process.returncode == 0 and process.stdout == b"hello\n", repr(process)))
+
+        container_id = backend.start_idle("alpine", "cat", [])
+        running = container_id is not None and backend.is_running(container_id)
+        process = backend.exec(container_id, "echo", ["from", "exec"]) if running else None
+        results.append(check("exec", process is not None and process.returncode == 0 and process.stdout == b"from exec\n", repr(process)))
+
+        process = backend.run("registry.lan/team/app:1.0", "echo", ["pulled"])
+        results.append(check("run pulls a missing image", process.returncode == 0 and process.stdout == b"pulled\n"
+                             and ("POST", "/images/create") in daemon.calls, repr(process)))
+
+        process = backend.run("missing", "echo", ["hello"])
+        results.append(check("failed pull", process.returncode == 125 and b"pull access denied" in process.stderr, repr(process)))
+
+        digest = backend.remote_digest("registry.lan/team/app:1.0")
+        results.append(check("registry digest", digest == daemon.registry["registry.lan/team/app:1.0"] and backend.remote_digest("missing") is None,
+                             repr(digest)))
+
+        timeouts["run"] = arguments.timeout
+        started = time.monotonic()
+        process = backend.run("alpine", "sleep", ["infinity"])
+        elapsed = time.monotonic() - started
+        removed = all(container["removed"].is_set() for container in daemon.containers.values() if container["command"][0] == "sleep")
+        results.append(check("run killed at its timeout", isinstance(process, TimedOutProcess) and not process.skipped
+                             and elapsed < arguments.timeout + 5 and removed, repr(process) + " after %.1fs" % elapsed))
+
+        started = time.monotonic()
+        process = backend.exec(container_id, "sleep", ["infinity"])
+        elapsed = time.monotonic() - started
+        results.append(check("exec killed at its timeout", isinstance(process, TimedOutProcess) and elapsed < arguments.timeout + 5,
+                             repr(process) + " after %.1fs" % elapsed))
+
+        timeouts["run"] = 0
+        calls = len(daemon.calls)
+        process = backend.run("alpine", "echo", ["hello"])
+        results.append(check("run skipped after the deadline", isinstance(process, TimedOutProcess) and process.skipped
+                             and len(daemon.calls) == calls, repr(process)))
+
+        backend.remove_container(container_id)
+        results.append(check("remove", daemon.containers[container_id]["removed"].is_set()))
+    finally:
+        client.close()
+        daemon.shutdown()
+        daemon.server_close()
+        os.remove(socket_path)
+        os.rmdir(directory)
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
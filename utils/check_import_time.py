@@ -0,0 +1,66 @@
+"""
+Import time budget of the scanner entry points.
+
+Every module is imported in a fresh interpreter with -X importtime, the best of a few runs is compared to the
+budget, and the heavy optional dependencies must not be loaded by the core scan path.
+
+    python3 utils/check_import_time.py
+    python3 utils/check_import_time.py --budget-ms 80 --runs 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules on the path of a plain scan and its report
+core_modules = ["main", "scanImage", "addEolStatus", "batchScan", "reportSinks"]
+
+# Only imported when a feature needs them
+lazy_modules = ["pandas", "pyarrow", "dateutil", "requests", "urllib3", "redis"]
+
+
+def import_time(module):
+    """
+    (cumulative import time in microseconds, heavy modules loaded) of one module in a fresh interpreter
+    """
+    code = "import sys, " + module + "; print(','.join(m for m in " + repr(lazy_modules) + " if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=repo_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception("import of " + module + " failed: " + result.stderr.strip().splitlines()[-1])
+    total = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            total = int(fields[1].strip())
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return total, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when the scanner modules import too slowly or load heavy dependencies eagerly")
+    parser.add_argument("--budget-ms", type=float, default=150, help="import time allowed for each module")
+    parser.add_argument("--runs", type=int, default=3, help="the fastest of this many runs is compared to the budget")
+    parser.add_argument("modules", nargs="*", default=core_modules)
+    arguments = parser.parse_args()
+
+    failed = False
+    for module in arguments.modules:
+        runs = [import_time(module) for _ in range(arguments.runs)]
+        best = min(total for total, _ in runs) / 1000
+        loaded = runs[0][1]
+        status = "ok"
+        if best > arguments.budget_ms:
+            status = "over budget"
+            failed = True
+        if loaded:
+            status = "loads " + ", ".join(loaded)
+            failed = True
+        print("%-14s %8.1f ms  %s" % (module, best, status))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
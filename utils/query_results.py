@@ -0,0 +1,105 @@
+"""
+Questions over the results store written with main.py --results-db, answered from its indexes without rescanning.
+
+    python3 utils/query_results.py --db results.sqlite runtime python --version 3.7
+    python3 utils/query_results.py --db results.sqlite eol --language node
+    python3 utils/query_results.py --db results.sqlite trend --period week --since 2024-06-01
+    python3 utils/query_results.py --db results.sqlite history nginx:1.25
+    python3 utils/query_results.py --db results.sqlite sql "SELECT os, COUNT(*) FROM scans GROUP BY os" --format csv
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resultsStore import ResultsStore, trend_periods
+
+
+def print_table(columns, rows):
+    cells = [[("" if value is None else str(value)).replace("\n", " ") for value in row] for row in rows]
+    widths = [max([len(column)] + [len(row[index]) for row in cells]) for index, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def print_rows(columns, rows, output_format):
+    if output_format == "json":
+        print(json.dumps([dict(zip(columns, row)) for row in rows], indent=2))
+    elif output_format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        print_table(columns, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the scan results store")
+    parser.add_argument("--db", required=True, help="results store written by main.py --results-db")
+    parser.add_argument("--format", choices=["table", "csv", "json"], default="table")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runtime = commands.add_parser("runtime", help="images whose latest scan ships a language, optionally a version or release cycle")
+    runtime.add_argument("language")
+    runtime.add_argument("--version", help="exact version or release cycle, 3.7 matches 3.7.3 and 3.7.3-2")
+    eol = commands.add_parser("eol", help="images whose latest scan needs an upgrade, or the counts per language with --summary")
+    eol.add_argument("--language")
+    eol.add_argument("--summary", action="store_true")
+    trend = commands.add_parser("trend", help="images needing an upgrade per period and language")
+    trend.add_argument("--period", choices=sorted(trend_periods), default="month")
+    trend.add_argument("--since", metavar="YYYY-MM-DD")
+    history = commands.add_parser("history", help="every scan of an image")
+    history.add_argument("image")
+    commands.add_parser("stats", help="rows per table")
+    sql = commands.add_parser("sql", help="any read-only SQL query")
+    sql.add_argument("query")
+    arguments = parser.parse_args()
+
+    if not os.path.exists(arguments.db):
+        parser.error("no results store at " + arguments.db)
+    since = None
+    if arguments.command == "trend" and arguments.since:
+        try:
+            since = datetime.strptime(arguments.since, "%Y-%m-%d").timestamp()
+        except ValueError:
+            parser.error("--since must be a date like 2024-06-01")
+    try:
+        store = ResultsStore(arguments.db, read_only=True)
+    except sqlite3.Error as e:
+        parser.error("cannot open the results store " + arguments.db + ": " + str(e))
+    started = time.perf_counter()
+    try:
+        if arguments.command == "runtime":
+            columns, rows = store.runtime_images(arguments.language, arguments.version)
+        elif arguments.command == "eol" and arguments.summary:
+            columns, rows = store.eol_summary()
+        elif arguments.command == "eol":
+            columns, rows = store.eol_images(arguments.language)
+        elif arguments.command == "trend":
+            columns, rows = store.eol_trend(arguments.period, since)
+        elif arguments.command == "history":
+            columns, rows = store.image_history(arguments.image)
+        elif arguments.command == "stats":
+            stats = store.stats()
+            columns, rows = ["table", "rows"], list(stats.items())
+        else:
+            columns, rows = store.select(arguments.query)
+    except sqlite3.Error as e:
+        # a malformed or writing query, or a file that is not a results store
+        parser.error(str(e))
+    finally:
+        store.close()
+    elapsed = time.perf_counter() - started
+
+    print_rows(columns, rows, arguments.format)
+    sys.stderr.write(str(len(rows)) + " rows in %.1f ms\n" % (elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# major/minor/patch are ints (None when the version has fewer parts), cycle is the endoflife.date cycle key
+NormalizedVersion = namedtuple("NormalizedVersion", ["major", "minor", "patch", "cycle", "text"])
+
+two_part_pattern = re.compile("[0-9]*[0-9]+[.]+[0-9]*[0-9]")
+three_part_pattern = re.compile("[0-9]*[0-9]+[.]+[0-9]*[0-9]+[.]+[0-9]*[0-9]")
+separator_pattern = re.compile("[.]+")
+cache_size = 4096
+
+
+def cycle_major(parts):
+    return parts[0]
+
+
+def cycle_major_minor(parts):
+    return parts[0] + "." + parts[1]
+
+
+def cycle_java(parts):
+    # Java 8 and older are versioned 1.x
+    return parts[1] if parts[0] == "1" else parts[0]
+
+
+# language: (pattern of the version inside the raw output, cycle of the matched parts)
+language_versions = {
+    "go": (re.compile("[0-9]+[.]+[0-9]*[0-9]"), cycle_major_minor),
+    "python": (re.compile("[2-3]+[.]+[0-9]*[0-9]"), cycle_major_minor),
+    "node": (two_part_pattern, cycle_major),
+    "php": (two_part_pattern, cycle_major_minor),
+    "angular": (three_part_pattern, cycle_major),
+    "react": (three_part_pattern, cycle_major),
+    "ruby": (three_part_pattern, cycle_major_minor),
+    "java": (three_part_pattern, cycle_java),
+}
+
+
+def to_int(parts, index):
+    return int(parts[index]) if len(parts) > index and parts[index].isdigit() else None
+
+
+@lru_cache(maxsize=cache_size)
+def normalize_version(language, raw):
+    """
+    Structured version of a raw version string (e.g. "go version go1.19.2 linux/amd64"), None when nothing matches
+    """
+    pattern, cycle = language_versions[language]
+    matched = pattern.search(raw)
+    if matched is None:
+        return None
+    text = matched.group()
+    parts = separator_pattern.split(text)
+    return NormalizedVersion(to_int(parts, 0), to_int(parts, 1), to_int(parts, 2), cycle(parts), text)
+
+
+@lru_cache(maxsize=cache_size)
+def find_full_version(raw):
+    """
+    First major.minor.patch version found in a raw output, None when there is none
+    """
+    matched = three_part_pattern.search(raw)
+    return matched.group() if matched else None
+
+
+# Index of the version token in the output of "<binary> --version", used when the output has enough tokens
+binary_version_tokens = {
+    "python": (1, 2), "python2": (1, 2), "python2.7": (1, 2), "python3": (1, 2),
+    "go": (2, 3),
+    "php": (1, 2), "php7": (1, 2), "php8": (1, 2),
+    "nodejs": (0, 1), "node": (0, 1),
+    "ruby": (1, 1),
+    "java": (2, 2),
+    "angular": (2, 2),
+}
+
+
+@lru_cache(maxsize=cache_size)
+def binary_version(language, raw):
+    """
+    Version token of a language binary output, e.g. "3.8.10" from "Python 3.8.10"
+    """
+    tokens = raw.split()
+    if language == "react":
+        return tokens[0]
+    index, minimum = binary_version_tokens[language]
+    return tokens[index] if len(tokens) > minimum else "".join(tokens)
+
+
+def cache_info():
+    return {"normalize_version": normalize_version.cache_info(), "find_full_version": find_full_version.cache_info(),
+            "binary_version": binary_version.cache_info()}
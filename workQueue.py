@@ -0,0 +1,287 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+# Status of a job: queued -> leased -> done, or back to queued until max_attempts leases failed
+job_statuses = ["queued", "leased", "done", "failed"]
+
+
+class SqliteWorkQueue:
+    """
+    Durable queue of image scans in a SQLite file shared by the coordinator and the worker processes of one host
+    (or of hosts sharing a filesystem with working locks). A job is leased for lease_seconds and kept by heartbeats,
+    an expired lease goes back to the queue until the job used up max_attempts leases.
+    """
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        # autocommit, the transactions that must not interleave between processes take the write lock up front
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS jobs (image TEXT PRIMARY KEY, position INTEGER, status TEXT, attempts INTEGER, "
+                                    "worker TEXT, lease_expires REAL, error TEXT, enqueued REAL, finished REAL, record TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, position)")
+
+    def transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def enqueue(self, images):
+        """
+        Queue the images that are not queued yet, failed images get a fresh set of attempts; returns the number queued
+        """
+        now = time.time()
+        with self.lock:
+            connection = self.transaction()
+            try:
+                position = connection.execute("SELECT COALESCE(MAX(position), 0) FROM jobs").fetchone()[0]
+                queued = 0
+                for image in images:
+                    position += 1
+                    queued += connection.execute("INSERT INTO jobs (image, position, status, attempts, enqueued) VALUES (?, ?, 'queued', 0, ?) "
+                                                 "ON CONFLICT(image) DO UPDATE SET status = 'queued', attempts = 0, error = NULL "
+                                                 "WHERE status = 'failed'", (image, position, now)).rowcount
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return queued
+
+    def lease(self, worker):
+        """
+        Lease the oldest queued job, or one whose lease expired, to the worker; returns its image or None
+        """
+        now = time.time()
+        with self.lock:
+            connection = self.transaction()
+            try:
+                connection.execute("UPDATE jobs SET status = 'failed', error = 'lease expired after ' || attempts || ' attempts' "
+                                   "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts))
+                row = connection.execute("SELECT image FROM jobs WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?) "
+                                         "ORDER BY position LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE jobs SET status = 'leased', worker = ?, attempts = attempts + 1, lease_expires = ? WHERE image = ?",
+                                       (worker, now + self.lease_seconds, row[0]))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return row[0] if row is not None else None
+
+    def heartbeat(self, image, worker):
+        """
+        Extend the lease of a job, False when the worker no longer holds it
+        """
+        with self.lock:
+            return self.connection.execute("UPDATE jobs SET lease_expires = ? WHERE image = ? AND worker = ? AND status = 'leased'",
+                                           (time.time() + self.lease_seconds, image, worker)).rowcount == 1
+
+    def complete(self, image, worker, record):
+        """
+        Store the image record of a finished job; the first result of a job that was leased twice wins
+        """
+        with self.lock:
+            return self.connection.execute("UPDATE jobs SET status = 'done', worker = ?, record = ?, error = NULL, finished = ? "
+                                           "WHERE image = ? AND status != 'done'",
+                                           (worker, json.dumps(record), time.time(), image)).rowcount == 1
+
+    def fail(self, image, worker, error):
+        """
+        Give a failed job back to the queue, or fail it for good after max_attempts leases
+        """
+        with self.lock:
+            self.connection.execute("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, error = ?, "
+                                    "lease_expires = NULL, finished = ? WHERE image = ? AND worker = ? AND status = 'leased'",
+                                    (self.max_attempts, error, time.time(), image, worker))
+
+    def counts(self):
+        with self.lock:
+            counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in job_statuses}
+
+    def records(self, images):
+        """
+        image -> stored image record of the given images that are done
+        """
+        records = {}
+        images = list(images)
+        with self.lock:
+            for start in range(0, len(images), 500):
+                chunk = images[start:start + 500]
+                rows = self.connection.execute("SELECT image, record FROM jobs WHERE status = 'done' AND image IN (" + ",".join("?" * len(chunk)) + ")",
+                                               chunk).fetchall()
+                records.update((image, json.loads(record)) for image, record in rows)
+        return records
+
+    def failures(self, images):
+        """
+        image -> last error of the given images that failed for good
+        """
+        images = set(images)
+        with self.lock:
+            rows = self.connection.execute("SELECT image, error FROM jobs WHERE status = 'failed'").fetchall()
+        return {image: error for image, error in rows if image in images}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# Lua scripts of the Redis queue, every state change of a job is one atomic script
+# KEYS: queued list, leases sorted set, state hash, attempts hash, worker hash, errors hash
+redis_lease_script = """
+local now = tonumber(ARGV[2])
+for _, image in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], image)
+    if tonumber(redis.call('HGET', KEYS[4], image) or '0') >= tonumber(ARGV[4]) then
+        redis.call('HSET', KEYS[3], image, 'failed')
+        redis.call('HSET', KEYS[6], image, 'lease expired')
+    else
+        redis.call('HSET', KEYS[3], image, 'queued')
+        redis.call('LPUSH', KEYS[1], image)
+    end
+end
+local image = redis.call('LPOP', KEYS[1])
+if not image then
+    return false
+end
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), image)
+redis.call('HSET', KEYS[3], image, 'leased')
+redis.call('HINCRBY', KEYS[4], image, 1)
+redis.call('HSET', KEYS[5], image, ARGV[1])
+return image
+"""
+
+redis_heartbeat_script = """
+if redis.call('HGET', KEYS[3], ARGV[1]) == 'leased' and redis.call('HGET', KEYS[5], ARGV[1]) == ARGV[2] then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+redis_fail_script = """
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= 'leased' or redis.call('HGET', KEYS[5], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[6], ARGV[1], ARGV[3])
+if tonumber(redis.call('HGET', KEYS[4], ARGV[1]) or '0') >= tonumber(ARGV[4]) then
+    redis.call('HSET', KEYS[3], ARGV[1], 'failed')
+else
+    redis.call('HSET', KEYS[3], ARGV[1], 'queued')
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# KEYS: state hash, results hash, leases sorted set
+redis_complete_script = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == 'done' then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], 'done')
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return 1
+"""
+
+# KEYS: queued list, state hash, attempts hash
+redis_enqueue_script = """
+local state = redis.call('HGET', KEYS[2], ARGV[1])
+if state and state ~= 'failed' then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], 'queued')
+redis.call('HSET', KEYS[3], ARGV[1], 0)
+redis.call('RPUSH', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class RedisWorkQueue:
+    """
+    The same queue on a Redis server (or any server speaking its protocol), for workers on several hosts.
+    Lease expiry uses the clocks of the workers, keep them in sync.
+    """
+    def __init__(self, url, lease_seconds=300, max_attempts=3, name="eol-scan"):
+        try:
+            import redis
+        except ImportError:
+            raise Exception("the redis package is required for a redis:// work queue")
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.client = redis.Redis.from_url(url)
+        self.keys = {key: name + ":" + key for key in ["queued", "leases", "state", "attempts", "worker", "errors", "results"]}
+        self.lease_script = self.client.register_script(redis_lease_script)
+        self.heartbeat_script = self.client.register_script(redis_heartbeat_script)
+        self.fail_script = self.client.register_script(redis_fail_script)
+        self.complete_script = self.client.register_script(redis_complete_script)
+        self.enqueue_script = self.client.register_script(redis_enqueue_script)
+
+    def job_keys(self):
+        return [self.keys[key] for key in ["queued", "leases", "state", "attempts", "worker", "errors"]]
+
+    def enqueue(self, images):
+        keys = [self.keys["queued"], self.keys["state"], self.keys["attempts"]]
+        pipeline = self.client.pipeline()
+        for image in images:
+            self.enqueue_script(keys=keys, args=[image], client=pipeline)
+        return sum(pipeline.execute())
+
+    def lease(self, worker):
+        image = self.lease_script(keys=self.job_keys(), args=[worker, time.time(), self.lease_seconds, self.max_attempts])
+        return image.decode() if image is not None else None
+
+    def heartbeat(self, image, worker):
+        return self.heartbeat_script(keys=self.job_keys(), args=[image, worker, time.time() + self.lease_seconds]) == 1
+
+    def complete(self, image, worker, record):
+        keys = [self.keys["state"], self.keys["results"], self.keys["leases"]]
+        return self.complete_script(keys=keys, args=[image, json.dumps(record)]) == 1
+
+    def fail(self, image, worker, error):
+        self.fail_script(keys=self.job_keys(), args=[image, worker, error, self.max_attempts])
+
+    def counts(self):
+        counts = Counter(state.decode() for state in self.client.hvals(self.keys["state"]))
+        return {status: counts.get(status, 0) for status in job_statuses}
+
+    def records(self, images):
+        images = list(images)
+        records = {}
+        for start in range(0, len(images), 500):
+            chunk = images[start:start + 500]
+            for image, record in zip(chunk, self.client.hmget(self.keys["results"], chunk)):
+                if record is not None:
+                    records[image] = json.loads(record)
+        return records
+
+    def failures(self, images):
+        images = list(images)
+        states = self.client.hmget(self.keys["state"], images) if images else []
+        failed = [image for image, state in zip(images, states) if state == b"failed"]
+        errors = self.client.hmget(self.keys["errors"], failed) if failed else []
+        return {image: (error or b"").decode() for image, error in zip(failed, errors)}
+
+    def close(self):
+        self.client.close()
+
+
+def open_work_queue(url, lease_seconds=300, max_attempts=3):
+    """
+    Work queue of a redis:// or rediss:// URL, otherwise of a SQLite file (a path or sqlite:///path)
+    """
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisWorkQueue(url, lease_seconds, max_attempts)
+    if url.startswith("sqlite://"):
+        url = url[len("sqlite://"):]
+    return SqliteWorkQueue(url, lease_seconds, max_attempts)